@@ -3,23 +3,64 @@ import sqlite3
 import hashlib
 from datetime import datetime, timedelta
 from flask import Flask, render_template, request, redirect, url_for, session, flash, make_response, jsonify
-from google.cloud import dialogflow
-from google.oauth2 import service_account
+from flask import Response, stream_with_context, send_file, g
+from markupsafe import Markup, escape
 import uuid
 import os
 import re
+from db import get_db_connection, close_db_connection, get_pool, init_app, connect, POOL_PREFILL
+from cache import get_cache
+import queries
+import migrations
+import dialogflow_client
+import intents
+import exports
+import archive
+import assets
+import metrics
+import events
+import study
+from urgency import Urgency
+import tempfile
+import zipfile
+import secrets
+import time
+from werkzeug.http import is_resource_modified
+from concurrent.futures import TimeoutError as FuturesTimeout
 
 app = Flask(__name__)
 app.secret_key = 'my-student-task-app-secret-123'
 
-def get_db_connection():
-    if os.environ.get('DATABASE_URL'):
-        import psycopg2
-        conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
-    else:
-        conn = sqlite3.connect('student_tasks.db')
-        conn.row_factory = sqlite3.Row
-    return conn
+DASHBOARD_PAGE_SIZE = int(os.environ.get('DASHBOARD_PAGE_SIZE', 50))
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', 20))
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 500))
+# Longest start..end span /api/calendar serves, and the window the ICS feed covers
+CALENDAR_MAX_DAYS = int(os.environ.get('CALENDAR_MAX_DAYS', 366))
+FEED_PAST_DAYS = int(os.environ.get('FEED_PAST_DAYS', 90))
+FEED_FUTURE_DAYS = int(os.environ.get('FEED_FUTURE_DAYS', 365))
+# Internal ordering columns from queries.list_task_page, not part of the API
+TASK_SORT_KEYS = ('urgency_rank', 'priority_rank', 'due_sort')
+# Longest study session /save_study_session accepts, in minutes
+STUDY_MAX_MINUTES = int(os.environ.get('STUDY_MAX_MINUTES', 24 * 60))
+# Most operations one /api/v1/tasks/batch request may carry
+TASK_BATCH_MAX = int(os.environ.get('TASK_BATCH_MAX', 5000))
+# Startup work done by create_app() and warm_up() (see gunicorn.conf.py)
+AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', '1') != '0'
+TEMPLATE_PRECOMPILE = os.environ.get('TEMPLATE_PRECOMPILE', '1') != '0'
+DIALOGFLOW_WARMUP = os.environ.get('DIALOGFLOW_WARMUP', '1') != '0'
+# /metrics, /slow_queries and the /*_stats routes: with STATS_TOKEN set they need
+# "Authorization: Bearer <token>"; without it only requests from this machine get
+# them (so not through a reverse proxy on the same host - set a token there)
+STATS_TOKEN = os.environ.get('STATS_TOKEN', '')
+
+# Connections come from a per-process pool and are returned when the request ends
+init_app(app)
+
+# Latency, SQL, template and Dialogflow timings, exported on /metrics
+metrics.init_app(app)
+
+# Fingerprinted static URLs (asset_url() in templates) and a shared compiled-template cache
+assets.init_app(app)
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -65,13 +106,9 @@ def sanitize_input(text):
 def check_existing_user(username, email):
     """Check if username or email already exists"""
     conn = get_db_connection()
-    cur = conn.cursor()
     
     try:
-        existing_user = cur.execute(
-            'SELECT id, username, email FROM users WHERE username = ? OR email = ?', 
-            (username, email)
-        ).fetchone()
+        existing_user = queries.find_user_by_name_or_email(conn, username, email)
         
         if existing_user:
             if existing_user['username'] == username:
@@ -81,31 +118,72 @@ def check_existing_user(username, email):
         
         return True, ""
     except Exception as e:
+        metrics.record_error(e)
         return False, f"Database error: {str(e)}"
-    finally:
-        cur.close()
-        conn.close()
 
-def get_urgency_class(due_date_str):
-    """Calculate urgency class based on due date"""
-    if not due_date_str:
-        return ''
-    
-    try:
-        due_date = datetime.strptime(due_date_str, '%Y-%m-%d').date()
-        today = datetime.now().date()
-        tomorrow = today + timedelta(days=1)
-        
-        if due_date < today:
-            return 'urgent-overdue'
-        elif due_date == today:
-            return 'urgent-today'
-        elif due_date == tomorrow:
-            return 'urgent-tomorrow'
-        else:
-            return ''
-    except:
-        return ''
+def commit_user_changes(conn, *changes):
+    """Commit a change to the logged-in user's data, drop their cached pages and tell their open ones.
+
+    changes are the live-update events for it (task_change()); without any,
+    open pages resync.
+    """
+    user_id = session['user_id']
+    # Same transaction as the change: conditional responses key off this stamp
+    queries.touch_user_data(conn, user_id)
+    version = queries.user_data_version(conn, user_id)['data_version']
+    conn.commit()
+    # Only after the commit, so a concurrent read can't cache the old data under the new version
+    get_cache().invalidate(user_id)
+    # The tab that made the change says so (X-Live-Client) and skips its own event
+    events.publish(user_id, version, list(changes) or events.RESYNC, source=request.headers.get('X-Live-Client'))
+
+def task_change(op, task_id, **fields):
+    """A live-update event for one task: op is create, update, delete or note"""
+    change = {'op': op, 'id': task_id}
+    if fields:
+        change['fields'] = fields
+    return change
+
+def live_version(conn):
+    """The user's data version, read before the page's data so live.js can spot missed events"""
+    return queries.user_data_version(conn, session['user_id'])['data_version']
+
+def conditional_response(user, variant, build):
+    """Response from build(), or a 304 if the client's copy of user's data is current.
+
+    The ETag covers the user's data version plus variant (whatever else shapes
+    the body), so build() and its queries only run when something changed.
+    """
+    etag = hashlib.sha1(f"{user['id']}:{user['data_version']}:{variant}".encode()).hexdigest()
+    last_modified = datetime.fromisoformat(str(user['data_updated_at'])) if user['data_updated_at'] else None
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = build()
+    else:
+        response = Response(status=304)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # Private, and always revalidated: clients keep the body and send If-None-Match
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@app.template_filter('highlight')
+def highlight(snippet):
+    """Escape a search snippet and turn its match markers into <mark> tags"""
+    text = str(escape(snippet or ''))
+    return Markup(text.replace(queries.MARK_START, '<mark>').replace(queries.MARK_END, '</mark>'))
+
+def request_today():
+    """Today's date, fixed for the whole request"""
+    if 'today' not in g:
+        g.today = datetime.now().date()
+    return g.today
+
+def request_urgency():
+    """Urgency buckets against request_today(), shared by every task list the request renders"""
+    if 'urgency' not in g:
+        g.urgency = Urgency(request_today())
+    return g.urgency
 
 @app.route('/')
 def home():
@@ -163,26 +241,15 @@ def register():
         # Create new user
         try:
             conn = get_db_connection()
-            cur = conn.cursor()
             
-            cur.execute(
-                'INSERT INTO users (username, email, password, created_at) VALUES (?, ?, ?, ?)',
-                (username, email, hash_password(password), datetime.now())
-            )
+            queries.create_user(conn, username, email, hash_password(password), datetime.now())
             conn.commit()
             
-            # Get the new user ID
-            new_user = cur.execute(
-                'SELECT id FROM users WHERE username = ?', (username,)
-            ).fetchone()
-            
-            cur.close()
-            conn.close()
-            
             flash('Account created successfully! Please login.', 'success')
             return redirect(url_for('login'))
             
         except Exception as e:
+            metrics.record_error(e)
             flash(f'Registration failed: {str(e)}', 'error')
             return render_template('register.html', 
                                  username=username, 
@@ -213,15 +280,8 @@ def login():
         
         try:
             conn = get_db_connection()
-            cur = conn.cursor()
-            
-            user = cur.execute(
-                'SELECT * FROM users WHERE username = ? AND password = ?',
-                (username, hash_password(password))
-            ).fetchone()
             
-            cur.close()
-            conn.close()
+            user = queries.find_user_by_login(conn, username, hash_password(password))
             
             if user:
                 session['user_id'] = user['id']
@@ -235,6 +295,7 @@ def login():
                 return render_template('login.html')
         
         except Exception as e:
+            metrics.record_error(e)
             flash(f'Login error: {str(e)}', 'error')
             return render_template('login.html')
     
@@ -248,17 +309,13 @@ def dashboard():
         return redirect('/login')
     
     conn = get_db_connection()
-    cur = conn.cursor()
     
     # --- Subject creation ---
     if request.method == 'POST' and 'new_subject' in request.form:
         new_subject = request.form['new_subject']
         if new_subject:
-            cur.execute(
-                'INSERT INTO subjects (user_id, name) VALUES (?, ?)',
-                (session['user_id'], new_subject)
-            )
-            conn.commit()
+            queries.create_subject(conn, session['user_id'], new_subject)
+            commit_user_changes(conn)
     
     # --- Task creation ---
     if request.method == 'POST' and 'title' in request.form:
@@ -266,87 +323,108 @@ def dashboard():
         description = request.form['description']
         due_date = request.form['due_date']
         priority = request.form['priority']
-        subject_id = request.form.get('subject_id')
+        subject_id = request.form.get('subject_id', type=int)
         notes = request.form.get('notes', '')  # Add initial notes
+        if not owns_subject(conn, subject_id):
+            subject_id = None
         
-        cur.execute(
-            'INSERT INTO tasks (user_id, title, description, due_date, priority, subject_id, notes) VALUES (?, ?, ?, ?, ?, ?, ?)',
-            (session['user_id'], title, description, due_date, priority, subject_id, notes)
-        )
-        task_id = cur.lastrowid
+        task_id = queries.create_task(conn, session['user_id'], title, description,
+                                      due_date, priority, subject_id)
         
         # Add initial note to history if provided
         if notes.strip():
-            cur.execute(
-                'INSERT INTO task_history (task_id, user_id, note_text) VALUES (?, ?, ?)',
-                (task_id, session['user_id'], f"Initial notes: {notes}")
-            )
+            queries.add_task_note(conn, session['user_id'], task_id, f"Initial notes: {notes}")
         
-        conn.commit()
+        commit_user_changes(conn, task_change('create', task_id))
         return redirect('/dashboard')
     
-    # --- Fetch subjects ---
-    subjects = cur.execute(
-        'SELECT * FROM subjects WHERE user_id = ? ORDER BY name',
-        (session['user_id'],)
-    ).fetchall()
-    
     # --- Task filters ---
     subject_filter = request.args.get('subject', 'all')
     search_query = request.args.get('search', '')
+    after = request.args.get('after')
+    today = request_today()
+    data_version = live_version(conn)
     
-    base_query = '''
-        SELECT tasks.*, subjects.name as subject_name, subjects.color as subject_color 
-        FROM tasks 
-        LEFT JOIN subjects ON tasks.subject_id = subjects.id 
-        WHERE tasks.user_id = ?
-    '''
-    query_params = [session['user_id']]
-    
-    if subject_filter != 'all':
-        base_query += ' AND subjects.name = ?'
-        query_params.append(subject_filter)
-    
-    if search_query:
-        base_query += ' AND (tasks.title LIKE ? OR tasks.description LIKE ? OR subjects.name LIKE ? OR tasks.notes LIKE ?)'
-        search_term = f'%{search_query}%'
-        query_params.extend([search_term, search_term, search_term, search_term])
-    
-    base_query += '''
-        ORDER BY 
-            CASE 
-                WHEN due_date < date('now') THEN 1
-                WHEN due_date = date('now') THEN 2
-                WHEN due_date = date('now', '+1 day') THEN 3
-                ELSE 4
-            END,
-            CASE priority 
-                WHEN 'high' THEN 1 
-                WHEN 'medium' THEN 2 
-                WHEN 'low' THEN 3 
-            END, 
-            due_date
-    '''
-    
-    tasks = cur.execute(base_query, query_params).fetchall()
-    
-    # --- Stats ---
-    total_tasks = len(tasks)
-    completed_tasks = sum(1 for task in tasks if task['completed'])
-    pending_tasks = total_tasks - completed_tasks
-    
-    cur.close()
-    conn.close()
+    def load_dashboard():
+        # --- Fetch subjects ---
+        subjects = queries.list_subjects(conn, session['user_id'])
+        
+        # --- One page of tasks (keyset pagination, see queries.list_task_page) ---
+        tasks, next_cursor = queries.list_task_page(conn, session['user_id'], today,
+                                                    subject_filter, search_query,
+                                                    limit=DASHBOARD_PAGE_SIZE, after=after)
+        
+        # --- Rendered here so the cache holds the list's HTML, not its rows ---
+        task_list = render_template('task_list.html',
+                                    tasks=request_urgency().classify(tasks),
+                                    next_cursor=next_cursor,
+                                    subject_filter=subject_filter,
+                                    search_query=search_query)
+        
+        # --- Stats (one aggregate query over the whole filtered list) ---
+        counts = queries.task_counts(conn, session['user_id'], subject_filter, search_query)
+        
+        # --- Ranked full-text matches shown above the list ---
+        search_results = []
+        if search_query and not after:
+            search_results = queries.search_tasks(conn, session['user_id'], search_query, limit=5)
+        
+        return subjects, task_list, counts, search_results
+    
+    # Urgency depends on the date, so it is part of the key. The user's cache
+    # version moves with every commit_user_changes(), so a cached list never
+    # outlives the data it was rendered from.
+    try:
+        subjects, task_list, counts, search_results = get_cache().get_or_compute(
+            session['user_id'], 'dashboard', (subject_filter, search_query, after, today), load_dashboard)
+    except ValueError:
+        # Malformed cursor - start again from the first page
+        return redirect(url_for('dashboard', subject=subject_filter, search=search_query))
     
     return render_template('dashboard_notes.html', 
-                         tasks=tasks,
+                         task_list=Markup(task_list),
+                         search_results=search_results,
                          subjects=subjects,
                          subject_filter=subject_filter,
                          search_query=search_query,
-                         total_tasks=total_tasks,
-                         completed_tasks=completed_tasks,
-                         pending_tasks=pending_tasks,
-                         get_urgency_class=get_urgency_class)
+                         total_tasks=counts['total_tasks'],
+                         completed_tasks=counts['completed_tasks'],
+                         pending_tasks=counts['pending_tasks'],
+                         live_version=data_version)
+
+@app.route('/api/dashboard/tasks')
+def dashboard_tasks_api():
+    """JSON version of the dashboard task list for infinite scroll"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    conn = get_db_connection()
+    subject_filter = request.args.get('subject', 'all')
+    search_query = request.args.get('search', '')
+    after = request.args.get('after')
+    limit = min(request.args.get('limit', type=int, default=DASHBOARD_PAGE_SIZE), 200)
+    details = request.args.get('details') == '1'
+    
+    try:
+        tasks, next_cursor = queries.list_task_page(conn, session['user_id'], request_today(),
+                                                    subject_filter, search_query,
+                                                    limit=max(limit, 1), after=after, details=details)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    data = {'tasks': [{key: value for key, value in task.items() if key not in TASK_SORT_KEYS}
+                      for task in tasks],
+            'next_cursor': next_cursor}
+    
+    # Counters only change with the filters, so only the first page carries them
+    if not after:
+        data.update(queries.task_counts(conn, session['user_id'], subject_filter, search_query))
+    
+    if request.args.get('html') == '1':
+        data['html'] = ''.join(render_template('task_item.html', task=task)
+                               for task in request_urgency().classify(tasks))
+    
+    return jsonify(data)
 
 @app.route('/complete_task', methods=['POST'])
 def complete_task():
@@ -355,12 +433,8 @@ def complete_task():
     
     task_id = request.form['task_id']
     conn = get_db_connection()
-    conn.execute(
-        'UPDATE tasks SET completed = 1 WHERE id = ? AND user_id = ?',
-        (task_id, session['user_id'])
-    )
-    conn.commit()
-    conn.close()
+    queries.set_task_completed(conn, session['user_id'], task_id)
+    commit_user_changes(conn, task_change('update', task_id, completed=True))
     return redirect('/dashboard')
 
 
@@ -373,12 +447,8 @@ def delete_task():
     
     task_id = request.form['task_id']
     conn = get_db_connection()
-    conn.execute(
-        'DELETE FROM tasks WHERE id = ? AND user_id = ?',
-        (task_id, session['user_id'])
-    )
-    conn.commit()
-    conn.close()
+    queries.delete_task(conn, session['user_id'], task_id)
+    commit_user_changes(conn, task_change('delete', task_id))
     return redirect('/dashboard')
 
 @app.route('/delete_subject/<int:subject_id>')
@@ -387,23 +457,13 @@ def delete_subject(subject_id):
         return redirect('/login')
     
     conn = get_db_connection()
-    # Remove subject from tasks first
-    conn.execute(
-        'UPDATE tasks SET subject_id = NULL WHERE subject_id = ? AND user_id = ?',
-        (subject_id, session['user_id'])
-    )
-    # Delete the subject
-    conn.execute(
-        'DELETE FROM subjects WHERE id = ? AND user_id = ?',
-        (subject_id, session['user_id'])
-    )
-    conn.commit()
-    conn.close()
+    queries.delete_subject(conn, session['user_id'], subject_id)
+    commit_user_changes(conn)
     return redirect('/dashboard')
 
 #EXPORT
-@app.route('/export/txt')
-def export_txt():
+@app.route('/export/<any(txt, csv, ndjson):fmt>')
+def export_tasks(fmt):
     if 'user_id' not in session:
         return redirect('/login')
     
@@ -413,55 +473,58 @@ def export_txt():
     subject_filter = request.args.get('subject', 'all')
     search_query = request.args.get('search', '')
     
-    # Build the query (same as dashboard)
-    base_query = '''
-        SELECT tasks.*, subjects.name as subject_name
-        FROM tasks 
-        LEFT JOIN subjects ON tasks.subject_id = subjects.id 
-        WHERE tasks.user_id = ?
-    '''
+    # Same filters as the dashboard, read in batches as the response is sent
+    tasks = queries.iter_tasks(conn, session['user_id'], subject_filter, search_query,
+                               batch_size=EXPORT_BATCH_SIZE)
     
-    query_params = [session['user_id']]
+    chunks, content_type, extension = exports.FORMATS[fmt]
+    now = datetime.now()
+    # stream_with_context keeps the request (and its pooled connection) alive until the last chunk
+    response = Response(stream_with_context(chunks(tasks, session['username'], now)),
+                        content_type=content_type)
+    response.headers['Content-Disposition'] = f'attachment; filename=tasks_{now.strftime("%Y%m%d")}.{extension}'
     
-    if subject_filter != 'all':
-        base_query += ' AND subjects.name = ?'
-        query_params.append(subject_filter)
+    return response
+
+@app.route('/export/archive')
+def export_archive():
+    if 'user_id' not in session:
+        return redirect('/login')
     
-    if search_query:
-        base_query += ' AND (tasks.title LIKE ? OR tasks.description LIKE ? OR subjects.name LIKE ?)'
-        search_term = f'%{search_query}%'
-        query_params.extend([search_term, search_term, search_term])
+    conn = get_db_connection()
+    user = queries.find_user_by_username(conn, session['username'])
     
-    base_query += ' ORDER BY due_date, priority'
+    # Zip files need seeking to write their directory; spill to disk past 8 MiB
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 2 ** 20)
+    archive.write_archive(conn, user, spool)
+    spool.seek(0)
     
-    tasks = conn.execute(base_query, query_params).fetchall()
-    conn.close()
+    filename = f'backup_{session["username"]}_{datetime.now().strftime("%Y%m%d")}.zip'
+    return send_file(spool, mimetype='application/zip', as_attachment=True, download_name=filename)
+
+@app.route('/import_archive', methods=['POST'])
+def import_archive():
+    if 'user_id' not in session:
+        return redirect('/login')
     
-    # Generate text content
-    content = f"Student Task Manager - Task List\n"
-    content += f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M')}\n"
-    content += f"User: {session['username']}\n"
-    content += "=" * 50 + "\n\n"
+    upload = request.files.get('archive')
+    if not upload or not upload.filename:
+        flash('Choose a backup file to import.', 'error')
+        return redirect('/dashboard')
     
-    for task in tasks:
-        status = "✅ COMPLETED" if task['completed'] else "⏳ PENDING"
-        priority = task['priority'].upper()
-        subject = task['subject_name'] or "No Subject"
-        
-        content += f"TITLE: {task['title']}\n"
-        content += f"SUBJECT: {subject}\n"
-        content += f"PRIORITY: {priority} | DUE: {task['due_date']} | STATUS: {status}\n"
-        if task['description']:
-            content += f"DESCRIPTION: {task['description']}\n"
-        content += "-" * 30 + "\n"
-    
-    # Create response with text file
-    from io import StringIO
-    response = make_response(content)
-    response.headers['Content-Type'] = 'text/plain; charset=utf-8'
-    response.headers['Content-Disposition'] = f'attachment; filename=tasks_{datetime.now().strftime("%Y%m%d")}.txt'
+    conn = get_db_connection()
+    try:
+        backup, _ = archive.open_archive(upload.stream)
+        counts = archive.import_archive(conn, session['user_id'], backup)
+        commit_user_changes(conn)
+    except (archive.ArchiveError, zipfile.BadZipFile, ValueError, KeyError) as e:
+        conn.rollback()
+        flash(f'Could not import backup: {e}', 'error')
+        return redirect('/dashboard')
     
-    return response
+    flash(f"Imported {counts['tasks']} tasks, {counts['subjects']} subjects, "
+          f"{counts['task_history']} notes and {counts['study_sessions']} study sessions.", 'success')
+    return redirect('/dashboard')
 
 @app.route('/export/print')
 def export_print():
@@ -474,29 +537,8 @@ def export_print():
     subject_filter = request.args.get('subject', 'all')
     search_query = request.args.get('search', '')
     
-    # Build the query (same as dashboard)
-    base_query = '''
-        SELECT tasks.*, subjects.name as subject_name
-        FROM tasks 
-        LEFT JOIN subjects ON tasks.subject_id = subjects.id 
-        WHERE tasks.user_id = ?
-    '''
-    
-    query_params = [session['user_id']]
-    
-    if subject_filter != 'all':
-        base_query += ' AND subjects.name = ?'
-        query_params.append(subject_filter)
-    
-    if search_query:
-        base_query += ' AND (tasks.title LIKE ? OR tasks.description LIKE ? OR subjects.name LIKE ?)'
-        search_term = f'%{search_query}%'
-        query_params.extend([search_term, search_term, search_term])
-    
-    base_query += ' ORDER BY due_date, priority'
-    
-    tasks = conn.execute(base_query, query_params).fetchall()
-    conn.close()
+    # Same filters as the dashboard
+    tasks = queries.list_tasks(conn, session['user_id'], subject_filter, search_query)
     
     return render_template('print_view.html', 
                          tasks=tasks,
@@ -511,20 +553,12 @@ def print_view():
         return redirect('/login')
     
     conn = get_db_connection()
-    tasks = conn.execute('''
-        SELECT tasks.*, subjects.name as subject_name 
-        FROM tasks 
-        LEFT JOIN subjects ON tasks.subject_id = subjects.id 
-        WHERE tasks.user_id = ? AND tasks.completed = 0
-        ORDER BY due_date, priority
-    ''', (session['user_id'],)).fetchall()
-    conn.close()
+    tasks = queries.list_pending_tasks(conn, session['user_id'])
     
     return render_template('print_simple.html', 
-                         tasks=tasks, 
+                         tasks=request_urgency().classify(tasks), 
                          username=session['username'],
-                         now=datetime.now(),
-                         get_urgency_class=get_urgency_class)  # Add this line!
+                         now=datetime.now())
 
 #ADD NOTES
 
@@ -537,20 +571,10 @@ def add_note(task_id):
     if note_text.strip():
         conn = get_db_connection()
         
-        # Add to task history
-        conn.execute(
-            'INSERT INTO task_history (task_id, user_id, note_text) VALUES (?, ?, ?)',
-            (task_id, session['user_id'], note_text.strip())
-        )
+        # Add to task history and update the task's latest-note summary
+        note_id = queries.add_task_note(conn, session['user_id'], task_id, note_text.strip())
         
-        # Update main task notes (keep a summary)
-        conn.execute(
-            'UPDATE tasks SET notes = COALESCE(notes || "\n", "") || ? WHERE id = ? AND user_id = ?',
-            (f"[{datetime.now().strftime('%Y-%m-%d %H:%M')}] {note_text}", task_id, session['user_id'])
-        )
-        
-        conn.commit()
-        conn.close()
+        commit_user_changes(conn, task_change('note', task_id, note_id=note_id))
     
     return redirect('/dashboard')
 
@@ -560,31 +584,301 @@ def task_details(task_id):
         return redirect('/login')
     
     conn = get_db_connection()
+    data_version = live_version(conn)
     
     # Get task details
-    task = conn.execute('''
-        SELECT tasks.*, subjects.name as subject_name, subjects.color as subject_color 
-        FROM tasks 
-        LEFT JOIN subjects ON tasks.subject_id = subjects.id 
-        WHERE tasks.id = ? AND tasks.user_id = ?
-    ''', (task_id, session['user_id'])).fetchone()
-    
-    # Get task history
-    history = conn.execute('''
-        SELECT * FROM task_history 
-        WHERE task_id = ? AND user_id = ?
-        ORDER BY created_at DESC
-    ''', (task_id, session['user_id'])).fetchall()
-    
-    conn.close()
+    task = queries.get_task(conn, session['user_id'], task_id)
     
     if not task:
         return "Task not found"
     
+    # Newest notes first; older pages load on demand (see task_history_api)
+    before = request.args.get('before', type=int)
+    history, next_before = queries.list_task_history(conn, session['user_id'], task_id,
+                                                     limit=HISTORY_PAGE_SIZE, before=before)
+    
+    request_urgency().classify([task])
+    
     return render_template('task_details.html', 
                          task=task, 
                          history=history,
-                         get_urgency_class=get_urgency_class)  # Add this line!
+                         next_before=next_before,
+                         live_version=data_version)
+
+@app.route('/api/tasks/<int:task_id>/history')
+def task_history_api(task_id):
+    """Older progress notes for the task details page"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    conn = get_db_connection()
+    before = request.args.get('before', type=int)
+    limit = min(request.args.get('limit', type=int, default=HISTORY_PAGE_SIZE), 200)
+    history, next_before = queries.list_task_history(conn, session['user_id'], task_id,
+                                                     limit=max(limit, 1), before=before)
+    
+    data = {'history': history, 'next_before': next_before}
+    if request.args.get('html') == '1':
+        data['html'] = ''.join(render_template('note_item.html', note=note) for note in history)
+    return jsonify(data)
+
+# -------------------- TASK API --------------------
+# JSON counterpart of the dashboard's form routes. Each call is one small write
+# plus a read of the changed row and the counters, so the page can patch itself
+# instead of following a redirect to a fully re-rendered dashboard. ?html=1 adds
+# the row rendered as on the dashboard.
+
+TASK_PRIORITIES = ('high', 'medium', 'low')
+TRUE_STRINGS = ('1', 'true', 'on', 'yes')
+
+def parse_task_fields(data, creating=False):
+    """Validated queries.TASK_FIELDS from a JSON or form body; returns (fields, error)"""
+    fields = {}
+    if creating and data.get('due_days') not in (None, '') and not data.get('due_date'):
+        try:
+            fields['due_date'], fields['priority'] = quick_task_defaults(int(data['due_days']))
+        except (TypeError, ValueError):
+            return None, 'due_days must be a whole number'
+    if 'title' in data or creating:
+        fields['title'] = str(data.get('title') or '').strip()
+        if not fields['title']:
+            return None, 'title is required'
+    if 'description' in data:
+        fields['description'] = str(data['description'] or '').strip()
+    if data.get('due_date'):
+        try:
+            fields['due_date'] = datetime.strptime(str(data['due_date']), '%Y-%m-%d').date().isoformat()
+        except ValueError:
+            return None, 'due_date must be YYYY-MM-DD'
+    elif 'due_date' in data:
+        fields['due_date'] = None
+    if data.get('priority'):
+        if data['priority'] not in TASK_PRIORITIES:
+            return None, f"priority must be one of {', '.join(TASK_PRIORITIES)}"
+        fields['priority'] = data['priority']
+    elif creating:
+        fields.setdefault('priority', 'medium')
+    if 'subject_id' in data:
+        try:
+            fields['subject_id'] = int(data['subject_id']) if data['subject_id'] not in (None, '') else None
+        except (TypeError, ValueError):
+            return None, 'subject_id must be a number'
+    if 'completed' in data:
+        completed = data['completed']
+        fields['completed'] = completed if isinstance(completed, bool) else str(completed).lower() in TRUE_STRINGS
+    return fields, None
+
+def owns_subject(conn, subject_id):
+    """Whether subject_id (None means no subject) is one of the user's subjects"""
+    return subject_id is None or any(subject['id'] == subject_id
+                                     for subject in queries.list_subjects(conn, session['user_id']))
+
+def request_data():
+    """The request's JSON body, or its form fields (an empty dict for a JSON array or scalar)"""
+    data = request.get_json(silent=True)
+    if data is None:
+        return request.form.to_dict()
+    return data if isinstance(data, dict) else {}
+
+def request_task_counts(conn):
+    """The user's task counters, filtered like the page that asked (?subject=, ?search=)"""
+    return queries.task_counts(conn, session['user_id'],
+                               request.args.get('subject', 'all'), request.args.get('search', ''))
+
+def task_api_response(conn, task_id, status=200, **extra):
+    """The task's current row and the (filtered) counters, after a change"""
+    task = queries.get_task(conn, session['user_id'], task_id)
+    if task is None:
+        return jsonify({'error': 'Task not found'}), 404
+    request_urgency().classify([task])
+    data = {'task': task, 'counts': request_task_counts(conn)}
+    data.update(extra)
+    if request.args.get('html') == '1':
+        data['html'] = render_template('task_item.html', task=task)
+    return jsonify(data), status
+
+@app.route('/api/v1/tasks', methods=['POST'])
+def api_create_task():
+    """Create a task (title, description, due_date or due_days, priority, subject_id, notes)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    data = request_data()
+    fields, error = parse_task_fields(data, creating=True)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    conn = get_db_connection()
+    if not owns_subject(conn, fields.get('subject_id')):
+        return jsonify({'error': 'Subject not found'}), 400
+    task_id = queries.create_task(conn, session['user_id'], fields['title'], fields.get('description', ''),
+                                  fields.get('due_date'), fields['priority'], fields.get('subject_id'))
+    notes = str(data.get('notes') or '').strip()
+    if notes:
+        queries.add_task_note(conn, session['user_id'], task_id, f"Initial notes: {notes}")
+    commit_user_changes(conn, task_change('create', task_id))
+    
+    return task_api_response(conn, task_id, status=201)
+
+@app.route('/api/v1/tasks/<int:task_id>', methods=['GET'])
+def api_get_task(task_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    return task_api_response(get_db_connection(), task_id)
+
+@app.route('/api/v1/tasks/<int:task_id>', methods=['PATCH'])
+def api_update_task(task_id):
+    """Change any of the task's fields; only the ones sent are written"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    fields, error = parse_task_fields(request_data())
+    if error:
+        return jsonify({'error': error}), 400
+    
+    conn = get_db_connection()
+    if not owns_subject(conn, fields.get('subject_id')):
+        return jsonify({'error': 'Subject not found'}), 400
+    if fields and not queries.update_task(conn, session['user_id'], task_id, fields):
+        return jsonify({'error': 'Task not found'}), 404
+    if fields:
+        commit_user_changes(conn, task_change('update', task_id, **fields))
+    
+    return task_api_response(conn, task_id)
+
+@app.route('/api/v1/tasks/<int:task_id>/complete', methods=['POST'])
+def api_complete_task(task_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    conn = get_db_connection()
+    if not queries.set_task_completed(conn, session['user_id'], task_id):
+        return jsonify({'error': 'Task not found'}), 404
+    commit_user_changes(conn, task_change('update', task_id, completed=True))
+    
+    return task_api_response(conn, task_id)
+
+@app.route('/api/v1/tasks/<int:task_id>', methods=['DELETE'])
+def api_delete_task(task_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    conn = get_db_connection()
+    if not queries.delete_task(conn, session['user_id'], task_id):
+        return jsonify({'error': 'Task not found'}), 404
+    commit_user_changes(conn, task_change('delete', task_id))
+    
+    return jsonify({'id': task_id, 'counts': request_task_counts(conn)})
+
+@app.route('/api/v1/tasks/<int:task_id>/notes', methods=['POST'])
+def api_add_note(task_id):
+    """Add a progress note; returns the note and the task with its updated summary"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    note_text = str(request_data().get('note_text') or '').strip()
+    if not note_text:
+        return jsonify({'error': 'note_text is required'}), 400
+    
+    conn = get_db_connection()
+    note_id = queries.add_task_note(conn, session['user_id'], task_id, note_text)
+    if note_id is None:
+        return jsonify({'error': 'Task not found'}), 404
+    commit_user_changes(conn, task_change('note', task_id, note_id=note_id))
+    
+    note = queries.get_task_note(conn, session['user_id'], note_id)
+    extra = {'note': note}
+    if request.args.get('html') == '1':
+        extra['note_html'] = render_template('note_item.html', note=note)
+    return task_api_response(conn, task_id, **extra)
+
+BATCH_OPERATIONS = ('complete', 'reschedule', 'reassign', 'delete')
+
+def batch_items(data):
+    """The operations in a batch body: a list of {op, id, ...}, or one op for many ids"""
+    if not isinstance(data, dict):
+        return None
+    if isinstance(data.get('operations'), list):
+        return data['operations']
+    if isinstance(data.get('ids'), list):
+        shared = {key: value for key, value in data.items() if key != 'ids'}
+        return [dict(shared, id=task_id) for task_id in data['ids']]
+    return None
+
+def batch_task_id(item):
+    try:
+        return int(item.get('id'))
+    except (TypeError, ValueError):
+        return None
+
+@app.route('/api/v1/tasks/batch', methods=['POST'])
+def api_batch_tasks():
+    """Complete, reschedule (due_date), reassign (subject_id) or delete many tasks in one transaction.
+
+    Every item gets a result; invalid ones are skipped and the rest applied.
+    Deletes run after the other changes.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    items = batch_items(request.get_json(silent=True) or {})
+    if items is None:
+        return jsonify({'error': 'Send "operations": [{"op", "id", ...}] or "op" with "ids"'}), 400
+    if len(items) > TASK_BATCH_MAX:
+        return jsonify({'error': f'At most {TASK_BATCH_MAX} operations per batch'}), 400
+    
+    items = [item if isinstance(item, dict) else {} for item in items]
+    task_ids = [batch_task_id(item) for item in items]
+    conn = get_db_connection()
+    user_id = session['user_id']
+    owned = queries.owned_task_ids(conn, user_id, [task_id for task_id in task_ids if task_id is not None])
+    subject_ids = None
+    
+    batch = {op: [] for op in BATCH_OPERATIONS}
+    results = []
+    for item, task_id in zip(items, task_ids):
+        op = item.get('op')
+        result = {'id': item.get('id'), 'op': op}
+        error = None
+        if op not in BATCH_OPERATIONS:
+            error = f"op must be one of {', '.join(BATCH_OPERATIONS)}"
+        elif task_id is None:
+            error = 'id must be a number'
+        elif task_id not in owned:
+            error = 'Task not found'
+        elif op == 'reschedule':
+            fields, error = parse_task_fields({'due_date': item.get('due_date')})
+            if not error and not fields['due_date']:
+                error = 'due_date is required'
+            if not error:
+                batch[op].append((task_id, fields['due_date']))
+        elif op == 'reassign':
+            fields, error = parse_task_fields({'subject_id': item.get('subject_id')})
+            if not error and fields['subject_id'] is not None:
+                if subject_ids is None:
+                    subject_ids = {subject['id'] for subject in queries.list_subjects(conn, user_id)}
+                if fields['subject_id'] not in subject_ids:
+                    error = 'Subject not found'
+            if not error:
+                batch[op].append((task_id, fields['subject_id']))
+        else:
+            batch[op].append(task_id)
+        result['ok'] = error is None
+        if error:
+            result['error'] = error
+        results.append(result)
+    
+    applied = sum(len(rows) for rows in batch.values())
+    if applied:
+        queries.apply_task_batch(conn, user_id, completes=batch['complete'], reschedules=batch['reschedule'],
+                                 reassigns=batch['reassign'], deletes=batch['delete'])
+        commit_user_changes(conn, *(
+            [task_change('update', task_id, completed=True) for task_id in batch['complete']] +
+            [task_change('update', task_id, due_date=due_date) for task_id, due_date in batch['reschedule']] +
+            [task_change('update', task_id, subject_id=subject_id) for task_id, subject_id in batch['reassign']] +
+            [task_change('delete', task_id) for task_id in batch['delete']]))
+    
+    return jsonify({'results': results, 'applied': applied, 'counts': request_task_counts(conn)})
 
 #TIMER
 @app.route('/study_timer')
@@ -593,57 +887,43 @@ def study_timer():
         return redirect('/login')
     
     conn = get_db_connection()
-    subjects = conn.execute(
-        'SELECT * FROM subjects WHERE user_id = ? ORDER BY name',
-        (session['user_id'],)
-    ).fetchall()
-    
-    # Get recent study sessions for stats
-    recent_sessions = conn.execute('''
-        SELECT study_sessions.*, subjects.name as subject_name
-        FROM study_sessions 
-        LEFT JOIN subjects ON study_sessions.subject_id = subjects.id 
-        WHERE study_sessions.user_id = ?
-        ORDER BY study_sessions.created_at DESC
-        LIMIT 10
-    ''', (session['user_id'],)).fetchall()
-    
-    # Calculate weekly stats
-    weekly_stats = conn.execute('''
-        SELECT 
-            SUM(duration_minutes) as total_minutes,
-            COUNT(*) as session_count,
-            strftime('%Y-%m-%d', created_at) as study_date
-        FROM study_sessions 
-        WHERE user_id = ? AND created_at >= date('now', '-7 days')
-        GROUP BY study_date
-        ORDER BY study_date DESC
-    ''', (session['user_id'],)).fetchall()
-    
-    conn.close()
+    since = study.today() - timedelta(days=7)
+    
+    def load_study_timer():
+        subjects = queries.list_subjects(conn, session['user_id'])
+        
+        # Get recent study sessions for stats
+        recent_sessions = queries.recent_study_sessions(conn, session['user_id'], limit=10)
+        
+        # Calculate weekly stats
+        weekly_stats = queries.daily_study_totals(conn, session['user_id'], since=since)
+        return subjects, recent_sessions, weekly_stats
+    
+    subjects, recent_sessions, weekly_stats = get_cache().get_or_compute(
+        session['user_id'], 'study_timer', (since,), load_study_timer)
     
     return render_template('study_timer.html',
                          subjects=subjects,
                          recent_sessions=recent_sessions,
-                         weekly_stats=weekly_stats)
+                         weekly_stats=weekly_stats,
+                         streak=study.streak(conn, session['user_id']))
 
 @app.route('/save_study_session', methods=['POST'])
 def save_study_session():
     if 'user_id' not in session:
         return redirect('/login')
     
-    duration = request.form['duration']
+    duration = request.form.get('duration', type=int)
     subject_id = request.form.get('subject_id')
     notes = request.form.get('notes', '')
     session_type = request.form.get('session_type', 'focus')
+    if duration is None or not 0 < duration <= STUDY_MAX_MINUTES:
+        flash(f'Session length must be a whole number of minutes between 1 and {STUDY_MAX_MINUTES}.', 'error')
+        return redirect('/study_timer')
     
     conn = get_db_connection()
-    conn.execute(
-        'INSERT INTO study_sessions (user_id, subject_id, duration_minutes, notes, session_type) VALUES (?, ?, ?, ?, ?)',
-        (session['user_id'], subject_id if subject_id else None, duration, notes, session_type)
-    )
-    conn.commit()
-    conn.close()
+    study.record_session(conn, session['user_id'], subject_id, duration, notes, session_type)
+    commit_user_changes(conn, {'op': 'study'})
     
     return redirect('/study_timer')
 
@@ -654,56 +934,22 @@ def study_stats():
     
     conn = get_db_connection()
     
-    # Overall stats
-    total_stats = conn.execute('''
-        SELECT 
-            SUM(duration_minutes) as total_minutes,
-            COUNT(*) as total_sessions,
-            AVG(duration_minutes) as avg_duration
-        FROM study_sessions 
-        WHERE user_id = ?
-    ''', (session['user_id'],)).fetchone()
-    
-    # Subject breakdown
-    subject_stats = conn.execute('''
-        SELECT 
-            subjects.name,
-            SUM(study_sessions.duration_minutes) as total_minutes,
-            COUNT(*) as session_count
-        FROM study_sessions 
-        LEFT JOIN subjects ON study_sessions.subject_id = subjects.id 
-        WHERE study_sessions.user_id = ?
-        GROUP BY subjects.name
-        ORDER BY total_minutes DESC
-    ''', (session['user_id'],)).fetchall()
-    
-    # Daily streak (consecutive days with study sessions)
-    streak_data = conn.execute('''
-        WITH dates AS (
-            SELECT DISTINCT date(created_at) as study_date
-            FROM study_sessions 
-            WHERE user_id = ?
-            ORDER BY study_date DESC
-        ),
-        streaks AS (
-            SELECT 
-                study_date,
-                julianday(study_date) - julianday(LAG(study_date, 1, study_date) OVER (ORDER BY study_date)) as diff
-            FROM dates
-        )
-        SELECT COUNT(*) as current_streak
-        FROM streaks
-        WHERE diff = 1
-        ORDER BY study_date DESC
-        LIMIT 1
-    ''', (session['user_id'],)).fetchone()
-    
-    conn.close()
+    def load_study_stats():
+        # Overall stats
+        total_stats = queries.study_totals(conn, session['user_id'])
+        
+        # Subject breakdown
+        subject_stats = queries.study_totals_by_subject(conn, session['user_id'])
+        return total_stats, subject_stats
+    
+    total_stats, subject_stats = get_cache().get_or_compute(
+        session['user_id'], 'study_stats', (), load_study_stats)
     
     return render_template('study_stats.html',
                          total_stats=total_stats,
                          subject_stats=subject_stats,
-                         streak_data=streak_data)
+                         # Stored per user: a single-row lookup, no need to cache
+                         streak_data=study.streak(conn, session['user_id']))
 
 #calendar
 # calendar
@@ -716,56 +962,29 @@ def calendar_view():
     year = request.args.get('year', type=int, default=datetime.now().year)
     month = request.args.get('month', type=int, default=datetime.now().month)
     
-    conn = get_db_connection()
-    
-    # Get tasks for the selected month
-    tasks = conn.execute('''
-        SELECT tasks.*, subjects.name as subject_name, subjects.color as subject_color 
-        FROM tasks 
-        LEFT JOIN subjects ON tasks.subject_id = subjects.id 
-        WHERE tasks.user_id = ? 
-        AND strftime('%Y-%m', tasks.due_date) = ?
-        ORDER BY tasks.due_date, tasks.priority
-    ''', (session['user_id'], f"{year:04d}-{month:02d}")).fetchall()
-    
-    # Add calendar_color based on priority
-    def get_priority_color(priority, is_overdue=False):
-        if is_overdue:
-            return '#ff0000'  # Red for overdue
-        elif priority == 'high':
-            return '#ff4444'  # Red
-        elif priority == 'medium':
-            return '#ffaa00'  # Orange
-        elif priority == 'low':
-            return '#44ff44'  # Green
-        else:
-            return '#666666'  # Default gray
+    try:
+        month_start = datetime(year, month, 1)
+    except ValueError:
+        return redirect('/calendar')
     
-    # Group tasks by date for the calendar and add color
-    tasks_by_date = {}
-    today_str = datetime.now().strftime('%Y-%m-%d')
+    conn = get_db_connection()
+    today_str = request_today().isoformat()
+    user = queries.user_data_version(conn, session['user_id'])
     
-    for task in tasks:
-        date_str = task['due_date']
-        is_overdue = date_str < today_str
-        
-        # Add calendar_color to each task
-        task_dict = dict(task)
-        task_dict['calendar_color'] = get_priority_color(task['priority'], is_overdue)
-        
-        if date_str not in tasks_by_date:
-            tasks_by_date[date_str] = []
-        tasks_by_date[date_str].append(task_dict)
+    # Per-day counts for the grid; task rows are only loaded by /calendar/day/<date>
+    def load_month():
+        days = {row['due_date']: row for row in queries.calendar_month_days(conn, session['user_id'], year, month)}
+        return {
+            'days': days,
+            'total_tasks': sum(row['total'] for row in days.values()),
+            'overdue_count': sum(row['total'] for day, row in days.items() if day < today_str),
+        }
     
-    # Calculate statistics
-    total_tasks_this_month = len(tasks)
-    days_with_tasks = len(tasks_by_date)
+    # Overdue totals depend on the date, so today is part of the key
+    month_data = get_cache().get_or_compute(
+        session['user_id'], 'calendar', (year, month, today_str), load_month)
     
-    # Calculate overdue tasks
-    overdue_count = 0
-    for date_str, date_tasks in tasks_by_date.items():
-        if date_str < today_str:
-            overdue_count += len(date_tasks)
+    feed_token = user['calendar_token']
     
     # Calculate calendar data
     import calendar
@@ -782,25 +1001,26 @@ def calendar_view():
     prev_month_name = datetime(prev_year, prev_month, 1).strftime('%B') if prev_month else ''
     next_month_name = datetime(next_year, next_month, 1).strftime('%B') if next_month else ''
     
-    conn.close()
     
     return render_template('calendar.html',
                          year=year,
                          month=month,
-                         month_name=datetime(year, month, 1).strftime('%B %Y'),
+                         month_name=month_start.strftime('%B %Y'),
                          month_days=month_days,
-                         tasks_by_date=tasks_by_date,
+                         days=month_data['days'],
+                         today_str=today_str,
                          prev_year=prev_year,
                          prev_month=prev_month,
                          next_year=next_year,
                          next_month=next_month,
                          prev_month_name=prev_month_name,
                          next_month_name=next_month_name,
-                         total_tasks_this_month=total_tasks_this_month,
-                         days_with_tasks=days_with_tasks,
-                         overdue_count=overdue_count,
-                         datetime=datetime,
-                         get_urgency_class=get_urgency_class)
+                         total_tasks_this_month=month_data['total_tasks'],
+                         days_with_tasks=len(month_data['days']),
+                         overdue_count=month_data['overdue_count'],
+                         feed_url=url_for('calendar_feed', token=feed_token, _external=True) if feed_token else None,
+                         live_version=user['data_version'],
+                         datetime=datetime)
 
 @app.route('/calendar/day/<date>')
 def calendar_day_view(date):
@@ -810,21 +1030,95 @@ def calendar_day_view(date):
     conn = get_db_connection()
     
     # Get tasks for the specific date
-    tasks = conn.execute('''
-        SELECT tasks.*, subjects.name as subject_name, subjects.color as subject_color 
-        FROM tasks 
-        LEFT JOIN subjects ON tasks.subject_id = subjects.id 
-        WHERE tasks.user_id = ? AND tasks.due_date = ?
-        ORDER BY tasks.priority, tasks.created_at
-    ''', (session['user_id'], date)).fetchall()
+    tasks = queries.list_tasks_for_day(conn, session['user_id'], date)
     
-    conn.close()
     
     return render_template('calendar_day.html', 
-                         tasks=tasks, 
+                         tasks=request_urgency().classify(tasks), 
                          date=date,
-                         datetime=datetime,  # Pass datetime to template
-                         get_urgency_class=get_urgency_class)
+                         datetime=datetime)  # Pass datetime to template
+
+@app.route('/api/calendar')
+def calendar_range_api():
+    """Agenda of tasks and study sessions for ?start=YYYY-MM-DD&end=YYYY-MM-DD (inclusive)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        return jsonify({'error': 'start and end must be dates (YYYY-MM-DD)'}), 400
+    if end < start or (end - start).days >= CALENDAR_MAX_DAYS:
+        return jsonify({'error': f'end must be on or after start, at most {CALENDAR_MAX_DAYS} days later'}), 400
+    
+    conn = get_db_connection()
+    user = queries.user_data_version(conn, session['user_id'])
+    
+    def build():
+        stop = end + timedelta(days=1)
+        days = {}
+        for task in queries.list_tasks_between(conn, user['id'], start, stop):
+            day = days.setdefault(task['due_date'], {'tasks': [], 'study_sessions': []})
+            day['tasks'].append({
+                'id': task['id'],
+                'title': task['title'],
+                'due_date': task['due_date'],
+                'priority': task['priority'],
+                'completed': bool(task['completed']),
+                'subject': task['subject_name'],
+                'subject_color': task['subject_color'],
+            })
+        for study_session in queries.list_study_sessions_between(conn, user['id'], start, stop):
+            day = days.setdefault(str(study_session['created_at'])[:10], {'tasks': [], 'study_sessions': []})
+            day['study_sessions'].append({
+                'id': study_session['id'],
+                'subject': study_session['subject_name'],
+                'duration_minutes': study_session['duration_minutes'],
+                'session_type': study_session['session_type'],
+                'notes': study_session['notes'],
+                'created_at': study_session['created_at'],
+            })
+        return jsonify({
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'days': [dict(date=day, **days[day]) for day in sorted(days)],
+        })
+    
+    return conditional_response(user, (start, end), build)
+
+@app.route('/calendar/feed/<token>.ics')
+def calendar_feed(token):
+    """Subscribable iCalendar feed; the token in the URL stands in for the login"""
+    conn = get_db_connection()
+    user = queries.find_user_by_calendar_token(conn, token)
+    if user is None:
+        return 'Unknown calendar feed', 404
+    
+    # The window moves daily, so today is part of the ETag
+    today = datetime.now().date()
+    
+    def build():
+        start = today - timedelta(days=FEED_PAST_DAYS)
+        end = today + timedelta(days=FEED_FUTURE_DAYS)
+        tasks = queries.list_tasks_between(conn, user['id'], start, end)
+        study_sessions = queries.list_study_sessions_between(conn, user['id'], start, end)
+        body = ''.join(exports.ics_chunks(tasks, study_sessions, user['username'], datetime.utcnow()))
+        return Response(body, content_type='text/calendar; charset=utf-8')
+    
+    return conditional_response(user, today, build)
+
+@app.route('/calendar/feed', methods=['POST'])
+def reset_calendar_feed():
+    """Create the user's feed link, or replace it so the old one stops working"""
+    if 'user_id' not in session:
+        return redirect('/login')
+    
+    conn = get_db_connection()
+    queries.set_calendar_token(conn, session['user_id'], secrets.token_urlsafe(24))
+    conn.commit()
+    
+    return redirect('/calendar')
 
 @app.route('/update_task_date/<int:task_id>', methods=['POST'])
 def update_task_date(task_id):
@@ -834,12 +1128,8 @@ def update_task_date(task_id):
     new_date = request.form['new_date']
     
     conn = get_db_connection()
-    conn.execute(
-        'UPDATE tasks SET due_date = ? WHERE id = ? AND user_id = ?',
-        (new_date, task_id, session['user_id'])
-    )
-    conn.commit()
-    conn.close()
+    queries.update_task_date(conn, session['user_id'], task_id, new_date)
+    commit_user_changes(conn, task_change('update', task_id, due_date=new_date))
     
     return redirect(request.referrer or '/calendar')
 
@@ -857,73 +1147,65 @@ def send_message():
         return jsonify({'error': 'Not logged in'})
     
     user_message = request.json['message']
+    start = time.perf_counter()
+    
+    # Questions about tasks and study stats are answered from the database
+    local = intents.answer(get_db_connection(), session['user_id'], user_message, request_today())
+    if local is not None:
+        intent, bot_response = local
+        intents.chat_stats.record('local', time.perf_counter() - start, intent)
+        return jsonify({'response': bot_response})
+    
+    # Don't hold a pooled connection through a Dialogflow call that can take seconds
+    close_db_connection()
     
     try:
-        # Get Dialogflow response
-        bot_response = detect_intent_texts(
-            "studenttaskbot-yoce",  # Your Project ID
-            str(session['user_id']),  # Use user ID as session ID
-            user_message,
-            "en"
-        )
+        # Get Dialogflow response on the chatbot thread pool, waiting at most DIALOGFLOW_WAIT
+        future = dialogflow_client.submit(str(session['user_id']), user_message, "en")  # Use user ID as session ID
+        bot_response = future.result(timeout=dialogflow_client.DIALOGFLOW_WAIT)
         
         return jsonify({'response': bot_response})
+    
+    except FuturesTimeout as e:
+        dialogflow_client.cancel(future)
+        metrics.record_error(e)
+        return jsonify({'response': "Sorry, I'm taking too long to think. Please try again in a moment."})
+    
+    except dialogflow_client.Busy as e:
+        metrics.record_error(e)
+        return jsonify({'response': "Sorry, I'm answering a lot of questions right now. Please try again in a moment."})
         
     except Exception as e:
-        print("Dialogflow error:", e)
+        metrics.record_error(e)
         # Fallback response if Dialogflow fails
         return jsonify({'response': f"I'm having trouble connecting right now. Error: {str(e)}"})
-
-def detect_intent_texts(project_id, session_id, text, language_code):
-    """Returns the result of detect intent with texts as inputs."""
-    
-    # Path to your service account key file
-    credentials_path = 'studenttaskbot-yoce-5d14b6c469b5.json'
     
-    if not os.path.exists(credentials_path):
-        return "Chatbot setup incomplete. Please configure Dialogflow credentials."
-    
-    credentials = service_account.Credentials.from_service_account_file(credentials_path)
-    session_client = dialogflow.SessionsClient(credentials=credentials)
-    
-    session = session_client.session_path(project_id, session_id)
-    text_input = dialogflow.TextInput(text=text, language_code=language_code)
-    query_input = dialogflow.QueryInput(text=text_input)
-    
-    response = session_client.detect_intent(
-        request={"session": session, "query_input": query_input}
-    )
-    
-    return response.query_result.fulfillment_text
+    finally:
+        intents.chat_stats.record('dialogflow', time.perf_counter() - start)
 
 # Quick task routes
-@app.route('/quick_task', methods=['POST'])
-def quick_task():
-    if 'user_id' not in session:
-        return redirect('/login')
-    
-    title = request.form['title']
-    due_days = int(request.form.get('due_days', 0))
-    
-    from datetime import datetime, timedelta
-    due_date = (datetime.now() + timedelta(days=due_days)).strftime('%Y-%m-%d')
-    
+def quick_task_defaults(due_days):
+    """(due date, priority) for a task due in due_days days: the sooner, the higher"""
+    due_date = (request_today() + timedelta(days=due_days)).isoformat()
     if due_days == 0:
         priority = 'high'
     elif due_days <= 2:
         priority = 'medium'
     else:
         priority = 'low'
+    return due_date, priority
+
+@app.route('/quick_task', methods=['POST'])
+def quick_task():
+    if 'user_id' not in session:
+        return redirect('/login')
+    
+    title = request.form['title']
+    due_date, priority = quick_task_defaults(int(request.form.get('due_days', 0)))
     
     conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        'INSERT INTO tasks (user_id, title, due_date, priority) VALUES (?, ?, ?, ?)',
-        (session['user_id'], title, due_date, priority)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    task_id = queries.create_task(conn, session['user_id'], title, None, due_date, priority)
+    commit_user_changes(conn, task_change('create', task_id))
     
     return redirect('/dashboard')
 
@@ -935,18 +1217,87 @@ def quick_complete(task_id):
         return redirect('/login')
     
     conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        'UPDATE tasks SET completed = 1 WHERE id = ? AND user_id = ?',
-        (task_id, session['user_id'])
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    queries.set_task_completed(conn, session['user_id'], task_id)
+    commit_user_changes(conn, task_change('update', task_id, completed=True))
     
     return redirect('/dashboard')
 
 
+# -------------------- LIVE UPDATES --------------------
+@app.route('/events')
+def event_stream():
+    """The user's change events as Server-Sent Events (see events.py and static/js/live.js)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    # Subscribe before reading the version, so nothing committed in between is missed
+    subscription = events.get_broker().subscribe(session['user_id'])
+    if subscription is None:
+        return jsonify({'error': 'Live updates unavailable'}), 503
+    try:
+        version = live_version(get_db_connection())
+    except Exception:
+        subscription.close()
+        raise
+    
+    # Not stream_with_context: the request (and its pooled connection) ends before streaming starts
+    response = Response(events.stream(subscription, version), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Frees the stream's slot even if the body is never read (HEAD, an early disconnect)
+    response.call_on_close(subscription.close)
+    return response
+
+
+# -------------------- OPERATIONS --------------------
+# Per-worker counters for operators; /slow_queries shows SQL text and plans
+STATS_ENDPOINTS = {'pool_stats', 'chatbot_stats', 'events_stats', 'cache_stats', 'metrics_endpoint', 'slow_queries'}
+
+def stats_allowed():
+    if STATS_TOKEN:
+        return secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {STATS_TOKEN}')
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+@app.before_request
+def guard_stats():
+    """Hide the operations endpoints from everyone but operators"""
+    if request.endpoint in STATS_ENDPOINTS and not stats_allowed():
+        return jsonify({'error': 'Not found'}), 404
+
+@app.route('/pool_stats')
+def pool_stats():
+    """Connection pool hit/miss and wait-time counters for this worker"""
+    return jsonify(get_pool().stats())
+
+
+@app.route('/chatbot_stats')
+def chatbot_stats():
+    """Share of chat messages answered locally, and latency per source, for this worker"""
+    return jsonify(intents.chat_stats.stats())
+
+
+@app.route('/events_stats')
+def events_stats():
+    """Open live-update streams and events delivered by this worker"""
+    return jsonify(events.get_broker().stats())
+
+@app.route('/cache_stats')
+def cache_stats():
+    """Read cache hit rates (overall and per page) and memory use for this worker"""
+    return jsonify(get_cache().stats())
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint for this worker"""
+    return Response(metrics.get_registry().render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/slow_queries')
+def slow_queries():
+    """Statements over SLOW_QUERY_MS on this worker, newest first, with their plans"""
+    return jsonify(metrics.get_registry().slow_query_log())
+
+
 @app.route('/logout')
 def logout():
     session.clear()
@@ -962,7 +1313,57 @@ def not_found_error(error):
 def internal_error(error):
     return "Internal server error", 500
 
+# -------------------- STARTUP --------------------
+
+_app_ready = False
+_warm_pid = None
+
+
+def create_app():
+    """Return the app ready to serve: schema migrated, templates compiled.
+
+    Importing this module only defines the routes. wsgi.py calls this, in the
+    gunicorn master when preload_app is on, so the workers inherit the result.
+    """
+    global _app_ready
+    if _app_ready:
+        return app
+    # Bring the schema up to date before serving (set AUTO_MIGRATE=0 to run it from the CLI instead).
+    # An unpooled connection, so a preloading master has none open when it forks.
+    if AUTO_MIGRATE:
+        conn = connect()
+        try:
+            migrations.migrate(conn)
+        finally:
+            conn.close()
+    # Compile every template now (all filters are registered by this point) rather than on each one's first request
+    if TEMPLATE_PRECOMPILE:
+        assets.precompile(app.jinja_env)
+    _app_ready = True
+    return app
+
+
+def warm_up():
+    """Ready this worker before its first request: DB connections, cache and Dialogflow channel"""
+    global _warm_pid
+    # Once per process: gunicorn's post_worker_init and the ASGI lifespan may both call it
+    if _warm_pid == os.getpid():
+        return
+    _warm_pid = os.getpid()
+    try:
+        get_pool().fill(POOL_PREFILL)
+        get_cache().stats()  # builds the backend (and connects to redis)
+    except Exception as e:
+        # Not fatal: requests open what they need themselves
+        metrics.record_error(e)
+    # Build the Dialogflow client and open its channel now rather than on the first chat message
+    if DIALOGFLOW_WARMUP:
+        dialogflow_client.warm_up_in_background()
+
+
 if __name__ == '__main__':
+    create_app()
+    warm_up()
     app.run(debug=True)
 
 if __name__ == '__main__':
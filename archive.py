@@ -0,0 +1,221 @@
+"""Per-user data archives: a zip of JSON Lines files plus a manifest.
+
+Moves a user's subjects, tasks, notes and study sessions between
+deployments (SQLite or PostgreSQL). Imports get fresh ids, with references
+remapped, and are written in batches inside one transaction.
+
+    python archive.py export alice alice.zip [--include-password]
+    python archive.py import alice.zip --user alice
+    python archive.py import alice.zip --create-user
+"""
+import io
+import json
+import sys
+import zipfile
+from datetime import datetime
+from itertools import islice
+
+import queries
+import study
+from queries import SQLITE, dialect_of
+
+ARCHIVE_FORMAT = 'student-task-manager'
+ARCHIVE_VERSION = 1
+BATCH_SIZE = 1000
+
+# (table, archived columns, {reference column: referenced table}), in import order.
+# Every table also has user_id, which is replaced by the importing user.
+TABLES = [
+    ('subjects', ['id', 'name', 'color'], {}),
+    ('tasks', ['id', 'subject_id', 'title', 'description', 'due_date', 'priority', 'completed',
+               'created_at', 'last_note', 'note_count', 'notes_updated_at'], {'subject_id': 'subjects'}),
+    ('task_history', ['id', 'task_id', 'note_text', 'created_at'], {'task_id': 'tasks'}),
+    ('study_sessions', ['id', 'subject_id', 'duration_minutes', 'notes', 'session_type', 'created_at'],
+     {'subject_id': 'subjects'}),
+]
+# Rows whose reference can't be remapped are skipped instead of unlinked
+REQUIRED_REFERENCES = {'task_id'}
+# Rows missing a NOT NULL column are skipped the same way
+REQUIRED_COLUMNS = {'subjects': ['name'], 'tasks': ['title'], 'task_history': ['note_text'],
+                    'study_sessions': ['duration_minutes']}
+# Filled in for columns with a default that a row leaves out
+COLUMN_DEFAULTS = {'priority': 'medium', 'note_count': 0}
+
+
+class ArchiveError(Exception):
+    """Raised for files that aren't archives this version can read"""
+
+
+def write_archive(conn, user, fileobj, include_password=False):
+    """Write user's data to fileobj as a zip archive; returns the row counts"""
+    counts = {}
+    with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for table, _, _ in TABLES:
+            counts[table] = 0
+            with archive.open(f'{table}.jsonl', 'w', force_zip64=True) as out:
+                lines = []
+                for row in queries.archive_rows(conn, table, user['id'], BATCH_SIZE):
+                    lines.append(json.dumps(row, ensure_ascii=False) + '\n')
+                    if len(lines) >= BATCH_SIZE:
+                        out.write(''.join(lines).encode('utf-8'))
+                        counts[table] += len(lines)
+                        lines = []
+                out.write(''.join(lines).encode('utf-8'))
+                counts[table] += len(lines)
+
+        manifest = {
+            'format': ARCHIVE_FORMAT,
+            'version': ARCHIVE_VERSION,
+            'exported_at': datetime.now().isoformat(sep=' ', timespec='seconds'),
+            'source': dialect_of(conn),
+            'user': {'username': user['username'], 'email': user['email']},
+            'counts': counts,
+        }
+        if include_password:
+            manifest['user']['password'] = user['password']
+        archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+    return counts
+
+
+def read_manifest(archive):
+    try:
+        manifest = json.loads(archive.read('manifest.json'))
+    except KeyError:
+        raise ArchiveError("Not a task archive (no manifest.json)")
+    if manifest.get('format') != ARCHIVE_FORMAT:
+        raise ArchiveError("Not a task archive (unknown format)")
+    if manifest.get('version', 0) > ARCHIVE_VERSION:
+        raise ArchiveError(f"Archive version {manifest['version']} is newer than this app supports "
+                           f"({ARCHIVE_VERSION})")
+    return manifest
+
+
+def open_archive(fileobj):
+    """Open an uploaded file as an archive; returns (zipfile, manifest)"""
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise ArchiveError("Not a task archive (not a zip file)")
+    return archive, read_manifest(archive)
+
+
+def _batches(lines, size):
+    while True:
+        batch = list(islice(lines, size))
+        if not batch:
+            return
+        yield batch
+
+
+def import_archive(conn, user_id, archive, batch_size=BATCH_SIZE):
+    """Add an archive's rows to user_id's data with new ids; returns the row counts.
+
+    Runs in the caller's transaction; commit (or roll back) afterwards.
+    """
+    if dialect_of(conn) == SQLITE and not conn.in_transaction:
+        # Hold the write lock so the ids reserved below stay free
+        conn.execute('BEGIN IMMEDIATE')
+
+    referenced = {target for _, _, references in TABLES for target in references.values()}
+    id_maps = {}
+    counts = {}
+    for table, columns, references in TABLES:
+        id_map = id_maps[table] = {}
+        counts[table] = 0
+        if f'{table}.jsonl' not in archive.namelist():
+            continue
+        insert_columns = ['id', 'user_id'] + columns[1:]
+        with archive.open(f'{table}.jsonl') as raw:
+            for batch in _batches(io.TextIOWrapper(raw, encoding='utf-8'), batch_size):
+                records = [json.loads(line) for line in batch]
+                new_ids = queries.reserve_ids(conn, table, len(records))
+                rows = []
+                for record, new_id in zip(records, new_ids):
+                    if not all(str(record.get(column) or '').strip() for column in REQUIRED_COLUMNS[table]):
+                        continue
+                    values = [new_id, user_id]
+                    for column in columns[1:]:
+                        value = record.get(column)
+                        if column in references and value is not None:
+                            value = id_maps[references[column]].get(value)
+                        if value is None:
+                            value = COLUMN_DEFAULTS.get(column)
+                        if column == 'completed':
+                            value = bool(value)
+                        elif column == 'due_date':
+                            value = queries.due_date_value(value)
+                        values.append(value)
+                    if any(values[insert_columns.index(column)] is None for column in REQUIRED_REFERENCES
+                           if column in references):
+                        continue
+                    if table in referenced:
+                        id_map[record['id']] = new_id
+                    rows.append(tuple(values))
+                queries.insert_many(conn, table, insert_columns, rows)
+                counts[table] += len(rows)
+    if counts['study_sessions']:
+        study.reconcile(conn, user_id)
+    return counts
+
+
+if __name__ == '__main__':
+    import argparse
+    import secrets
+    import hashlib
+    from db import connect
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Export or import a user's data archive")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help="write a user's archive")
+    export_parser.add_argument('username')
+    export_parser.add_argument('path')
+    export_parser.add_argument('--include-password', action='store_true',
+                               help='keep the password hash so the account can be recreated elsewhere')
+    import_parser = commands.add_parser('import', help='load an archive into a user')
+    import_parser.add_argument('path')
+    target = import_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--user', help='existing user to add the data to')
+    target.add_argument('--create-user', action='store_true', help='create the archived user first')
+    args = parser.parse_args()
+
+    conn = connect()
+    migrate(conn)
+    if args.command == 'export':
+        user = queries.find_user_by_username(conn, args.username)
+        if user is None:
+            sys.exit(f"No user named {args.username!r}")
+        with open(args.path, 'wb') as fileobj:
+            counts = write_archive(conn, user, fileobj, include_password=args.include_password)
+        print(f"Exported {args.path}: {counts}")
+    else:
+        with open(args.path, 'rb') as fileobj:
+            try:
+                archive, manifest = open_archive(fileobj)
+            except ArchiveError as e:
+                sys.exit(str(e))
+            try:
+                if args.create_user:
+                    archived = manifest['user']
+                    if queries.find_user_by_name_or_email(conn, archived['username'], archived['email']):
+                        sys.exit(f"User {archived['username']!r} (or that email) already exists")
+                    password = archived.get('password')
+                    if password is None:
+                        # No usable password: the hash of a random secret nobody knows
+                        print("Archive has no password hash; the new account can't log in until one is set")
+                        password = hashlib.sha256(secrets.token_bytes(32)).hexdigest()
+                    user_id = queries.create_user(conn, archived['username'], archived['email'], password,
+                                                  datetime.now())
+                else:
+                    user = queries.find_user_by_username(conn, args.user)
+                    if user is None:
+                        sys.exit(f"No user named {args.user!r}")
+                    user_id = user['id']
+                counts = import_archive(conn, user_id, archive)
+                queries.touch_user_data(conn, user_id)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        print(f"Imported {args.path} into user {user_id}: {counts}")
+    conn.close()
@@ -0,0 +1,174 @@
+import asyncio
+import contextvars
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import create_app, warm_up
+from db import POOL_SIZE
+from events import EVENTS_MAX_STREAMS
+
+# ASGI entry point, next to wsgi.py. Needs an ASGI server, e.g.
+#   WEB_CONCURRENCY=2 uvicorn asgi:app   (uvicorn's --workers defaults to it)
+#   gunicorn asgi:app -k uvicorn.workers.UvicornWorker   (keeps gunicorn.conf.py's preload)
+# The memory cache and live-update broker only work with one worker process;
+# give several workers CACHE_BACKEND=redis and EVENTS_BACKEND=redis.
+#
+# The event loop only moves bytes. The Flask views (and the body of a
+# streamed response, one chunk at a time) run on bounded thread pools, one
+# per kind of route, so slow routes can't take the threads of quick ones:
+# a stalled Dialogflow call only ever ties up the chat pool, and an export
+# sent to a slow client holds no thread between chunks at all.
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', POOL_SIZE))
+ASGI_CHAT_THREADS = int(os.environ.get('ASGI_CHAT_THREADS', 8))
+ASGI_EXPORT_THREADS = int(os.environ.get('ASGI_EXPORT_THREADS', 2))
+# Each open /events stream waits on one of these (raise EVENTS_MAX_STREAMS to allow more)
+ASGI_EVENT_THREADS = int(os.environ.get('ASGI_EVENT_THREADS', EVENTS_MAX_STREAMS))
+
+# Path (or path prefix, ending in /) -> pool; everything else (dashboard, calendar, the API) uses 'default'
+ROUTE_POOLS = [
+    ('/send_message', 'chat'),
+    ('/export/', 'export'),
+    ('/calendar/feed/', 'export'),
+    ('/events', 'events'),
+]
+POOL_THREADS = {'default': ASGI_THREADS, 'chat': ASGI_CHAT_THREADS, 'export': ASGI_EXPORT_THREADS,
+                'events': ASGI_EVENT_THREADS}
+
+_END = object()
+_executors = {}
+_executors_pid = None
+_executors_lock = threading.Lock()
+
+
+def get_executor(name):
+    """Return this process's thread pool for a kind of route, creating the pools after a fork"""
+    global _executors, _executors_pid
+    pid = os.getpid()
+    if _executors_pid != pid:
+        with _executors_lock:
+            if _executors_pid != pid:
+                _executors = {pool: ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f'asgi-{pool}')
+                              for pool, threads in POOL_THREADS.items()}
+                _executors_pid = pid
+    return _executors[name]
+
+
+def pool_for(path):
+    for route, pool in ROUTE_POOLS:
+        if path == route or (route.endswith('/') and path.startswith(route)):
+            return pool
+    return 'default'
+
+
+def wsgi_environ(scope, body):
+    """The WSGI environ for an ASGI http scope and its request body"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        value = value.decode('latin1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    # The body is read in full first, so its length is known even if it came chunked
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+class AsgiApp:
+    """Serves a WSGI app over ASGI, running it on the pools above"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await asyncio.get_running_loop().run_in_executor(get_executor('default'), warm_up)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for executor in _executors.values():
+                    executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_running_loop()
+        executor = get_executor(pool_for(scope['path']))
+        # One context for the whole request, whichever pool thread runs each step:
+        # Flask keeps the request context of a streamed response in context variables
+        context = contextvars.copy_context()
+
+        def run(function, *args):
+            return loop.run_in_executor(executor, context.run, function, *args)
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+
+        async def wait_for_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        response = await run(self.wsgi_app, wsgi_environ(scope, bytes(body)), start_response)
+        # A client that leaves mid-stream (a closed /events tab) ends the response
+        # after the chunk in progress, instead of when the view runs out of chunks
+        disconnected = asyncio.ensure_future(wait_for_disconnect())
+        try:
+            chunks = iter(response)
+            chunk = await run(next, chunks, _END)
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            while chunk is not _END:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await run(next, chunks, _END)
+                if disconnected.done():
+                    return
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+            # Ends the request context, so teardown (connection release, /metrics) runs
+            if hasattr(response, 'close'):
+                await run(response.close)
+
+
+app = AsgiApp(create_app())
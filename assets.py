@@ -0,0 +1,73 @@
+import hashlib
+import os
+import tempfile
+
+from flask import request, url_for
+from jinja2 import FileSystemBytecodeCache
+
+# Static files and template compilation, set up once per process at startup.
+# Asset URLs carry a hash of the file's content (?v=...), so browsers can keep
+# them for a year: editing a file changes its URL.
+
+# Compiled templates are kept here and shared by every worker and restart
+# ("" keeps them in memory only)
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'stm-templates'))
+ASSET_MAX_AGE = int(os.environ.get('ASSET_MAX_AGE', 365 * 24 * 3600))
+
+
+def fingerprint(path):
+    """Short content hash of a file"""
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+
+class Assets:
+    """Content hashes of the files under a static folder"""
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.versions = {}
+        for root, _, files in os.walk(static_folder):
+            for name in files:
+                path = os.path.join(root, name)
+                self.versions[os.path.relpath(path, static_folder).replace(os.sep, '/')] = fingerprint(path)
+
+    def version(self, filename):
+        if filename not in self.versions:
+            # Added after startup (or missing - url_for still builds the URL)
+            path = os.path.join(self.static_folder, filename)
+            return fingerprint(path) if os.path.isfile(path) else None
+        return self.versions[filename]
+
+    def url(self, filename):
+        return url_for('static', filename=filename, v=self.version(filename))
+
+
+def precompile(env):
+    """Load every template once, through the bytecode cache if there is one"""
+    for name in env.list_templates(extensions=['html']):
+        env.get_template(name)
+
+
+def init_app(app):
+    """Fingerprint the static files, add asset_url() to templates, and cache compiled templates"""
+    assets = Assets(app.static_folder)
+    app.jinja_env.globals['asset_url'] = assets.url
+
+    if TEMPLATE_CACHE_DIR:
+        os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+
+    @app.after_request
+    def cache_fingerprinted_assets(response):
+        # Only the URL asset_url() hands out is immutable; a stale or missing ?v
+        # keeps Flask's default revalidation
+        if (request.endpoint == 'static' and response.status_code == 200
+                and request.args.get('v') == assets.version(request.view_args['filename'])):
+            response.cache_control.public = True
+            response.cache_control.no_cache = None
+            response.cache_control.max_age = ASSET_MAX_AGE
+            response.cache_control.immutable = True
+        return response
+
+    return assets
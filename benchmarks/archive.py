@@ -0,0 +1,91 @@
+"""Time and peak memory of a full-account archive export and import.
+
+One user gets --tasks tasks (each with one note) and a study session per
+ten tasks. Their archive is written to a temp file, then imported into a
+second user, which is the batched reserve_ids + insert_many path.
+
+    python benchmarks/archive.py --tasks 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BATCH = 10000
+
+
+def build(path, size):
+    import db
+    from migrations import migrate
+    conn = db.connect_sqlite(path, 'production')
+    migrate(conn)
+    conn.execute("INSERT INTO users (username, email, password) VALUES ('bench', 'bench@example.com', 'x')")
+    conn.execute("INSERT INTO users (username, email, password) VALUES ('copy', 'copy@example.com', 'x')")
+    conn.execute("INSERT INTO subjects (user_id, name, color) VALUES (1, 'Math', '#2196F3')")
+    today = date.today()
+    for start in range(0, size, BATCH):
+        ids = range(start + 1, min(start + BATCH, size) + 1)
+        conn.executemany(
+            'INSERT INTO tasks (id, user_id, subject_id, title, description, due_date, priority, '
+            'last_note, note_count) VALUES (?, 1, 1, ?, ?, ?, ?, ?, 1)',
+            [(i, f'Task {i}', 'Read the chapter and write a one-page summary',
+              (today + timedelta(days=i % 90)).isoformat(), 'medium', f'Note {i}') for i in ids]
+        )
+        conn.executemany('INSERT INTO task_history (task_id, user_id, note_text) VALUES (?, 1, ?)',
+                         [(i, f'Note {i}') for i in ids])
+        conn.executemany("INSERT INTO study_sessions (user_id, subject_id, duration_minutes, session_type) "
+                         "VALUES (1, 1, 25, 'focus')", [() for i in ids if i % 10 == 0])
+        conn.commit()
+    conn.close()
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=100000)
+    args = parser.parse_args()
+
+    import archive
+    import db
+    import queries
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'archive.db')
+    build(path, args.tasks)
+    archive_path = os.path.join(directory, 'bench.zip')
+
+    conn = db.connect_sqlite(path, 'production')
+    user = queries.find_user_by_username(conn, 'bench')
+
+    def export():
+        with open(archive_path, 'wb') as fileobj:
+            return archive.write_archive(conn, user, fileobj)
+
+    def load():
+        with open(archive_path, 'rb') as fileobj:
+            backup, _ = archive.open_archive(fileobj)
+            counts = archive.import_archive(conn, 2, backup)
+        conn.commit()
+        return counts
+
+    print(f"{'step':<8}{'rows':>10}{'peak KiB':>12}{'seconds':>10}{'rows/s':>10}")
+    for name, fn in (('export', export), ('import', load)):
+        peak, elapsed, counts = measure(fn)
+        rows = sum(counts.values())
+        print(f"{name:<8}{rows:>10}{peak / 1024:>12.0f}{elapsed:>10.2f}{rows / elapsed:>10.0f}")
+    print(f"archive: {os.path.getsize(archive_path) / 2 ** 20:.1f} MiB")
+    conn.close()
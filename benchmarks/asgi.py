@@ -0,0 +1,172 @@
+"""Concurrent clients against the sync (gthread) and async (asgi.py) serving modes.
+
+Dashboard readers, chatbot users (with Dialogflow answering in --chat-latency
+seconds, through LocalSessionsClient) and export downloads run side by side
+for --seconds against one worker in each mode:
+
+  sync   --threads request threads, each handling a whole request from
+         start to finish, like one `gunicorn wsgi:app` gthread worker
+  async  asgi.AsgiApp on an event loop, its views on the per-route pools,
+         like one `uvicorn asgi:app` worker
+
+Both run in this process on generated data (generate_data.py) with the same
+client code. To compare real servers, point load.py --url at each one.
+
+    python benchmarks/asgi.py --readers 8 --chatters 8 --exporters 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+KINDS = ('dashboard', 'chat', 'export')
+
+
+def setup(args):
+    """Point the app at a fresh generated database; returns the usernames"""
+    path = os.path.join(tempfile.mkdtemp(), 'asgi.db')
+    # Every chatter's call queues (none is turned away as Busy), as when the comparison was made
+    os.environ.update(SQLITE_PATH=path, DIALOGFLOW_BACKEND='local', DIALOGFLOW_WARMUP='0',
+                      DIALOGFLOW_LOCAL_LATENCY=str(args.chat_latency), DIALOGFLOW_QUEUE=str(max(args.chatters, 1)))
+    import db
+    from generate_data import generate
+    from migrations import migrate
+    conn = db.connect()
+    migrate(conn)
+    generate(conn, args.readers + args.chatters + args.exporters, seed=1, report=lambda line: None)
+    names = [row[0] for row in conn.execute('SELECT username FROM users ORDER BY id')]
+    conn.close()
+    return path, names
+
+
+def scope_for(method, path, query=b'', headers=()):
+    return {'type': 'http', 'method': method, 'path': path, 'query_string': query, 'headers': list(headers),
+            'http_version': '1.1', 'scheme': 'http', 'server': ('bench', 80), 'client': ('127.0.0.1', 0)}
+
+
+class SyncServer:
+    """One gthread worker: a fixed set of threads, each running a request to the end"""
+
+    def __init__(self, wsgi_app, threads):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    def handle(self, scope, body):
+        from asgi import wsgi_environ
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'], started['headers'] = int(status.split(' ', 1)[0]), headers
+
+        response = self.wsgi_app(wsgi_environ(scope, body), start_response)
+        try:
+            content = b''.join(response)
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+        return started['status'], dict((name.lower(), value) for name, value in started['headers']), content
+
+    async def request(self, scope, body=b''):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.handle, scope, body)
+
+
+class AsyncServer:
+    """One ASGI worker, driven directly"""
+
+    def __init__(self, asgi_app):
+        self.asgi_app = asgi_app
+
+    async def request(self, scope, body=b''):
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            # Like a server whose client stays connected: nothing more until the response is done
+            await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message)
+
+        await self.asgi_app(scope, receive, send)
+        headers = {name.decode(): value.decode() for name, value in sent[0]['headers']}
+        return sent[0]['status'], headers, b''.join(message.get('body', b'') for message in sent[1:])
+
+
+async def log_in(server, username):
+    from generate_data import GENERATED_PASSWORD
+    body = f'username={username}&password={GENERATED_PASSWORD}'.encode()
+    status, headers, _ = await server.request(
+        scope_for('POST', '/login', headers=[(b'content-type', b'application/x-www-form-urlencoded')]), body)
+    assert status == 302, f'login as {username} failed'
+    return headers['set-cookie'].split(';')[0].encode()
+
+
+def step(kind, cookie):
+    """(scope, body) of one request of this kind"""
+    if kind == 'chat':
+        return (scope_for('POST', '/send_message', headers=[(b'cookie', cookie), (b'content-type', b'application/json')]),
+                json.dumps({'message': 'Can you explain photosynthesis?'}).encode())
+    path = '/dashboard' if kind == 'dashboard' else '/export/csv'
+    return scope_for('GET', path, headers=[(b'cookie', cookie)]), b''
+
+
+async def run(server, clients, seconds):
+    """{kind: [latency, ...]} for requests finished within seconds"""
+    cookies = [await log_in(server, username) for _, username in clients]
+    latencies = {kind: [] for kind in KINDS}
+    deadline = time.perf_counter() + seconds
+
+    async def client(kind, cookie):
+        while time.perf_counter() < deadline:
+            began = time.perf_counter()
+            status, _, _ = await server.request(*step(kind, cookie))
+            assert status == 200, (kind, status)
+            if time.perf_counter() <= deadline:
+                latencies[kind].append(time.perf_counter() - began)
+
+    await asyncio.gather(*(client(kind, cookie) for (kind, _), cookie in zip(clients, cookies)))
+    return latencies
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else float('nan')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8, help='clients loading /dashboard')
+    parser.add_argument('--chatters', type=int, default=8, help='clients on /send_message')
+    parser.add_argument('--exporters', type=int, default=2, help='clients downloading /export/csv')
+    parser.add_argument('--chat-latency', type=float, default=1.0, help='seconds per Dialogflow reply')
+    parser.add_argument('--threads', type=int, default=4, help='gthread threads of the sync worker')
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    path, usernames = setup(args)
+    kinds = ['dashboard'] * args.readers + ['chat'] * args.chatters + ['export'] * args.exporters
+    clients = list(zip(kinds, usernames))
+
+    import asgi
+    from app import warm_up
+    warm_up()
+    servers = {'sync': SyncServer(asgi.app.wsgi_app, args.threads), 'async': AsyncServer(asgi.app)}
+
+    print(f"{args.readers} dashboard, {args.chatters} chat ({args.chat_latency:g}s replies) and "
+          f"{args.exporters} export clients, {args.seconds:g}s per mode")
+    print(f"{'mode':<7}{'route':<11}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}")
+    for mode, server in servers.items():
+        results = asyncio.run(run(server, clients, args.seconds))
+        for kind in KINDS:
+            ordered = sorted(results[kind])
+            print(f"{mode:<7}{kind:<11}{len(ordered) / args.seconds:>8.1f}"
+                  f"{percentile(ordered, 0.5) * 1000:>9.1f}{percentile(ordered, 0.95) * 1000:>9.1f}")
+    shutil.rmtree(os.path.dirname(path))
@@ -0,0 +1,82 @@
+"""Per-task cost of completing and deleting --items tasks: one request each vs one batch.
+
+The per-request path is what the dashboard did: POST /complete_task (or
+/delete_task), then follow the redirect to a freshly rendered /dashboard.
+It is also timed without the redirect, to separate the write from the page.
+The batch path is a single POST /api/v1/tasks/batch for all of them.
+
+    python benchmarks/batch.py --items 1000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ.setdefault('DIALOGFLOW_WARMUP', '0')
+
+PATHS = ('request + dashboard', 'request only', 'batch')
+
+
+def seed(count):
+    import db
+    from migrations import migrate
+    conn = db.connect_sqlite()
+    migrate(conn)
+    conn.execute("INSERT INTO users (username, email, password) VALUES ('bench', 'bench@example.com', 'x')")
+    today = date.today()
+    conn.executemany(
+        'INSERT INTO tasks (user_id, title, description, due_date, priority) VALUES (1, ?, ?, ?, ?)',
+        [(f'Task {i}', 'End of semester clean-up', (today + timedelta(days=i % 30 - 5)).isoformat(),
+          ('high', 'medium', 'low')[i % 3]) for i in range(count)]
+    )
+    conn.commit()
+    ids = [row[0] for row in conn.execute('SELECT id FROM tasks ORDER BY id')]
+    conn.close()
+    return ids
+
+
+def per_request(client, url, ids, follow):
+    for task_id in ids:
+        response = client.post(url, data={'task_id': task_id}, follow_redirects=follow)
+        assert response.status_code in (200, 302)
+
+
+def batch(client, op, ids):
+    response = client.post('/api/v1/tasks/batch', json={'op': op, 'ids': ids})
+    assert response.status_code == 200 and response.get_json()['applied'] == len(ids)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=1000)
+    args = parser.parse_args()
+
+    ids = seed(2 * len(PATHS) * args.items)
+    from app import create_app
+    app = create_app()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['username'] = 'bench'
+
+    chunks = iter(ids[i:i + args.items] for i in range(0, len(ids), args.items))
+    runs = {}
+    for op, url in (('complete', '/complete_task'), ('delete', '/delete_task')):
+        for path in PATHS:
+            chunk = next(chunks)
+            start = time.perf_counter()
+            if path == 'batch':
+                batch(client, op, chunk)
+            else:
+                per_request(client, url, chunk, follow=path == 'request + dashboard')
+            runs[op, path] = (time.perf_counter() - start) / args.items
+
+    print(f"{args.items} tasks per run, ms per task")
+    print(f"{'path':<22}{'complete':>10}{'delete':>10}")
+    for path in PATHS:
+        print(f"{path:<22}{runs['complete', path] * 1000:>10.3f}{runs['delete', path] * 1000:>10.3f}")
@@ -0,0 +1,106 @@
+"""Peak memory of the task export: buffered string vs streamed response.
+
+For each size, one user gets that many tasks. The benchmark then measures
+peak Python allocations (tracemalloc) in two cases:
+- the old export, which runs fetchall() and concatenates the whole file
+- the streamed /export/<fmt> routes, read chunk by chunk through the test client
+
+    python benchmarks/export.py --sizes 1000,10000,100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BATCH = 10000
+
+
+def build(path, size):
+    import db
+    from migrations import migrate
+    conn = db.connect_sqlite(path, 'production')
+    migrate(conn)
+    conn.execute("INSERT INTO users (username, email, password) VALUES ('bench', 'bench@example.com', 'x')")
+    today = date.today()
+    for start in range(0, size, BATCH):
+        conn.executemany(
+            'INSERT INTO tasks (user_id, title, description, due_date, priority) VALUES (1, ?, ?, ?, ?)',
+            [(f'Task {i}', 'Read the chapter and write a one-page summary ' * 3,
+              (today + timedelta(days=i % 90)).isoformat(), 'medium')
+             for i in range(start, min(start + BATCH, size))]
+        )
+        conn.commit()
+    conn.close()
+
+
+def buffered_export(conn):
+    """The pre-streaming export_txt(): fetch everything, then build one string"""
+    import queries
+    tasks = queries.list_tasks(conn, 1)
+    content = "Student Task Manager - Task List\n"
+    for task in tasks:
+        content += f"TITLE: {task['title']}\n"
+        content += f"SUBJECT: {task['subject_name'] or 'No Subject'}\n"
+        content += f"PRIORITY: {task['priority'].upper()} | DUE: {task['due_date']}\n"
+        if task['description']:
+            content += f"DESCRIPTION: {task['description']}\n"
+        content += "-" * 30 + "\n"
+    return len(content)
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed, size
+
+
+def streamed(client, fmt):
+    def run():
+        response = client.get(f'/export/{fmt}', buffered=False)
+        total = 0
+        for chunk in response.response:
+            total += len(chunk)
+        response.close()
+        return total
+    return run
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma-separated task counts')
+    args = parser.parse_args()
+
+    print(f"{'tasks':>8}  {'export':<10}{'peak KiB':>12}{'seconds':>10}{'output MiB':>12}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        path = os.path.join(tempfile.mkdtemp(), 'export.db')
+        build(path, size)
+        os.environ.update(SQLITE_PATH=path, AUTO_MIGRATE='0', DIALOGFLOW_WARMUP='0', CACHE_BACKEND='none')
+
+        # A fresh app (and pool) per database
+        for module in ('app', 'db', 'cache'):
+            sys.modules.pop(module, None)
+        import app as app_module
+        import db
+
+        conn = db.connect_sqlite(path)
+        results = [('buffered', measure(lambda: buffered_export(conn)))]
+        conn.close()
+
+        client = app_module.create_app().test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'bench'
+        for fmt in ('txt', 'csv', 'ndjson'):
+            results.append((fmt, measure(streamed(client, fmt))))
+
+        for name, (peak, elapsed, length) in results:
+            print(f"{size:>8}  {name:<10}{peak / 1024:>12.0f}{elapsed:>10.2f}{length / 2 ** 20:>12.1f}")
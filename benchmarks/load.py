@@ -0,0 +1,317 @@
+"""End-to-end load test: a weighted mix of real routes, with latency percentiles.
+
+Each client thread logs in as a different generated user (generate_data.py)
+and loops over the MIX below - dashboard views with filters, the calendar,
+study stats, a text export and writes through the API - for --seconds. It
+reports requests/s and p50/p95/p99 per route. --save keeps the numbers as
+JSON and --compare prints the change against such a file, so runs can be
+compared before and after a change. Afterwards the study rollup and streaks
+of the users that ran are checked against a fresh aggregate of their
+study_sessions (study.mismatches), so the incremental updates made under
+concurrent writes are verified too; any mismatch fails the run.
+
+By default requests go through the app in this process (Flask test client).
+With --url they go over HTTP to a running server (gunicorn, say), logging in
+through /login; the database is still read directly to pick the users.
+
+    SQLITE_PATH=/tmp/load.db python generate_data.py --users 500
+    SQLITE_PATH=/tmp/load.db python benchmarks/load.py --clients 8 --seconds 30 --save before.json
+    SQLITE_PATH=/tmp/load.db python benchmarks/load.py --clients 8 --seconds 30 --compare before.json
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DIALOGFLOW_WARMUP', '0')
+
+import queries  # noqa: E402
+from db import connect  # noqa: E402
+from generate_data import GENERATED_PASSWORD, TOPICS  # noqa: E402
+import study  # noqa: E402
+
+SEARCH_WORDS = ['chapter', 'essay', 'quiz', 'lab', 'question'] + [topic.split()[-1] for topic in TOPICS]
+
+
+class InProcessClient:
+    """Requests through the Flask test client, logged in by setting the session"""
+
+    def __init__(self, user):
+        from app import create_app
+        self.client = create_app().test_client()
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = user['id']
+            sess['username'] = user['username']
+
+    def request(self, method, path, data=None, json_body=None):
+        response = self.client.open(path, method=method, data=data, json=json_body)
+        body = response.get_data()  # drains streamed responses such as the exports
+        return response.status_code, body
+
+
+class HttpClient:
+    """Requests to a running server, logged in through /login"""
+
+    def __init__(self, user, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        status, _ = self.request('POST', '/login', data={'username': user['username'],
+                                                        'password': GENERATED_PASSWORD})
+        if status != 200:
+            raise RuntimeError(f"Login as {user['username']} failed ({status})")
+
+    def request(self, method, path, data=None, json_body=None):
+        body, headers = None, {}
+        if json_body is not None:
+            body, headers = json.dumps(json_body).encode(), {'Content-Type': 'application/json'}
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class Session:
+    """One simulated user: their client plus what they have seen so far"""
+
+    def __init__(self, client, user, rng):
+        self.client = client
+        self.user = user
+        self.rng = rng
+        self.task_ids = []
+
+    def get(self, path):
+        return self.client.request('GET', path)
+
+    def refresh_task_ids(self):
+        status, body = self.get('/api/dashboard/tasks?limit=100')
+        if status == 200:
+            self.task_ids = [task['id'] for task in json.loads(body)['tasks'] if not task['completed']]
+        return status, body
+
+    def some_task(self):
+        return self.rng.choice(self.task_ids) if self.task_ids else None
+
+
+def dashboard(s):
+    return s.get('/dashboard')
+
+
+def dashboard_subject(s):
+    return s.get('/dashboard?' + urllib.parse.urlencode({'subject': s.rng.choice(s.user['subjects'] or ['all'])}))
+
+
+def dashboard_search(s):
+    return s.get('/dashboard?' + urllib.parse.urlencode({'search': s.rng.choice(SEARCH_WORDS)}))
+
+
+def calendar(s):
+    month = date.today() + timedelta(days=s.rng.choice([-31, 0, 0, 31]))
+    return s.get(f'/calendar?year={month.year}&month={month.month}')
+
+
+def study_stats(s):
+    return s.get('/study_stats')
+
+
+def export_txt(s):
+    return s.get('/export/txt')
+
+
+def create_task(s):
+    due = date.today() + timedelta(days=s.rng.randint(0, 30))
+    return s.client.request('POST', '/api/v1/tasks', json_body={
+        'title': f'Load test task {s.rng.randint(1, 10 ** 6)}', 'due_date': due.isoformat(),
+        'priority': s.rng.choice(['high', 'medium', 'low'])})
+
+
+def complete_task(s):
+    task_id = s.some_task()
+    if task_id is None:
+        return s.refresh_task_ids()
+    s.task_ids.remove(task_id)
+    return s.client.request('POST', f'/api/v1/tasks/{task_id}/complete')
+
+
+def add_note(s):
+    task_id = s.some_task()
+    if task_id is None:
+        return s.refresh_task_ids()
+    return s.client.request('POST', f'/api/v1/tasks/{task_id}/notes', json_body={'note_text': 'Load test progress'})
+
+
+def save_study_session(s):
+    return s.client.request('POST', '/save_study_session',
+                            data={'duration': '25', 'session_type': 'focus', 'notes': ''})
+
+
+# (route name, weight, step); roughly a browsing session with one write in five
+MIX = [
+    ('dashboard', 30, dashboard),
+    ('dashboard?subject', 10, dashboard_subject),
+    ('dashboard?search', 10, dashboard_search),
+    ('calendar', 10, calendar),
+    ('study_stats', 10, study_stats),
+    ('export/txt', 5, export_txt),
+    ('api create task', 8, create_task),
+    ('api complete task', 7, complete_task),
+    ('api add note', 5, add_note),
+    ('save_study_session', 5, save_study_session),
+]
+
+
+def pick_users(count, prefix, seed):
+    """count generated users (with their subject names), spread over the whole set"""
+    conn = connect()
+    try:
+        users = queries.fetch_all(conn, 'SELECT id, username FROM users WHERE username LIKE ? ORDER BY id',
+                                  (prefix + '%',))
+        if len(users) < count:
+            raise SystemExit(f"Need {count} users named {prefix}*, found {len(users)} - run generate_data.py")
+        users = random.Random(seed).sample(users, count)
+        for user in users:
+            user['subjects'] = [subject['name'] for subject in queries.list_subjects(conn, user['id'])]
+        return users
+    finally:
+        conn.close()
+
+
+def study_mismatches(users):
+    """Study rollup and streak rows of these users that disagree with their study_sessions"""
+    conn = connect()
+    try:
+        return [problem for user in users for problem in study.mismatches(conn, user['id'])]
+    finally:
+        conn.close()
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def run(users, seconds, warmup, base_url=None, seed=None):
+    """{route: {'latencies': [...], 'errors': n}} over seconds, after warmup seconds"""
+    results = defaultdict(lambda: {'latencies': [], 'errors': 0})
+    lock = threading.Lock()
+    names, weights, steps = zip(*MIX)
+    start = time.perf_counter()
+    record_from, deadline = start + warmup, start + warmup + seconds
+
+    def client_loop(index, user):
+        rng = random.Random(None if seed is None else seed + index)
+        client = HttpClient(user, base_url) if base_url else InProcessClient(user)
+        session = Session(client, user, rng)
+        session.refresh_task_ids()
+        while True:
+            i = rng.choices(range(len(MIX)), weights)[0]
+            began = time.perf_counter()
+            if began >= deadline:
+                return
+            status, _ = steps[i](session)
+            elapsed = time.perf_counter() - began
+            if began >= record_from:
+                with lock:
+                    results[names[i]]['latencies'].append(elapsed)
+                    # Writes through form routes answer with a redirect
+                    if status >= 400:
+                        results[names[i]]['errors'] += 1
+
+    if not base_url:
+        from app import create_app
+        create_app()  # once, before the client threads
+    threads = [threading.Thread(target=client_loop, args=(i, user)) for i, user in enumerate(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(results, seconds):
+    summary = {}
+    for name, _, _ in MIX:
+        latencies = sorted(results[name]['latencies'])
+        summary[name] = {
+            'requests': len(latencies),
+            'rps': len(latencies) / seconds,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'errors': results[name]['errors'],
+        }
+    everything = sorted(latency for result in results.values() for latency in result['latencies'])
+    summary['total'] = {
+        'requests': len(everything),
+        'rps': len(everything) / seconds,
+        'p50_ms': percentile(everything, 0.50) * 1000,
+        'p95_ms': percentile(everything, 0.95) * 1000,
+        'p99_ms': percentile(everything, 0.99) * 1000,
+        'errors': sum(result['errors'] for result in results.values()),
+    }
+    return summary
+
+
+def change(new, old):
+    return f"{(new - old) / old * 100:+.0f}%" if old else 'n/a'
+
+
+def print_summary(summary, baseline=None):
+    header = f"{'route':<20}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+    if baseline:
+        header += f"{'req/s':>9}{'p95':>8}"
+    print(header)
+    for name, row in summary.items():
+        line = (f"{name:<20}{row['requests']:>9}{row['rps']:>9.1f}{row['p50_ms']:>9.2f}"
+                f"{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}{row['errors']:>8}")
+        if baseline and name in baseline:
+            line += f"{change(row['rps'], baseline[name]['rps']):>9}{change(row['p95_ms'], baseline[name]['p95_ms']):>8}"
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=4, help='concurrent users')
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3, help='seconds run before recording starts')
+    parser.add_argument('--url', help='base URL of a running server (default: in-process)')
+    parser.add_argument('--prefix', default='load', help='username prefix of the generated users')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='show the change against a file written by --save')
+    args = parser.parse_args()
+
+    users = pick_users(args.clients, args.prefix, args.seed)
+    summary = summarize(run(users, args.seconds, args.warmup, args.url, args.seed), args.seconds)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['routes']
+    print(f"{args.clients} clients, {args.seconds:g}s {'against ' + args.url if args.url else 'in-process'}")
+    print_summary(summary, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'clients': args.clients, 'seconds': args.seconds, 'url': args.url, 'routes': summary}, f, indent=1)
+
+    problems = study_mismatches(users)
+    for problem in problems[:20]:
+        print(f"MISMATCH {problem}")
+    if problems:
+        sys.exit(1)
+    print("Study totals and streaks match study_sessions")
@@ -0,0 +1,87 @@
+"""/dashboard render time and bytes on the wire, per cache backend.
+
+One user gets --tasks tasks; the dashboard shows its first page of them.
+For each cache backend it times a request right after a write (the user's
+cache version just moved, so everything is rebuilt) and repeat requests
+with nothing changed. Bytes are the page itself, plus on a first visit the
+stylesheets and scripts it links (repeat visits have those cached).
+
+    python benchmarks/render.py --tasks 2000
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ.setdefault('DIALOGFLOW_WARMUP', '0')
+
+ASSET_LINK = re.compile(r'<(?:link[^>]+href|script[^>]+src)="(/static/[^"]+)"')
+
+
+def seed(tasks):
+    import db
+    from migrations import migrate
+    conn = db.connect_sqlite()
+    migrate(conn)
+    conn.execute("INSERT INTO users (username, email, password) VALUES ('bench', 'bench@example.com', 'x')")
+    conn.execute("INSERT INTO subjects (user_id, name, color) VALUES (1, 'Math', '#2196F3')")
+    today = date.today()
+    conn.executemany(
+        'INSERT INTO tasks (user_id, subject_id, title, description, due_date, priority, last_note, note_count) '
+        'VALUES (1, 1, ?, ?, ?, ?, ?, 1)',
+        [(f'Task {i}', 'Read the chapter and write a one-page summary',
+          (today + timedelta(days=i % 30 - 5)).isoformat(), ('high', 'medium', 'low')[i % 3], f'Note {i}')
+         for i in range(tasks)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def per_request(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    seed(args.tasks)
+    import cache
+    from app import create_app
+    app = create_app()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['username'] = 'bench'
+
+    def dashboard():
+        response = client.get('/dashboard')
+        assert response.status_code == 200
+        return response
+
+    def after_write():
+        cache.get_cache().invalidate(1)
+        return dashboard()
+
+    page = dashboard().data
+    assets = sum(len(client.get(url).data) for url in set(ASSET_LINK.findall(page.decode())))
+
+    print(f"{args.tasks} tasks, {args.repeat} requests each")
+    print(f"{'cache':<8}{'after write ms':>16}{'repeat ms':>12}{'page bytes':>12}{'first visit bytes':>19}")
+    for backend in ('none', 'memory'):
+        cache._cache, cache._cache_pid = cache.UserCache(cache.make_backend(backend)), os.getpid()
+        dashboard()
+        cold = per_request(after_write, args.repeat)
+        warm = per_request(dashboard, args.repeat)
+        print(f"{backend:<8}{cold * 1000:>16.2f}{warm * 1000:>12.2f}{len(page):>12}{len(page) + assets:>19}")
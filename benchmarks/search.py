@@ -0,0 +1,107 @@
+"""Dashboard search: LIKE '%term%' scan vs the full-text index.
+
+Builds a SQLite database per size, then times the dashboard's filtered
+count query with both filters, plus the ranked search_tasks() query.
+By default every task belongs to one heavy user, since LIKE has to scan all
+of that user's rows; use --users to spread the tasks out.
+
+    python benchmarks/search.py --sizes 10000,100000,1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import queries  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+BATCH = 10000
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'vo', 'si', 'pe', 'da', 'zu', 'gor', 'lin', 'tor', 'ash']
+
+
+def make_vocabulary(rng, size=5000):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def build(path, size, users, rng, vocabulary):
+    conn = db.connect_sqlite(path, 'production')
+    migrate(conn)
+    conn.executemany('INSERT INTO users (username, email, password) VALUES (?, ?, ?)',
+                     [(f'user{i}', f'user{i}@example.com', 'x') for i in range(users)])
+    text = lambda n: ' '.join(rng.choice(vocabulary) for _ in range(n))
+    for start in range(0, size, BATCH):
+        count = min(BATCH, size - start)
+        conn.executemany(
+            'INSERT INTO tasks (user_id, title, description, due_date, priority) VALUES (?, ?, ?, ?, ?)',
+            [(rng.randint(1, users), text(4), text(20), '2026-01-01', 'medium')
+             for _ in range(count)]
+        )
+        # Roughly one progress note per four tasks
+        conn.executemany(
+            'INSERT INTO task_history (task_id, user_id, note_text) VALUES (?, ?, ?)',
+            [(task_id, rng.randint(1, users), text(12))
+             for task_id in rng.sample(range(start + 1, start + count + 1), count // 4)]
+        )
+        conn.commit()
+    # Planner statistics, as a long-running database would have
+    conn.execute('ANALYZE')
+    return conn
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def bench(conn, terms, users, repeat):
+    def counts(use_fts):
+        def run():
+            for term in terms:
+                user_id = 1 + hash(term) % users
+                clause, params = queries.search_filter(conn, user_id, term, use_fts=use_fts)
+                queries.fetch_one(conn, queries.SQL['task_counts'].format(filters=clause), [user_id] + params)
+        return run
+
+    def ranked():
+        for term in terms:
+            queries.search_tasks(conn, 1 + hash(term) % users, term, limit=10)
+
+    n = len(terms)
+    return {
+        'like': timed(counts(False), repeat) / n,
+        'fts': timed(counts(True), repeat) / n,
+        'ranked': timed(ranked, repeat) / n,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000', help='comma-separated task counts')
+    parser.add_argument('--users', type=int, default=1, help='users sharing the tasks')
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    vocabulary = make_vocabulary(rng)
+    # Mix of whole words and prefixes, as typed into the search box
+    terms = [rng.choice(vocabulary) for _ in range(args.queries // 2)]
+    terms += [rng.choice(vocabulary)[:-1] for _ in range(args.queries - len(terms))]
+
+    print(f"{'tasks':>10}{'LIKE ms/query':>16}{'FTS ms/query':>16}{'ranked ms/query':>18}{'speedup':>10}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        path = os.path.join(tempfile.mkdtemp(), 'search.db')
+        conn = build(path, size, args.users, rng, vocabulary)
+        r = bench(conn, terms, args.users, args.repeat)
+        print(f"{size:>10}{r['like']:>16.2f}{r['fts']:>16.2f}{r['ranked']:>18.2f}{r['like'] / r['fts']:>9.1f}x")
+        conn.close()
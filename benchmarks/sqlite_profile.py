@@ -0,0 +1,111 @@
+"""Mixed read/write throughput of the SQLite backend, per connection profile.
+
+Several processes (standing in for gunicorn workers) share one database file.
+Each one loops over dashboard reads and study-session / note writes, the same
+statements the routes run. Lock errors are counted instead of aborting.
+
+    python benchmarks/sqlite_profile.py --workers 4 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import queries  # noqa: E402
+import study  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+USERS = 20
+TASKS_PER_USER = 200
+
+
+def seed(path):
+    conn = db.connect_sqlite(path, 'default')
+    migrate(conn)
+    conn.executemany(
+        'INSERT INTO users (username, email, password) VALUES (?, ?, ?)',
+        [(f'user{i}', f'user{i}@example.com', 'x') for i in range(USERS)]
+    )
+    today = date.today()
+    conn.executemany(
+        'INSERT INTO tasks (user_id, title, description, due_date, priority) VALUES (?, ?, ?, ?, ?)',
+        [(u + 1, f'Task {t}', 'Benchmark task', (today + timedelta(days=t % 60 - 30)).isoformat(),
+          random.choice(['high', 'medium', 'low']))
+         for u in range(USERS) for t in range(TASKS_PER_USER)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def worker(path, profile, seconds, write_ratio, results):
+    conn = db.connect_sqlite(path, profile)
+    rng = random.Random(os.getpid())
+    reads = writes = locked = 0
+    deadline = time.perf_counter() + seconds
+    today = date.today()
+    while time.perf_counter() < deadline:
+        user_id = rng.randint(1, USERS)
+        try:
+            if rng.random() < write_ratio:
+                if rng.random() < 0.5:
+                    study.record_session(conn, user_id, None, 25, 'bench', 'focus')
+                else:
+                    queries.add_task_note(conn, user_id, rng.randint(1, USERS * TASKS_PER_USER), 'bench note')
+                conn.commit()
+                writes += 1
+            else:
+                queries.list_task_page(conn, user_id, today)
+                reads += 1
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            conn.rollback()
+            locked += 1
+    conn.close()
+    results.put((reads, writes, locked))
+
+
+def run(profile, workers, seconds, write_ratio):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    seed(path)
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, args=(path, profile, seconds, write_ratio, results))
+             for _ in range(workers)]
+    for p in procs:
+        p.start()
+    totals = [0, 0, 0]
+    for _ in procs:
+        for i, value in enumerate(results.get()):
+            totals[i] += value
+    for p in procs:
+        p.join()
+    reads, writes, locked = totals
+    return {
+        'profile': profile,
+        'reads/s': reads / seconds,
+        'writes/s': writes / seconds,
+        'ops/s': (reads + writes) / seconds,
+        'lock errors': locked,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"{args.workers} workers, {args.seconds:g}s each, {args.write_ratio:.0%} writes")
+    print(f"{'profile':<12}{'reads/s':>12}{'writes/s':>12}{'ops/s':>12}{'lock errors':>14}")
+    for profile in db.SQLITE_PROFILES:
+        r = run(profile, args.workers, args.seconds, args.write_ratio)
+        print(f"{r['profile']:<12}{r['reads/s']:>12.0f}{r['writes/s']:>12.0f}{r['ops/s']:>12.0f}{r['lock errors']:>14}")
@@ -0,0 +1,147 @@
+"""Worker boot time and memory, with and without gunicorn's preload_app.
+
+Runs a stand-in gunicorn master per mode and forks --workers workers from it:
+
+  per-worker  the master imports nothing; each worker imports the app and
+              runs create_app() itself (preload_app = False)
+  preload     the master imports the app, runs create_app(), preloads the
+              Dialogflow libraries and calls gc.freeze(), as gunicorn.conf.py
+              does; workers inherit all of that
+
+Every worker then runs warm_up() (and, when the Google libraries are
+installed, builds the Dialogflow client). Memory comes from
+/proc/<pid>/smaps_rollup, so this needs Linux. RSS counts pages shared with
+the master in full. PSS splits shared pages between the processes using
+them. "private" is what the worker alone holds.
+
+    python benchmarks/startup.py --workers 4
+"""
+import argparse
+import gc
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+MODES = ('per-worker', 'preload')
+
+
+def chatbot_installed():
+    try:
+        from importlib.util import find_spec
+        return find_spec('google.cloud.dialogflow') is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def memory_kb(pid):
+    """{'rss', 'pss', 'private'} in KiB for a process"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {'rss': fields['Rss'], 'pss': fields['Pss'],
+            'private': fields['Private_Clean'] + fields['Private_Dirty']}
+
+
+def boot(timings):
+    """Import the app and run create_app(), recording how long each took"""
+    start = time.perf_counter()
+    import app
+    timings['import_ms'] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    app.create_app()
+    timings['create_app_ms'] = (time.perf_counter() - start) * 1000
+    return app
+
+
+def worker(preloaded, report, done):
+    """Body of one forked worker: boot if needed, warm up, report, wait to be measured"""
+    timings = {}
+    start = time.perf_counter()
+    app = sys.modules['app'] if preloaded else boot(timings)
+    warm_start = time.perf_counter()
+    app.warm_up()
+    if chatbot_installed():
+        import dialogflow_client
+        dialogflow_client.warm_up()
+    now = time.perf_counter()
+    timings['warm_up_ms'] = (now - warm_start) * 1000
+    timings['ready_ms'] = (now - start) * 1000
+    os.write(report, (json.dumps(timings) + '\n').encode())
+    os.read(done, 1)
+    os._exit(0)
+
+
+def master(mode, workers):
+    """Run one mode (in its own process) and print its results as JSON"""
+    master_timings = {}
+    if mode == 'preload':
+        boot(master_timings)
+        import dialogflow_client
+        dialogflow_client.preload()
+        gc.freeze()
+
+    report_r, report_w = os.pipe()
+    done_r, done_w = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            worker(mode == 'preload', report_w, done_r)
+        pids.append(pid)
+
+    with os.fdopen(report_r) as reports:
+        results = [json.loads(reports.readline()) for _ in pids]
+    # Every worker is ready and waiting: measure them together, so shared pages are split fairly
+    for pid, result in zip(pids, results):
+        result.update(memory_kb(pid))
+    print(json.dumps({'master': dict(master_timings, **memory_kb(os.getpid())), 'workers': results}))
+    os.write(done_w, b'x' * workers)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+
+def average(rows, key):
+    return sum(row.get(key, 0) for row in rows) / len(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        master(args.mode, args.workers)
+        sys.exit()
+
+    # A scratch copy of the database, so create_app() migrates that one
+    env = dict(os.environ, DIALOGFLOW_WARMUP='0')
+    if 'DATABASE_URL' not in env:
+        scratch = os.path.join(tempfile.mkdtemp(), 'startup.db')
+        source = os.path.join(ROOT, env.get('SQLITE_PATH', 'student_tasks.db'))
+        if os.path.exists(source):
+            shutil.copy(source, scratch)
+        env['SQLITE_PATH'] = scratch
+
+    print(f"{args.workers} workers, Dialogflow libraries {'included' if chatbot_installed() else 'not installed'}")
+    print(f"{'mode':<12}{'master MB':>10}{'import ms':>11}{'ready ms':>10}"
+          f"{'RSS MB':>9}{'PSS MB':>9}{'private MB':>12}  (per worker, averaged)")
+    for mode in MODES:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--mode', mode,
+                                 '--workers', str(args.workers)],
+                                cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+        run = json.loads(output.strip().splitlines()[-1])
+        rows = run['workers']
+        import_ms = run['master'].get('import_ms', 0) + average(rows, 'import_ms')
+        print(f"{mode:<12}{run['master']['rss'] / 1024:>10.1f}{import_ms:>11.1f}{average(rows, 'ready_ms'):>10.1f}"
+              f"{average(rows, 'rss') / 1024:>9.1f}{average(rows, 'pss') / 1024:>9.1f}"
+              f"{average(rows, 'private') / 1024:>12.1f}")
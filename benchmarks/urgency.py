@@ -0,0 +1,95 @@
+"""Urgency classes for a 10k-row task list: per-row strptime vs one batch.
+
+Times three things for --rows tasks due around today:
+- classify only: the old get_urgency_class() per row, vs Urgency.classify()
+- render task_item.html for every row: the template calling the old function
+  (twice per row, as it did), vs reading the precomputed task.urgency_class
+
+    python benchmarks/urgency.py --rows 10000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('AUTO_MIGRATE', '0')
+os.environ.setdefault('DIALOGFLOW_WARMUP', '0')
+
+from urgency import Urgency  # noqa: E402
+
+
+def get_urgency_class(due_date_str):
+    """The per-row classifier the templates used to call"""
+    if not due_date_str:
+        return ''
+    try:
+        due_date = datetime.strptime(due_date_str, '%Y-%m-%d').date()
+        today = datetime.now().date()
+        tomorrow = today + timedelta(days=1)
+        if due_date < today:
+            return 'urgent-overdue'
+        elif due_date == today:
+            return 'urgent-today'
+        elif due_date == tomorrow:
+            return 'urgent-tomorrow'
+        else:
+            return ''
+    except:  # noqa: E722
+        return ''
+
+
+def make_tasks(rows):
+    today = date.today()
+    return [{
+        'id': i, 'title': f'Task {i}', 'description': 'Read chapter 4', 'priority': 'medium',
+        'due_date': (today + timedelta(days=i % 9 - 3)).isoformat(), 'completed': i % 5 == 0,
+        'subject_name': 'Math', 'subject_color': '#2196F3', 'last_note': None, 'note_count': 0,
+        'notes_updated_at': None,
+    } for i in range(rows)]
+
+
+def best_of(fn, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+
+    tasks = make_tasks(args.rows)
+    urgency = Urgency(date.today())
+    old_classes = [get_urgency_class(task['due_date']) for task in tasks]
+    assert [task['urgency_class'] for task in urgency.classify(make_tasks(args.rows))] == old_classes
+
+    source = app.jinja_loader.get_source(app.jinja_env, 'task_item.html')[0]
+    new_template = app.jinja_env.from_string(source)
+    old_template = app.jinja_env.from_string(source.replace('task.urgency_class', 'get_urgency_class(task.due_date)'))
+
+    def render_old():
+        return ''.join(old_template.render(task=task, get_urgency_class=get_urgency_class) for task in tasks)
+
+    def render_new():
+        return ''.join(new_template.render(task=task) for task in Urgency(date.today()).classify(tasks))
+
+    with app.test_request_context():
+        results = [
+            ('classify', best_of(lambda: [get_urgency_class(task['due_date']) for task in tasks]),
+             best_of(lambda: Urgency(date.today()).classify(tasks))),
+            ('render', best_of(render_old), best_of(render_new)),
+        ]
+
+    print(f"{args.rows} rows")
+    print(f"{'step':<10}{'per-row ms':>12}{'batch ms':>12}{'speedup':>10}")
+    for name, old, new in results:
+        print(f"{name:<10}{old * 1000:>12.1f}{new * 1000:>12.1f}{old / new:>9.1f}x")
@@ -0,0 +1,279 @@
+import logging
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+# Cache settings (override with environment variables on Render)
+# CACHE_BACKEND is "memory" (this process only), "redis" (shared by every
+# gunicorn worker, needs the redis package) or "none".
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+# "local://" gives the redis backend an in-process stand-in instead of a server
+CACHE_URL = os.environ.get('CACHE_URL', 'redis://localhost:6379/0')
+CACHE_TTL = float(os.environ.get('CACHE_TTL', 300))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 5000))
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 32 * 1024 * 1024))
+CACHE_PREFIX = os.environ.get('CACHE_PREFIX', 'stm')
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """LRU cache in this process, bounded by entry count and total bytes"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, payload)
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, payload = entry
+            if expires_at <= self.clock():
+                self._remove(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def set(self, key, payload, ttl):
+        size = len(key) + len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self.clock() + ttl, payload)
+            self.bytes += size
+            # Drop least recently used entries until both bounds hold
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def version(self, user_id):
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_id):
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def stats(self):
+        return {
+            'backend': self.name,
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def _remove(self, key):
+        _, payload = self._entries.pop(key)
+        self.bytes -= len(key) + len(payload)
+
+
+class LocalRedis:
+    """The few redis-py client calls RedisBackend uses, kept in this process (for tests)"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._data = {}  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= self.clock():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None, nx=False):
+        if isinstance(value, str):
+            value = value.encode()
+        with self._lock:
+            if nx and key in self._data:
+                return None
+            self._data[key] = (self.clock() + ex if ex else None, value)
+            return True
+
+    def info(self, section=None):
+        return {'used_memory': sum(len(key) + len(value) for key, (_, value) in self._data.items())}
+
+
+class RedisBackend:
+    """Cache shared by every worker through redis (or a LocalRedis stand-in)"""
+
+    name = 'redis'
+
+    def __init__(self, url=CACHE_URL):
+        if url.startswith('local://'):
+            self.client = LocalRedis()
+        else:
+            import redis
+            self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, payload, ttl):
+        self.client.set(key, payload, ex=max(int(ttl), 1))
+
+    def version(self, user_id):
+        # Versions are random tokens rather than counters: if redis evicts
+        # one, the replacement can never match a key written before
+        key = f'{CACHE_PREFIX}:version:{user_id}'
+        token = self.client.get(key)
+        if token is None:
+            self.client.set(key, uuid.uuid4().hex, nx=True)
+            token = self.client.get(key)
+        return token.decode()
+
+    def bump(self, user_id):
+        self.client.set(f'{CACHE_PREFIX}:version:{user_id}', uuid.uuid4().hex)
+
+    def stats(self):
+        return {'backend': self.name, 'bytes': self.client.info('memory').get('used_memory')}
+
+
+class NullBackend:
+    """Caching turned off: every read is a miss"""
+
+    name = 'none'
+
+    def get(self, key):
+        return None
+
+    def set(self, key, payload, ttl):
+        pass
+
+    def version(self, user_id):
+        return 0
+
+    def bump(self, user_id):
+        pass
+
+    def stats(self):
+        return {'backend': self.name}
+
+
+class UserCache:
+    """Per-user read cache.
+
+    Every key includes the user's current version, so bumping the version
+    after a write makes all of that user's older entries unreachable.
+    """
+
+    def __init__(self, backend, ttl=CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = Counter()
+        self.misses = Counter()
+        self.invalidations = 0
+
+    def get_or_compute(self, user_id, name, key, compute):
+        """Return the cached value for (name, key), calling compute() on a miss"""
+        version = self.backend.version(user_id)
+        full_key = f'{CACHE_PREFIX}:{user_id}:{version}:{name}:{key!r}'
+        payload = self.backend.get(full_key)
+        if payload is not None:
+            self.hits[name] += 1
+            return pickle.loads(payload)
+        self.misses[name] += 1
+        value = compute()
+        self.backend.set(full_key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self.ttl)
+        return value
+
+    def invalidate(self, user_id):
+        """Call after committing a change to the user's data"""
+        self.backend.bump(user_id)
+        self.invalidations += 1
+
+    def stats(self):
+        hits = sum(self.hits.values())
+        lookups = hits + sum(self.misses.values())
+        pages = {}
+        for name in sorted(set(self.hits) | set(self.misses)):
+            page_lookups = self.hits[name] + self.misses[name]
+            pages[name] = {
+                'hits': self.hits[name],
+                'misses': self.misses[name],
+                'hit_ratio': round(self.hits[name] / page_lookups, 4),
+            }
+        stats = {
+            'hits': hits,
+            'misses': lookups - hits,
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'ttl': self.ttl,
+            'pages': pages,
+        }
+        stats.update(self.backend.stats())
+        return stats
+
+
+def several_workers():
+    """Whether this server runs more than one worker process.
+
+    WEB_CONCURRENCY says so when set: gunicorn.conf.py sets it from the
+    worker count, and uvicorn takes its worker count from it. Otherwise a
+    process started by multiprocessing is taken for one of
+    `uvicorn --workers N`'s workers (--reload starts just one).
+    """
+    workers = os.environ.get('WEB_CONCURRENCY')
+    if workers:
+        return int(workers) > 1
+    return multiprocessing.parent_process() is not None and '--reload' not in sys.argv
+
+
+def make_backend(name=None):
+    name = name or CACHE_BACKEND
+    if name == 'memory':
+        # Each worker would keep its own versions, so a write handled by one
+        # worker could leave another serving stale pages
+        if several_workers():
+            logger.warning("CACHE_BACKEND=memory is per-process; caching disabled with several workers (use redis)")
+            return NullBackend()
+        return MemoryBackend()
+    if name == 'redis':
+        return RedisBackend()
+    if name == 'none':
+        return NullBackend()
+    raise ValueError(f"Unknown CACHE_BACKEND {name!r}")
+
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return this process's cache, creating it after a gunicorn fork"""
+    global _cache, _cache_pid
+    pid = os.getpid()
+    if _cache is None or _cache_pid != pid:
+        with _cache_lock:
+            if _cache is None or _cache_pid != pid:
+                _cache = UserCache(make_backend())
+                _cache_pid = pid
+    return _cache
@@ -0,0 +1,243 @@
+import os
+import sqlite3
+import threading
+import time
+from queue import Queue, Empty
+
+from flask import g
+
+from metrics import InstrumentedConnection
+
+# Connection settings (override with environment variables on Render)
+DATABASE_URL = os.environ.get('DATABASE_URL')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'student_tasks.db')
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+# Connections each worker opens at boot (app.warm_up), before its first request
+POOL_PREFILL = int(os.environ.get('DB_POOL_PREFILL', POOL_SIZE))
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'default')
+
+# Per-connection SQLite settings. "production" is meant for several gunicorn
+# workers sharing one database file: WAL lets readers run alongside the single
+# writer, and the busy timeout makes writers queue instead of failing with
+# "database is locked".
+SQLITE_PROFILES = {
+    'default': {
+        'timeout': 5.0,
+        'cached_statements': 128,
+        'pragmas': {},
+    },
+    'production': {
+        'timeout': float(os.environ.get('SQLITE_BUSY_TIMEOUT', 15)),
+        'cached_statements': int(os.environ.get('SQLITE_STATEMENT_CACHE', 512)),
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': int(float(os.environ.get('SQLITE_BUSY_TIMEOUT', 15)) * 1000),
+            # Negative cache_size is in KiB
+            'cache_size': -int(os.environ.get('SQLITE_CACHE_KB', 20000)),
+            'mmap_size': int(os.environ.get('SQLITE_MMAP_BYTES', 256 * 1024 * 1024)),
+            'temp_store': 'MEMORY',
+        },
+    },
+}
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up in time"""
+
+
+class ConnectionPool:
+    """Fixed-size pool of open database connections"""
+
+    def __init__(self, connect, size=POOL_SIZE, timeout=POOL_TIMEOUT, is_usable=None):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.is_usable = is_usable or (lambda conn: True)
+        self._idle = Queue()
+        self._lock = threading.Lock()
+        self._created = 0
+        # Counters reported by stats()
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def acquire(self):
+        """Take an idle connection, open a new one, or wait for one to be released"""
+        start = time.perf_counter()
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                conn = None
+
+            if conn is None:
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        conn = self.connect()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                    self.misses += 1
+                    return conn
+
+                # Pool exhausted - wait for another request to give one back
+                self.waits += 1
+                remaining = self.timeout - (time.perf_counter() - start)
+                try:
+                    conn = self._idle.get(timeout=max(remaining, 0))
+                except Empty:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                self._record_wait(time.perf_counter() - start)
+
+            if not self.is_usable(conn):
+                self._discard(conn)
+                continue
+
+            self.hits += 1
+            return conn
+
+    def release(self, conn):
+        """Reset a connection and hand it back to the pool"""
+        try:
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def fill(self, count=None):
+        """Open connections up front (up to count, default the pool size) and leave them idle"""
+        count = self.size if count is None else min(count, self.size)
+        conns = []
+        try:
+            for _ in range(count):
+                conns.append(self.acquire())
+        finally:
+            for conn in conns:
+                self.release(conn)
+        return len(conns)
+
+    def close_all(self):
+        """Close every idle connection (used on shutdown and after fork)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        acquisitions = self.hits + self.misses
+        return {
+            'size': self.size,
+            'open': self._created,
+            'idle': self._idle.qsize(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / acquisitions, 4) if acquisitions else 0.0,
+            'waits': self.waits,
+            'timeouts': self.timeouts,
+            'discarded': self.discarded,
+            'wait_seconds_total': round(self.wait_seconds, 6),
+            'wait_seconds_max': round(self.max_wait_seconds, 6),
+        }
+
+    def _record_wait(self, seconds):
+        self.wait_seconds += seconds
+        if seconds > self.max_wait_seconds:
+            self.max_wait_seconds = seconds
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created -= 1
+        self.discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def connect_sqlite(path=None, profile=None):
+    """Open a SQLite connection with the settings from SQLITE_PROFILES"""
+    settings = SQLITE_PROFILES[profile or SQLITE_PROFILE]
+    # Connections move between threads via the pool, but only one request uses each at a time
+    conn = sqlite3.connect(path or SQLITE_PATH,
+                           timeout=settings['timeout'],
+                           cached_statements=settings['cached_statements'],
+                           check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for pragma, value in settings['pragmas'].items():
+        conn.execute(f'PRAGMA {pragma} = {value}')
+    return conn
+
+
+def _connect_sqlite():
+    return connect_sqlite()
+
+
+def _connect_postgres():
+    import psycopg2
+    return psycopg2.connect(DATABASE_URL)
+
+
+def connect():
+    """Open a new unpooled connection (for scripts and the CLI)"""
+    if DATABASE_URL:
+        return _connect_postgres()
+    return _connect_sqlite()
+
+
+def _postgres_usable(conn):
+    return not conn.closed
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return this process's pool, creating it after a gunicorn fork"""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                if DATABASE_URL:
+                    _pool = ConnectionPool(_connect_postgres, is_usable=_postgres_usable)
+                else:
+                    _pool = ConnectionPool(_connect_sqlite)
+                _pool_pid = pid
+    return _pool
+
+
+def get_db_connection():
+    """Return the connection bound to the current app context"""
+    if 'db_conn' not in g:
+        # Wrapped so /metrics can count and time the request's statements
+        g.db_conn = InstrumentedConnection(get_pool().acquire())
+    return g.db_conn
+
+
+def close_db_connection(exception=None):
+    """Give the request's connection back to the pool (at teardown, or early before a long wait)"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_pool().release(conn.raw_connection)
+        g.db_conn_released = conn  # keeps its statement counts for /metrics
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db_connection)
@@ -0,0 +1,213 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# Dialogflow settings (override with environment variables on Render)
+DIALOGFLOW_PROJECT_ID = os.environ.get('DIALOGFLOW_PROJECT_ID', 'studenttaskbot-yoce')
+DIALOGFLOW_CREDENTIALS = os.environ.get('DIALOGFLOW_CREDENTIALS', 'studenttaskbot-yoce-5d14b6c469b5.json')
+# "google" talks to Dialogflow; "local" uses LocalSessionsClient (for tests and offline work)
+DIALOGFLOW_BACKEND = os.environ.get('DIALOGFLOW_BACKEND', 'google')
+# Per-attempt deadline, retries after a transient failure, and the most a request waits overall
+DIALOGFLOW_TIMEOUT = float(os.environ.get('DIALOGFLOW_TIMEOUT', 5))
+DIALOGFLOW_RETRIES = int(os.environ.get('DIALOGFLOW_RETRIES', 2))
+DIALOGFLOW_RETRY_BACKOFF = float(os.environ.get('DIALOGFLOW_RETRY_BACKOFF', 0.2))
+DIALOGFLOW_WAIT = float(os.environ.get('DIALOGFLOW_WAIT', 12))
+DIALOGFLOW_WORKERS = int(os.environ.get('DIALOGFLOW_WORKERS', 4))
+# Most calls running or queued per process; past this submit() raises Busy at once
+# instead of queueing work whose users will have had the fallback reply long before it runs
+DIALOGFLOW_QUEUE = int(os.environ.get('DIALOGFLOW_QUEUE', DIALOGFLOW_WORKERS * 2))
+# Seconds each LocalSessionsClient reply takes, to stand in for a slow Dialogflow
+DIALOGFLOW_LOCAL_LATENCY = float(os.environ.get('DIALOGFLOW_LOCAL_LATENCY', 0))
+
+SETUP_INCOMPLETE = "Chatbot setup incomplete. Please configure Dialogflow credentials."
+
+
+class Busy(Exception):
+    """Raised by submit() when DIALOGFLOW_QUEUE calls are already waiting or running"""
+
+
+class LocalSessionsClient:
+    """Stand-in for dialogflow.SessionsClient that answers without the network.
+
+    ``latency`` delays each call and ``failures`` makes the first calls
+    raise ConnectionError, to exercise the deadline and retry handling.
+    """
+
+    def __init__(self, latency=0.0, failures=0):
+        self.latency = latency
+        self.failures = failures
+        self.calls = 0
+
+    def session_path(self, project, session):
+        return f"projects/{project}/agent/sessions/{session}"
+
+    def detect_intent(self, request=None, timeout=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.calls <= self.failures:
+            raise ConnectionError("LocalSessionsClient: simulated outage")
+        text = request['query_input']['text']['text']
+        return _Response(_QueryResult(f"You said: {text}"))
+
+
+class _QueryResult:
+    def __init__(self, fulfillment_text):
+        self.fulfillment_text = fulfillment_text
+
+
+class _Response:
+    def __init__(self, query_result):
+        self.query_result = query_result
+
+
+def _make_client():
+    if DIALOGFLOW_BACKEND == 'local':
+        return LocalSessionsClient(latency=DIALOGFLOW_LOCAL_LATENCY)
+    if not os.path.exists(DIALOGFLOW_CREDENTIALS):
+        return None
+    from google.cloud import dialogflow
+    from google.oauth2 import service_account
+    credentials = service_account.Credentials.from_service_account_file(DIALOGFLOW_CREDENTIALS)
+    return dialogflow.SessionsClient(credentials=credentials)
+
+
+def _retryable_errors():
+    errors = (ConnectionError, TimeoutError)
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return errors
+    return errors + (exceptions.ServiceUnavailable, exceptions.DeadlineExceeded,
+                     exceptions.InternalServerError, exceptions.TooManyRequests)
+
+
+_client = None
+_client_pid = None
+_executor = None
+_slots = threading.BoundedSemaphore(DIALOGFLOW_QUEUE)
+_lock = threading.Lock()
+
+
+def get_client():
+    """Return this process's SessionsClient (None without credentials), creating it once.
+
+    gRPC channels don't survive a fork, so each gunicorn worker builds its own.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client_pid != pid:
+        with _lock:
+            if _client_pid != pid:
+                _client = _make_client()
+                _client_pid = pid
+    return _client
+
+
+def set_client(client):
+    """Use this client (e.g. a LocalSessionsClient) instead of building one"""
+    global _client, _client_pid
+    with _lock:
+        _client = client
+        _client_pid = os.getpid()
+
+
+def get_executor():
+    """Thread pool that runs Dialogflow calls off the request thread"""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=DIALOGFLOW_WORKERS, thread_name_prefix='dialogflow')
+    return _executor
+
+
+def warm_up():
+    """Build the client and open its channel before the first chat message"""
+    try:
+        client = get_client()
+        channel = getattr(getattr(client, 'transport', None), 'grpc_channel', None)
+        if channel is not None:
+            import grpc
+            grpc.channel_ready_future(channel).result(timeout=DIALOGFLOW_TIMEOUT)
+    except Exception as e:
+        metrics.record_error(e)
+
+
+def warm_up_in_background():
+    return get_executor().submit(warm_up)
+
+
+def preload():
+    """Import the Google client libraries without connecting (in the gunicorn master).
+
+    Workers forked afterwards share those modules' memory copy-on-write and
+    skip the import; each still opens its own channel in warm_up().
+    """
+    if DIALOGFLOW_BACKEND != 'google' or not os.path.exists(DIALOGFLOW_CREDENTIALS):
+        return False
+    try:
+        from google.cloud import dialogflow  # noqa: F401
+        from google.oauth2 import service_account  # noqa: F401
+    except ImportError as e:
+        metrics.record_error(e)
+        return False
+    return True
+
+
+def detect_intent(session_id, text, language_code='en', project_id=DIALOGFLOW_PROJECT_ID, abandoned=None):
+    """Fulfillment text for one message, retrying transient errors with backoff.
+
+    Stops retrying once the abandoned Event is set (the user got a fallback reply).
+    """
+    client = get_client()
+    if client is None:
+        return SETUP_INCOMPLETE
+
+    request = {
+        'session': client.session_path(project_id, session_id),
+        'query_input': {'text': {'text': text, 'language_code': language_code}},
+    }
+    retryable = _retryable_errors()
+    for attempt in range(DIALOGFLOW_RETRIES + 1):
+        start = time.perf_counter()
+        try:
+            response = client.detect_intent(request=request, timeout=DIALOGFLOW_TIMEOUT)
+            metrics.record_external_call('dialogflow', time.perf_counter() - start, 'ok')
+            return response.query_result.fulfillment_text
+        except retryable:
+            last_attempt = attempt == DIALOGFLOW_RETRIES or (abandoned is not None and abandoned.is_set())
+            metrics.record_external_call('dialogflow', time.perf_counter() - start,
+                                         'error' if last_attempt else 'retry')
+            if last_attempt:
+                raise
+            time.sleep(DIALOGFLOW_RETRY_BACKOFF * 2 ** attempt)
+        except Exception:
+            metrics.record_external_call('dialogflow', time.perf_counter() - start, 'error')
+            raise
+
+
+def submit(session_id, text, language_code='en'):
+    """Start detect_intent on the thread pool; returns a Future (raises Busy when the queue is full)"""
+    if not _slots.acquire(blocking=False):
+        raise Busy(f"{DIALOGFLOW_QUEUE} Dialogflow calls already in progress")
+    abandoned = threading.Event()
+    try:
+        future = get_executor().submit(detect_intent, session_id, text, language_code, abandoned=abandoned)
+    except Exception:
+        _slots.release()
+        raise
+    future.abandoned = abandoned
+    # Runs when the call finishes or is cancelled, freeing its place in the queue
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def cancel(future):
+    """Give up on a submitted call: drop it if still queued, stop its retries if running"""
+    future.abandoned.set()
+    future.cancel()
+
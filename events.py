@@ -0,0 +1,314 @@
+import fnmatch
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import metrics
+from cache import several_workers
+
+# Live updates: after every commit_user_changes() the user's open pages get a
+# small change event over Server-Sent Events (/events) and patch themselves.
+# EVENTS_BACKEND is "memory" (streams in this process only), "redis" (every
+# gunicorn worker, through pub/sub; needs the redis package) or "none".
+EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND', 'memory')
+# "local://" gives the redis broker an in-process stand-in instead of a server
+EVENTS_URL = os.environ.get('EVENTS_URL', os.environ.get('CACHE_URL', 'redis://localhost:6379/0'))
+EVENTS_PREFIX = os.environ.get('EVENTS_PREFIX', 'stm')
+# Open streams per process (every tab of every user on it). Each waits on a
+# thread of its own: gunicorn.conf.py adds this many gthread threads to the
+# request threads, and asgi.py gives streams a pool this size. Past it /events
+# answers 503 and the page works without live updates, retrying a minute later.
+EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS', 16))
+# A comment line this often lets proxies (and the server) see a closed tab
+EVENTS_KEEPALIVE = float(os.environ.get('EVENTS_KEEPALIVE', 15))
+# Streams end after this long and the browser reconnects after EVENTS_RETRY_MS
+EVENTS_STREAM_SECONDS = float(os.environ.get('EVENTS_STREAM_SECONDS', 300))
+EVENTS_RETRY_MS = int(os.environ.get('EVENTS_RETRY_MS', 3000))
+EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 100))
+# A commit changing more tasks than this (a large batch) is sent as one resync
+EVENTS_MAX_CHANGES = int(os.environ.get('EVENTS_MAX_CHANGES', 50))
+
+RESYNC = [{'op': 'resync'}]
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """One open stream: the messages published for its user, in order"""
+
+    def __init__(self, user_id, owner, size=EVENTS_QUEUE_SIZE):
+        self.user_id = user_id
+        self.owner = owner
+        self._messages = queue.Queue(maxsize=size)
+        self.overflowed = False
+
+    def put(self, message):
+        try:
+            self._messages.put_nowait(message)
+        except queue.Full:
+            # A stalled reader: drop what is queued and tell it to start over
+            self.overflowed = True
+
+    def get(self, timeout):
+        """The next message, or None after timeout seconds"""
+        if self.overflowed:
+            self.overflowed = False
+            while not self._messages.empty():
+                self._messages.get_nowait()
+            return json.dumps({'v': None, 'changes': RESYNC})
+        try:
+            return self._messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.owner.remove(self)
+
+
+class Subscribers:
+    """This process's open streams by user, and the fan-out to them"""
+
+    def __init__(self, max_streams=EVENTS_MAX_STREAMS):
+        self.max_streams = max_streams
+        self._by_user = {}
+        self._lock = threading.Lock()
+        self.open = 0
+        self.rejected = 0
+        self.delivered = 0
+
+    def add(self, user_id):
+        """A new Subscription, or None when this process has max_streams open"""
+        with self._lock:
+            if self.open >= self.max_streams:
+                self.rejected += 1
+                return None
+            subscription = Subscription(user_id, self)
+            self._by_user.setdefault(user_id, set()).add(subscription)
+            self.open += 1
+            return subscription
+
+    def remove(self, subscription):
+        with self._lock:
+            streams = self._by_user.get(subscription.user_id, set())
+            if subscription in streams:
+                streams.discard(subscription)
+                self.open -= 1
+                if not streams:
+                    del self._by_user[subscription.user_id]
+
+    def deliver(self, user_id, message):
+        with self._lock:
+            streams = list(self._by_user.get(user_id, ()))
+        for subscription in streams:
+            subscription.put(message)
+        self.delivered += len(streams)
+
+    def deliver_all(self, message):
+        with self._lock:
+            streams = [subscription for subs in self._by_user.values() for subscription in subs]
+        for subscription in streams:
+            subscription.put(message)
+
+    def stats(self):
+        return {'open_streams': self.open, 'max_streams': self.max_streams,
+                'users': len(self._by_user), 'rejected': self.rejected, 'delivered': self.delivered}
+
+
+class MemoryBroker:
+    """Events reach the streams in this process only (one worker)"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self.subscribers = Subscribers()
+
+    def publish(self, user_id, message):
+        self.subscribers.deliver(user_id, message)
+
+    def subscribe(self, user_id):
+        return self.subscribers.add(user_id)
+
+    def stats(self):
+        return dict(self.subscribers.stats(), backend=self.name)
+
+
+class LocalPubSubServer:
+    """The redis pub/sub calls RedisBroker uses, kept in this process (for tests).
+
+    Module-level and shared, so several brokers in one process behave like
+    workers connected to the same redis.
+    """
+
+    def __init__(self):
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def publish(self, channel, data):
+        if isinstance(data, str):
+            data = data.encode()
+        with self._lock:
+            listeners = list(self._listeners)
+        for pattern, messages in listeners:
+            if fnmatch.fnmatchcase(channel, pattern):
+                messages.put({'type': 'pmessage', 'pattern': pattern.encode(),
+                              'channel': channel.encode(), 'data': data})
+        return len(listeners)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return _LocalPubSub(self)
+
+
+class _LocalPubSub:
+    def __init__(self, server):
+        self.server = server
+        self.messages = queue.Queue()
+
+    def psubscribe(self, pattern):
+        with self.server._lock:
+            self.server._listeners.append((pattern, self.messages))
+
+    def listen(self):
+        while True:
+            yield self.messages.get()
+
+
+_local_server = LocalPubSubServer()
+
+
+class RedisBroker:
+    """Events reach every worker through redis pub/sub (or the local stand-in).
+
+    Each process keeps one pattern subscription, read by a background thread
+    that hands messages to its own streams.
+    """
+
+    name = 'redis'
+
+    def __init__(self, url=EVENTS_URL):
+        if url.startswith('local://'):
+            self.client = _local_server
+        else:
+            import redis
+            self.client = redis.Redis.from_url(url)
+        self.subscribers = Subscribers()
+        self.reconnects = 0
+        self._listener = None
+        self._subscribed = threading.Event()
+        self._lock = threading.Lock()
+
+    def publish(self, user_id, message):
+        self.client.publish(f'{EVENTS_PREFIX}:events:{user_id}', message)
+
+    def subscribe(self, user_id):
+        self._start_listener()
+        # So events published right after this returns aren't missed
+        self._subscribed.wait(timeout=1)
+        return self.subscribers.add(user_id)
+
+    def _start_listener(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='events-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f'{EVENTS_PREFIX}:events:*')
+                self._subscribed.set()
+                for message in pubsub.listen():
+                    if message['type'] != 'pmessage':
+                        continue
+                    user_id = int(message['channel'].decode().rsplit(':', 1)[1])
+                    self.subscribers.deliver(user_id, message['data'].decode())
+            except Exception as e:
+                metrics.record_error(e)
+            # Anything published while disconnected is lost: every page starts over
+            self._subscribed.clear()
+            self.reconnects += 1
+            self.subscribers.deliver_all(json.dumps({'v': None, 'changes': RESYNC}))
+            time.sleep(1)
+
+    def stats(self):
+        return dict(self.subscribers.stats(), backend=self.name, reconnects=self.reconnects)
+
+
+class NullBroker:
+    """Live updates turned off"""
+
+    name = 'none'
+
+    def publish(self, user_id, message):
+        pass
+
+    def subscribe(self, user_id):
+        return None
+
+    def stats(self):
+        return {'backend': self.name}
+
+
+def make_broker(name=None):
+    name = name or EVENTS_BACKEND
+    if name == 'memory':
+        # A write handled by one worker would never reach streams held by another
+        if several_workers():
+            logger.warning("EVENTS_BACKEND=memory is per-process; live updates disabled with several workers (use redis)")
+            return NullBroker()
+        return MemoryBroker()
+    if name == 'redis':
+        return RedisBroker()
+    if name == 'none':
+        return NullBroker()
+    raise ValueError(f"Unknown EVENTS_BACKEND {name!r}")
+
+
+_broker = None
+_broker_pid = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Return this process's broker, creating it after a gunicorn fork"""
+    global _broker, _broker_pid
+    pid = os.getpid()
+    if _broker is None or _broker_pid != pid:
+        with _broker_lock:
+            if _broker is None or _broker_pid != pid:
+                _broker = make_broker()
+                _broker_pid = pid
+    return _broker
+
+
+def publish(user_id, version, changes, source=None):
+    """Tell user_id's open pages about a committed change (never fails the write).
+
+    version is the user's data_version after the commit; pages that see a
+    gap in the versions know they missed something and resync.
+    """
+    if len(changes) > EVENTS_MAX_CHANGES:
+        changes = RESYNC
+    message = json.dumps({'v': version, 'src': source, 'changes': changes}, default=str, separators=(',', ':'))
+    try:
+        get_broker().publish(user_id, message)
+    except Exception as e:
+        metrics.record_error(e)
+
+
+def stream(subscription, version):
+    """Server-Sent Events for one subscription, starting with the current version"""
+    try:
+        yield f"retry: {EVENTS_RETRY_MS}\nevent: hello\ndata: {json.dumps({'v': version})}\n\n"
+        deadline = time.monotonic() + EVENTS_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            message = subscription.get(timeout=min(EVENTS_KEEPALIVE, max(deadline - time.monotonic(), 0)))
+            if message is None:
+                yield ': keepalive\n\n'
+            else:
+                yield f'event: change\ndata: {message}\n\n'
+    finally:
+        subscription.close()
@@ -0,0 +1,176 @@
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+# Task exports are generators of text chunks, so a streamed Response never
+# holds more than one batch of tasks in memory.
+
+CHUNK_TASKS = 200
+CSV_COLUMNS = ['id', 'title', 'description', 'subject', 'priority', 'due_date', 'completed',
+               'note_count', 'last_note', 'created_at']
+
+
+def _batches(tasks, size=CHUNK_TASKS):
+    tasks = iter(tasks)
+    while True:
+        batch = list(islice(tasks, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _export_row(task):
+    return {
+        'id': task['id'],
+        'title': task['title'],
+        'description': task['description'],
+        'subject': task['subject_name'],
+        'priority': task['priority'],
+        'due_date': task['due_date'],
+        'completed': bool(task['completed']),
+        'note_count': task['note_count'] or 0,
+        'last_note': task['last_note'],
+        'created_at': task['created_at'],
+    }
+
+
+def txt_chunks(tasks, username, generated_at):
+    yield (f"Student Task Manager - Task List\n"
+           f"Generated on: {generated_at.strftime('%Y-%m-%d %H:%M')}\n"
+           f"User: {username}\n"
+           + "=" * 50 + "\n\n")
+    for batch in _batches(tasks):
+        lines = []
+        for task in batch:
+            status = "✅ COMPLETED" if task['completed'] else "⏳ PENDING"
+            lines.append(f"TITLE: {task['title']}\n")
+            lines.append(f"SUBJECT: {task['subject_name'] or 'No Subject'}\n")
+            lines.append(f"PRIORITY: {task['priority'].upper()} | DUE: {task['due_date'] or 'No date'} | STATUS: {status}\n")
+            if task['description']:
+                lines.append(f"DESCRIPTION: {task['description']}\n")
+            lines.append("-" * 30 + "\n")
+        yield ''.join(lines)
+
+
+def csv_chunks(tasks, username, generated_at):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+    for batch in _batches(tasks):
+        writer.writerows(_export_row(task) for task in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, when there are no tasks
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(tasks, username, generated_at):
+    for batch in _batches(tasks):
+        yield ''.join(json.dumps(_export_row(task), ensure_ascii=False) + '\n' for task in batch)
+
+
+# format -> (chunk generator, content type, file extension)
+FORMATS = {
+    'txt': (txt_chunks, 'text/plain; charset=utf-8', 'txt'),
+    'csv': (csv_chunks, 'text/csv; charset=utf-8', 'csv'),
+    'ndjson': (ndjson_chunks, 'application/x-ndjson; charset=utf-8', 'ndjson'),
+}
+
+
+# -------------------- ICS FEED --------------------
+# iCalendar (RFC 5545) for calendar apps subscribed to /calendar/feed/<token>.ics.
+# Tasks are all-day events on their due date; study sessions end at created_at.
+
+ICS_DOMAIN = 'student-task-manager'
+ICS_PRIORITY = {'high': 1, 'medium': 5, 'low': 9}
+
+
+def _ics_text(value):
+    return (str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _ics_line(line):
+    """Fold a content line at 75 octets, as the spec requires"""
+    parts = []
+    current, size, limit = '', 0, 75
+    for char in line:
+        width = len(char.encode('utf-8'))
+        if size + width > limit:
+            parts.append(current)
+            current, size, limit = '', 0, 74  # continuation lines start with a space
+        current += char
+        size += width
+    parts.append(current)
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _ics_utc(moment):
+    return moment.strftime('%Y%m%dT%H%M%SZ')
+
+
+def _task_event(task, stamp):
+    due = date.fromisoformat(str(task['due_date'])[:10])
+    title = ('✅ ' if task['completed'] else '') + task['title']
+    details = [f"Priority: {task['priority']}"]
+    if task['subject_name']:
+        details.insert(0, f"Subject: {task['subject_name']}")
+    if task['description']:
+        details.append(task['description'])
+    description = '\n'.join(details)
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:task-{task['id']}@{ICS_DOMAIN}",
+        f'DTSTAMP:{stamp}',
+        f"DTSTART;VALUE=DATE:{due.strftime('%Y%m%d')}",
+        f"DTEND;VALUE=DATE:{(due + timedelta(days=1)).strftime('%Y%m%d')}",
+        f'SUMMARY:{_ics_text(title)}',
+        f'DESCRIPTION:{_ics_text(description)}',
+        f"PRIORITY:{ICS_PRIORITY.get(task['priority'], 0)}",
+    ]
+    if task['subject_name']:
+        lines.append(f"CATEGORIES:{_ics_text(task['subject_name'])}")
+    lines.append('END:VEVENT')
+    return ''.join(_ics_line(line) for line in lines)
+
+
+def _study_event(study_session, stamp):
+    # created_at is stored in UTC when the session is saved, i.e. when it ended
+    end = datetime.fromisoformat(str(study_session['created_at']))
+    start = end - timedelta(minutes=study_session['duration_minutes'])
+    what = study_session['subject_name'] or study_session['session_type'] or 'study'
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:study-{study_session['id']}@{ICS_DOMAIN}",
+        f'DTSTAMP:{stamp}',
+        f'DTSTART:{_ics_utc(start)}',
+        f'DTEND:{_ics_utc(end)}',
+        f"SUMMARY:{_ics_text(f'📚 Study: {what}')}",
+    ]
+    if study_session['notes']:
+        lines.append(f"DESCRIPTION:{_ics_text(study_session['notes'])}")
+    lines.append('END:VEVENT')
+    return ''.join(_ics_line(line) for line in lines)
+
+
+def ics_chunks(tasks, study_sessions, username, generated_at):
+    """An iCalendar feed of tasks and study sessions; generated_at is a UTC datetime"""
+    stamp = _ics_utc(generated_at)
+    yield ''.join(_ics_line(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:-//{ICS_DOMAIN}//Task Calendar//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_ics_text(f"Student Tasks ({username})")}',
+        'X-PUBLISHED-TTL:PT1H',
+    ])
+    for batch in _batches(tasks):
+        yield ''.join(_task_event(task, stamp) for task in batch)
+    for batch in _batches(study_sessions):
+        yield ''.join(_study_event(study_session, stamp) for study_session in batch)
+    yield _ics_line('END:VCALENDAR')
@@ -0,0 +1,189 @@
+"""Fill a database with realistic synthetic accounts, for load testing.
+
+Every user gets a handful of subjects, tasks due around today (older ones
+mostly done, some with progress notes) and a few months of study sessions.
+Activity is skewed like real accounts: many light users, a few heavy ones.
+Rows go in with batched inserts and ids from queries.reserve_ids, a chunk
+of users per transaction, so millions of rows are fine on SQLite and
+PostgreSQL. The study rollup and streaks are rebuilt at the end.
+
+    python generate_data.py --users 1000
+    SQLITE_PATH=/tmp/load.db python generate_data.py --users 20000 --tasks 150 --seed 7
+
+Generated users are named <prefix><id> and log in with GENERATED_PASSWORD.
+"""
+import argparse
+import hashlib
+import math
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import queries
+import study
+from db import connect
+from migrations import migrate
+
+GENERATED_PASSWORD = 'password1'
+USERS_PER_CHUNK = 200
+
+SUBJECTS = [
+    ('Math', '#f44336'), ('Biology', '#4CAF50'), ('Chemistry', '#9C27B0'), ('Physics', '#2196F3'),
+    ('English', '#FF9800'), ('History', '#795548'), ('Computer Science', '#3F51B5'),
+    ('Economics', '#009688'), ('Psychology', '#E91E63'), ('Spanish', '#FFC107'),
+]
+TOPICS = ['photosynthesis', 'the French Revolution', 'linear algebra', 'supply and demand', 'recursion',
+          'cell division', 'thermodynamics', 'Shakespeare', 'organic reactions', 'memory models',
+          'probability', 'World War I', 'sorting algorithms', 'market structures', 'optics']
+TASK_TITLES = ['Read chapter {n}', 'Problem set {n}', 'Lab report: {topic}', 'Essay draft on {topic}',
+               'Revise for quiz {n}', 'Watch lecture {n}', 'Flashcards for unit {n}', 'Group project: {topic}',
+               'Practice exam {n}', 'Summarize notes on {topic}']
+DESCRIPTIONS = ['Due before class', 'Check the rubric first', 'Questions 1-{n}', 'Bring printed copy',
+                'Ask the TA about {topic}', 'At least {n}00 words', None, None]
+NOTES = ['Started reading, {n} pages in', 'Stuck on question {n}', 'Finished the first draft',
+         'Need help with {topic}', 'Reviewed with study group', 'Halfway there',
+         'Redid question {n} after office hours', 'Only the conclusion left']
+PRIORITIES = ['high', 'medium', 'medium', 'low']
+PASSWORD_HASH = hashlib.sha256(GENERATED_PASSWORD.encode()).hexdigest()  # as app.hash_password
+
+USER_COLUMNS = ['id', 'username', 'email', 'password', 'created_at']
+SUBJECT_COLUMNS = ['id', 'user_id', 'name', 'color']
+TASK_COLUMNS = ['id', 'user_id', 'subject_id', 'title', 'description', 'due_date', 'priority', 'completed',
+                'created_at', 'last_note', 'note_count', 'notes_updated_at']
+HISTORY_COLUMNS = ['id', 'task_id', 'user_id', 'note_text', 'created_at']
+SESSION_COLUMNS = ['id', 'user_id', 'subject_id', 'duration_minutes', 'notes', 'session_type', 'created_at']
+
+
+def skewed_count(rng, mean):
+    """A per-user row count averaging mean, with a long tail (log-normal)"""
+    if mean <= 0:
+        return 0
+    sigma = 1.0
+    return int(rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma))
+
+
+def fill(rng, template):
+    return template and template.format(n=rng.randint(1, 12), topic=rng.choice(TOPICS))
+
+
+def stamp(moment):
+    return moment.replace(microsecond=0).isoformat(sep=' ')
+
+
+class Generator:
+    """Builds the rows for one chunk of users at a time"""
+
+    def __init__(self, rng, today, tasks, notes, sessions, days, prefix):
+        self.rng = rng
+        self.today = today
+        self.now = datetime.now(timezone.utc).replace(tzinfo=None)  # stored timestamps are naive UTC
+        self.tasks = tasks
+        self.notes = notes
+        self.sessions = sessions
+        self.days = days
+        self.prefix = prefix
+
+    def chunk(self, conn, user_count):
+        """{table: (columns, rows)} for user_count new users"""
+        rng = self.rng
+        user_ids = queries.reserve_ids(conn, 'users', user_count)
+        users, subjects, tasks, history, sessions = [], [], [], [], []
+        plans = []
+        for user_id in user_ids:
+            joined = self.now - timedelta(days=rng.randint(self.days, self.days * 2), minutes=rng.randint(0, 1440))
+            users.append((user_id, f'{self.prefix}{user_id}', f'{self.prefix}{user_id}@example.com',
+                          PASSWORD_HASH, stamp(joined)))
+            picked = rng.sample(SUBJECTS, rng.randint(3, 7))
+            plans.append((user_id, picked, skewed_count(rng, self.tasks), skewed_count(rng, self.sessions)))
+
+        subject_ids = iter(queries.reserve_ids(conn, 'subjects', sum(len(plan[1]) for plan in plans)))
+        task_ids = iter(queries.reserve_ids(conn, 'tasks', sum(plan[2] for plan in plans)))
+        for user_id, picked, task_count, session_count in plans:
+            own = []
+            for name, color in picked:
+                own.append(next(subject_ids))
+                subjects.append((own[-1], user_id, name, color))
+            for _ in range(task_count):
+                tasks.append(self.task(next(task_ids), user_id, own, history))
+            for _ in range(session_count):
+                sessions.append(self.session(user_id, own))
+
+        history_ids = iter(queries.reserve_ids(conn, 'task_history', len(history)))
+        session_ids = iter(queries.reserve_ids(conn, 'study_sessions', len(sessions)))
+        return {
+            'users': (USER_COLUMNS, users),
+            'subjects': (SUBJECT_COLUMNS, subjects),
+            'tasks': (TASK_COLUMNS, tasks),
+            'task_history': (HISTORY_COLUMNS, [(next(history_ids),) + row for row in history]),
+            'study_sessions': (SESSION_COLUMNS, [(next(session_ids),) + row for row in sessions]),
+        }
+
+    def task(self, task_id, user_id, subject_ids, history):
+        """One task row; its notes are appended to history (without ids)"""
+        rng = self.rng
+        due = self.today + timedelta(days=rng.randint(-self.days // 2, 60))
+        created = datetime.combine(due, datetime.min.time()) - timedelta(days=rng.randint(1, 30),
+                                                                          minutes=rng.randint(0, 1440))
+        created = min(created, self.now - timedelta(minutes=rng.randint(1, 600)))
+        done = rng.random() < (0.8 if due < self.today else 0.15)
+        subject_id = rng.choice(subject_ids) if rng.random() < 0.85 else None
+
+        last_note = notes_updated_at = None
+        note_count = skewed_count(rng, self.notes) if rng.random() < 0.6 else 0
+        noted = created
+        for _ in range(note_count):
+            noted = min(noted + timedelta(hours=rng.randint(1, 72)), self.now)
+            last_note, notes_updated_at = fill(rng, rng.choice(NOTES)), stamp(noted)
+            history.append((task_id, user_id, last_note, notes_updated_at))
+
+        return (task_id, user_id, subject_id, fill(rng, rng.choice(TASK_TITLES)), fill(rng, rng.choice(DESCRIPTIONS)),
+                due.isoformat(), rng.choice(PRIORITIES), done, stamp(created), last_note, note_count, notes_updated_at)
+
+    def session(self, user_id, subject_ids):
+        """One study session (without its id), more of them in recent days"""
+        rng = self.rng
+        day = self.today - timedelta(days=min(int(rng.expovariate(3 / self.days)), self.days))
+        started = datetime.combine(day, datetime.min.time()) + timedelta(hours=rng.randint(7, 23),
+                                                                         minutes=rng.randint(0, 59))
+        duration, session_type = rng.choice([(25, 'focus')] * 6 + [(50, 'focus')] * 2 + [(5, 'break')] * 2)
+        subject_id = rng.choice(subject_ids) if rng.random() < 0.8 else None
+        notes = fill(rng, rng.choice(NOTES)) if rng.random() < 0.2 else None
+        if started >= self.now:
+            started = self.now - timedelta(minutes=rng.randint(1, 600))
+        return (user_id, subject_id, duration, notes, session_type, stamp(started))
+
+
+def generate(conn, users, tasks=100, notes=1.5, sessions=60, days=180, prefix='load', seed=None, report=print):
+    """Insert users generated accounts; returns {table: rows inserted}"""
+    generator = Generator(random.Random(seed), date.today(), tasks, notes, sessions, days, prefix)
+    counts = dict.fromkeys(['users', 'subjects', 'tasks', 'task_history', 'study_sessions'], 0)
+    start = time.perf_counter()
+    for done in range(0, users, USERS_PER_CHUNK):
+        for table, (columns, rows) in generator.chunk(conn, min(USERS_PER_CHUNK, users - done)).items():
+            queries.insert_many(conn, table, columns, rows)
+            counts[table] += len(rows)
+        conn.commit()
+        total = sum(counts.values())
+        report(f"{counts['users']} users, {total} rows ({total / (time.perf_counter() - start):,.0f} rows/s)")
+    study.reconcile(conn)
+    conn.commit()
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--tasks', type=float, default=100, help='average tasks per user')
+    parser.add_argument('--notes', type=float, default=1.5, help='average notes per task that has any')
+    parser.add_argument('--sessions', type=float, default=60, help='average study sessions per user')
+    parser.add_argument('--days', type=int, default=180, help='how far back study history goes')
+    parser.add_argument('--prefix', default='load', help='username prefix')
+    parser.add_argument('--seed', type=int, help='for a repeatable data set')
+    args = parser.parse_args()
+
+    conn = connect()
+    migrate(conn)
+    counts = generate(conn, args.users, args.tasks, args.notes, args.sessions, args.days, args.prefix, args.seed)
+    conn.close()
+    print(', '.join(f'{count} {table}' for table, count in counts.items()))
+    print(f"Log in as {args.prefix}<id> with password {GENERATED_PASSWORD!r}")
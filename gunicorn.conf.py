@@ -0,0 +1,47 @@
+import gc
+import os
+
+from events import EVENTS_BACKEND, EVENTS_MAX_STREAMS
+
+# Gunicorn settings, read from the working directory (gunicorn wsgi:app)
+
+worker_class = 'gthread'
+# Request threads, plus one per live-update stream: an open /events tab keeps
+# its thread for up to EVENTS_STREAM_SECONDS, so streams get threads of their
+# own and can't starve page requests. An idle stream thread only waits on a
+# queue, but each is a thread stack; lower EVENTS_MAX_STREAMS on a small
+# instance, or EVENTS_BACKEND=none to give none.
+threads = int(os.environ.get('GUNICORN_THREADS', 4)) + (EVENTS_MAX_STREAMS if EVENTS_BACKEND != 'none' else 0)
+# Load the app (migrations, compiled templates) once in the master and fork
+# the workers from it, so they start sooner and share that memory
+# copy-on-write. PRELOAD_APP=0 loads it in every worker instead (--reload
+# needs that).
+preload_app = os.environ.get('PRELOAD_APP', '1') != '0'
+# With preload_app, also import the Dialogflow/gRPC libraries in the master
+PRELOAD_CHATBOT = os.environ.get('PRELOAD_CHATBOT', '1') != '0'
+
+
+def on_starting(server):
+    """In the master, before any worker is forked"""
+    # Workers inherit this: cache.py and events.py turn their per-process
+    # (memory) backends off when there are several, whether -w or
+    # WEB_CONCURRENCY chose the count
+    os.environ['WEB_CONCURRENCY'] = str(server.cfg.workers)
+
+
+def when_ready(server):
+    """In the master, after the app is loaded and before any worker is forked"""
+    if not server.cfg.preload_app:
+        return
+    if PRELOAD_CHATBOT:
+        import dialogflow_client
+        dialogflow_client.preload()
+    # Keep the collector away from everything loaded so far: a collection in a
+    # worker would otherwise write to those objects and un-share their pages
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    """In each worker, once it has the app and before it accepts requests"""
+    from app import warm_up
+    warm_up()
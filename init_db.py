@@ -1,39 +1,12 @@
-import sqlite3
+from db import connect
+from migrations import migrate
 
 # Create a connection to the database (creates the file if it doesn't exist)
-conn = sqlite3.connect('student_tasks.db')
+conn = connect()
 
-# Create a cursor object to execute SQL commands
-cursor = conn.cursor()
+# Create or upgrade every table and index (see migrations.py)
+migrate(conn, verbose=True)
 
-# Create users table
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS users (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT UNIQUE NOT NULL,
-    email TEXT UNIQUE NOT NULL,
-    password TEXT NOT NULL,
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-)
-''')
-
-# Create tasks table
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS tasks (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    title TEXT NOT NULL,
-    description TEXT,
-    due_date DATE,
-    priority TEXT DEFAULT 'medium',
-    completed BOOLEAN DEFAULT 0,
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (user_id) REFERENCES users (id)
-)
-''')
-
-# Commit changes and close connection
-conn.commit()
 conn.close()
 
-print("Database created successfully!")
\ No newline at end of file
+print("Database created successfully!")
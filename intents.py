@@ -0,0 +1,174 @@
+import re
+import threading
+from collections import Counter
+from datetime import timedelta
+
+from markupsafe import escape
+
+import queries
+import study
+from cache import get_cache
+
+# Common chatbot questions answered from the user's own data, without a
+# Dialogflow round trip. Replies are HTML (chatbot.html inserts them with
+# innerHTML), so anything from the database is escaped.
+
+MAX_LISTED = 5
+
+
+def _task_list(tasks, today):
+    lines = []
+    for task in tasks[:MAX_LISTED]:
+        line = f"• {escape(task['title'])}"
+        if task['subject_name']:
+            line += f" ({escape(task['subject_name'])})"
+        if task['due_date'] and task['due_date'] != today.isoformat():
+            line += f" - due {task['due_date']}"
+        lines.append(line)
+    if len(tasks) > MAX_LISTED:
+        lines.append(f"…and {len(tasks) - MAX_LISTED} more on your dashboard")
+    return '<br>'.join(lines)
+
+
+def _plural(count, word):
+    return f"{count} {word}{'' if count == 1 else 's'}"
+
+
+def _due_within(label, first_day, days):
+    def answer(conn, user_id, today):
+        start = today + timedelta(days=first_day)
+        tasks = queries.list_pending_tasks_between(conn, user_id, start, start + timedelta(days=days))
+        if not tasks:
+            return f"Nothing due {label} 🎉"
+        return f"You have {_plural(len(tasks), 'task')} due {label}:<br>{_task_list(tasks, today)}"
+    return answer
+
+
+def _overdue(conn, user_id, today):
+    tasks = queries.list_overdue_tasks(conn, user_id, today)
+    if not tasks:
+        return "You're all caught up - no overdue tasks! ✅"
+    return f"🚨 {_plural(len(tasks), 'task')} overdue:<br>{_task_list(tasks, today)}"
+
+
+def _task_count(conn, user_id, today):
+    counts = queries.task_counts(conn, user_id)
+    return (f"You have {_plural(counts['total_tasks'], 'task')}: "
+            f"{counts['pending_tasks']} pending and {counts['completed_tasks']} completed.")
+
+
+def _study_time(conn, user_id, today):
+    totals = queries.study_totals(conn, user_id)
+    minutes = totals['total_minutes'] or 0
+    if not minutes:
+        return "You haven't logged any study sessions yet. Try the study timer!"
+    return (f"You've studied {minutes // 60}h {minutes % 60}m over "
+            f"{_plural(totals['total_sessions'], 'session')} "
+            f"(about {round(totals['avg_duration'] or 0)} min each).")
+
+
+def _study_streak(conn, user_id, today):
+    streak = study.streak(conn, user_id)
+    reply = f"🔥 Your study streak is {_plural(streak['current_streak'], 'day')}"
+    if streak['longest_streak'] > streak['current_streak']:
+        reply += f" (your best is {_plural(streak['longest_streak'], 'day')})"
+    return reply + "."
+
+
+def _subjects(conn, user_id, today):
+    subjects = queries.list_subjects(conn, user_id)
+    if not subjects:
+        return "You haven't added any subjects yet - add one from the dashboard."
+    names = ', '.join(str(escape(subject['name'])) for subject in subjects)
+    return f"Your subjects: {names}"
+
+
+def _help(conn, user_id, today):
+    return ("I can answer questions like:<br>• What's due today / tomorrow / this week?"
+            "<br>• What's overdue?<br>• How many tasks do I have?"
+            "<br>• How much have I studied? What's my streak?<br>• What are my subjects?")
+
+
+TASK_WORDS = r"(due|tasks?|homework|assignments?|deadlines?|to-?do)"
+# How a question for one of these intents starts; anything else goes to Dialogflow
+ASK = r"^\s*(what|whats|which|when|show|list|any|anything|is (there|anything)|are (there|any)|do i|have i)\b"
+SUBJECT_WORDS = r"(subjects|classes|courses)"
+
+
+def _about_tasks(when):
+    """Pattern for a question mentioning a time phrase together with a task word, in either order"""
+    return rf"{ASK}.*(\b{TASK_WORDS}\b.*\b{when}\b|\b{when}\b.*\b{TASK_WORDS}\b)"
+
+
+# (name, pattern, handler), tried in order; patterns are compiled once at import
+INTENTS = [
+    ('overdue', rf"{ASK}.*\boverdue\b|^\s*am i behind\b|" + _about_tasks(r"(late|missed)"), _overdue),
+    ('due_tomorrow', _about_tasks(r"tomorrow"), _due_within('tomorrow', 1, 1)),
+    ('due_today', _about_tasks(r"(today|tonight)"), _due_within('today', 0, 1)),
+    ('due_this_week', _about_tasks(r"(this week|upcoming|coming up|next (few|7|seven) days)"),
+     _due_within('in the next 7 days', 0, 7)),
+    ('task_count', rf"^\s*how many (\w+ )?{TASK_WORDS}\b|^\s*tasks? (count|left|remaining)\b", _task_count),
+    ('study_streak', rf"{ASK}.*\bstreak\b|^\s*how (long|big) is my\b.*\bstreak\b", _study_streak),
+    ('study_time', rf"{ASK}.*\bstud(y|ied|ying)\b.*\b(time|hours?|minutes?|stats)\b"
+                   r"|^\s*how (long|much|many hours)\b.*\bstud(y|ied)\b", _study_time),
+    ('subjects', rf"^\s*(what|which)( are| is)?( all)?( of)?( my| the)? {SUBJECT_WORDS}\b"
+                 rf"|^\s*(list|show)( me)?( all)?( my)? {SUBJECT_WORDS}\b", _subjects),
+    ('help', r"^\s*(help|what can you do)\b", _help),
+]
+_COMPILED = [(name, re.compile(pattern, re.IGNORECASE), handler) for name, pattern, handler in INTENTS]
+
+
+def match(text):
+    """(intent name, handler) for the first pattern matching text, or None"""
+    for name, pattern, handler in _COMPILED:
+        if pattern.search(text):
+            return name, handler
+    return None
+
+
+def answer(conn, user_id, text, today):
+    """(intent name, reply) for a locally answerable message, or None"""
+    intent = match(text)
+    if intent is None:
+        return None
+    name, handler = intent
+    # Cached like the pages: the user's next write bumps their cache version
+    reply = get_cache().get_or_compute(user_id, 'chatbot', (name, today),
+                                       lambda: handler(conn, user_id, today))
+    return name, reply
+
+
+class ChatStats:
+    """How many messages were answered locally vs by Dialogflow, and how fast"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = Counter()
+        self.seconds = Counter()
+        self.intents = Counter()
+
+    def record(self, source, seconds, intent=None):
+        with self._lock:
+            self.counts[source] += 1
+            self.seconds[source] += seconds
+            if intent:
+                self.intents[intent] += 1
+
+    def stats(self):
+        total = sum(self.counts.values())
+        return {
+            'messages': total,
+            'local_hit_ratio': round(self.counts['local'] / total, 4) if total else 0.0,
+            'sources': {
+                source: {
+                    'messages': count,
+                    'avg_ms': round(self.seconds[source] / count * 1000, 3),
+                    'total_seconds': round(self.seconds[source], 6),
+                }
+                for source, count in self.counts.items()
+            },
+            'intents': dict(self.intents),
+        }
+
+
+chat_stats = ChatStats()
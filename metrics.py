@@ -0,0 +1,304 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+from flask import before_render_template, g, got_request_exception, has_request_context, request, template_rendered
+
+import queries
+
+# Request, SQL, template and external-call timings for this worker, exported
+# in the Prometheus text format on /metrics. Every gunicorn worker keeps its
+# own numbers (like /pool_stats and /cache_stats); scrape each one, or sum them.
+
+# Statements slower than this are kept in the slow-query log with their plan
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', 100))
+METRICS_PREFIX = os.environ.get('METRICS_PREFIX', 'stm')
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests by endpoint, method and status', None),
+    'http_request_duration_seconds': ('histogram', 'Request latency by endpoint', SECONDS_BUCKETS),
+    'http_exceptions_total': ('counter', 'Unhandled exceptions by endpoint and type', None),
+    'handled_errors_total': ('counter', 'Errors caught and shown to the user instead, by endpoint and type', None),
+    'sql_queries_total': ('counter', 'SQL statements run, by endpoint', None),
+    'sql_duration_seconds_total': ('counter', 'Time spent in SQL statements, by endpoint', None),
+    'sql_queries_per_request': ('histogram', 'SQL statements per request, by endpoint', COUNT_BUCKETS),
+    'sql_slow_queries_total': ('counter', f'Statements over SLOW_QUERY_MS ({SLOW_QUERY_MS:g} ms), by endpoint', None),
+    'template_render_seconds': ('histogram', 'Template render time by template', SECONDS_BUCKETS),
+    'external_call_seconds': ('histogram', 'Calls to outside services, per attempt, by outcome', SECONDS_BUCKETS),
+}
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+class Registry:
+    """Counters and histograms keyed by metric name and label set"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {name: Counter() for name, (kind, _, _) in METRICS.items() if kind == 'counter'}
+        self.histograms = {name: {} for name, (kind, _, _) in METRICS.items() if kind == 'histogram'}
+        self.slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self.counters[name][tuple(labels.items())] += amount
+
+    def observe(self, name, labels, value):
+        key = tuple(labels.items())
+        with self._lock:
+            series = self.histograms[name]
+            if key not in series:
+                series[key] = Histogram(METRICS[name][2])
+            series[key].observe(value)
+
+    def add_slow_query(self, entry):
+        with self._lock:
+            self.slow_queries.append(entry)
+
+    def slow_query_log(self):
+        """Slow-query log entries, newest first"""
+        with self._lock:
+            return list(reversed(self.slow_queries))
+
+    def render(self):
+        """Everything in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, _) in METRICS.items():
+                full_name = f'{METRICS_PREFIX}_{name}'
+                lines.append(f'# HELP {full_name} {help_text}')
+                lines.append(f'# TYPE {full_name} {kind}')
+                if kind == 'counter':
+                    for labels, value in sorted(self.counters[name].items()):
+                        lines.append(f'{full_name}{_label_text(labels)} {value:g}')
+                    continue
+                for labels, histogram in sorted(self.histograms[name].items()):
+                    bounds = [f'{bound:g}' for bound in histogram.buckets] + ['+Inf']
+                    cumulative = 0
+                    for bound, count in zip(bounds, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{full_name}_bucket{_label_text(labels, [("le", bound)])} {cumulative}')
+                    lines.append(f'{full_name}_sum{_label_text(labels)} {histogram.sum:g}')
+                    lines.append(f'{full_name}_count{_label_text(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+_registry = None
+_registry_pid = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return this process's registry, creating it after a gunicorn fork"""
+    global _registry, _registry_pid
+    pid = os.getpid()
+    if _registry is None or _registry_pid != pid:
+        with _registry_lock:
+            if _registry is None or _registry_pid != pid:
+                _registry = Registry()
+                _registry_pid = pid
+    return _registry
+
+
+def current_endpoint():
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    return 'none'
+
+
+def record_error(exception):
+    """Count and log an error the app recovers from (a flash message, a fallback reply)"""
+    endpoint = current_endpoint()
+    get_registry().inc('handled_errors_total', {'endpoint': endpoint, 'exception': type(exception).__name__})
+    logger.warning('Handled error on %s', endpoint, exc_info=exception)
+
+
+def record_external_call(service, seconds, outcome):
+    """Time one attempt at an outside service (outcome: ok, retry or error)"""
+    get_registry().observe('external_call_seconds', {'service': service, 'outcome': outcome}, seconds)
+
+
+# -------------------- SQL --------------------
+
+def _params_shape(params):
+    """Parameter types only - the values may be personal data"""
+    return [type(value).__name__ for value in params]
+
+
+def _explain(conn, statement, params):
+    """Plan lines for an already translated statement, on the driver's connection"""
+    cur = conn.cursor()
+    try:
+        if queries.dialect_of(conn) == queries.SQLITE:
+            cur.execute('EXPLAIN QUERY PLAN ' + statement, params)
+            return [row[3] for row in cur.fetchall()]
+        # A savepoint, so a failed EXPLAIN can't abort the request's transaction
+        cur.execute('SAVEPOINT explain_slow_query')
+        try:
+            cur.execute('EXPLAIN ' + statement, params)
+            return [row[0] for row in cur.fetchall()]
+        finally:
+            cur.execute('ROLLBACK TO SAVEPOINT explain_slow_query')
+    finally:
+        cur.close()
+
+
+def record_slow_query(conn, statement, params, seconds, rows=None):
+    """Add a statement to the slow-query log, with its plan (params: one row's worth)"""
+    endpoint = current_endpoint()
+    plan = None
+    if statement.lstrip().split(None, 1)[0].upper() in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE'):
+        try:
+            plan = _explain(conn, statement, params)
+        except Exception as e:
+            plan = [f'EXPLAIN failed: {e}']
+    entry = {
+        'at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'endpoint': endpoint,
+        'ms': round(seconds * 1000, 3),
+        'sql': ' '.join(statement.split()),
+        'params': _params_shape(params),
+        'rows': rows,
+        'plan': plan,
+    }
+    get_registry().add_slow_query(entry)
+    get_registry().inc('sql_slow_queries_total', {'endpoint': endpoint})
+    logger.warning('Slow query (%.1f ms) on %s: %s', entry['ms'], endpoint, entry['sql'][:200])
+
+
+class InstrumentedCursor:
+    """Cursor wrapper that times execute()/executemany() for its connection"""
+
+    def __init__(self, cursor, owner):
+        self._cursor = cursor
+        self._owner = owner
+
+    def execute(self, statement, params=()):
+        return self._owner._timed(self._cursor.execute, statement, params)
+
+    def executemany(self, statement, rows):
+        return self._owner._timed(self._cursor.executemany, statement, rows, many=True)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """DB-API connection wrapper counting and timing every statement.
+
+    One is made per request (db.get_db_connection), so ``queries`` and
+    ``seconds`` are that request's totals. The driver's connection is
+    ``raw_connection``; everything not timed is passed through to it.
+    """
+
+    def __init__(self, conn):
+        self.raw_connection = conn
+        self.queries = 0
+        self.seconds = 0.0
+
+    def _timed(self, method, statement, params, many=False):
+        start = time.perf_counter()
+        if many:
+            params = list(params)
+        result = method(statement, params)
+        elapsed = time.perf_counter() - start
+        self.queries += 1
+        self.seconds += elapsed
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            record_slow_query(self.raw_connection, statement, params[0] if many and params else params,
+                              elapsed, rows=len(params) if many else None)
+        return result
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self.raw_connection.cursor(*args, **kwargs), self)
+
+    # sqlite3's shortcuts, which open their own cursor
+    def execute(self, statement, params=()):
+        return self._timed(self.raw_connection.execute, statement, params)
+
+    def executemany(self, statement, rows):
+        return self._timed(self.raw_connection.executemany, statement, rows, many=True)
+
+    def __getattr__(self, name):
+        return getattr(self.raw_connection, name)
+
+
+# -------------------- FLASK --------------------
+
+def init_app(app):
+    """Time every request, its SQL and its templates; count unhandled exceptions"""
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def remember_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def record_request(exception=None):
+        # Runs after a streamed response has finished, so streaming time counts
+        if 'metrics_start' not in g:
+            return
+        registry = get_registry()
+        endpoint = current_endpoint()
+        registry.observe('http_request_duration_seconds', {'endpoint': endpoint, 'method': request.method},
+                         time.perf_counter() - g.metrics_start)
+        status = g.get('metrics_status', 500)
+        registry.inc('http_requests_total', {'endpoint': endpoint, 'method': request.method, 'status': status})
+        conn = g.get('db_conn') or g.get('db_conn_released')
+        queries = getattr(conn, 'queries', 0)
+        registry.observe('sql_queries_per_request', {'endpoint': endpoint}, queries)
+        if queries:
+            registry.inc('sql_queries_total', {'endpoint': endpoint}, queries)
+            registry.inc('sql_duration_seconds_total', {'endpoint': endpoint}, conn.seconds)
+
+    def start_template_timer(sender, template, context, **extra):
+        g.setdefault('metrics_templates', []).append(time.perf_counter())
+
+    def record_template(sender, template, context, **extra):
+        starts = g.get('metrics_templates')
+        if starts:
+            get_registry().observe('template_render_seconds', {'template': template.name or 'string'},
+                                   time.perf_counter() - starts.pop())
+
+    def record_exception(sender, exception, **extra):
+        get_registry().inc('http_exceptions_total',
+                           {'endpoint': current_endpoint(), 'exception': type(exception).__name__})
+
+    before_render_template.connect(start_template_timer, app, weak=False)
+    template_rendered.connect(record_template, app, weak=False)
+    got_request_exception.connect(record_exception, app, weak=False)
@@ -0,0 +1,535 @@
+"""Versioned schema migrations.
+
+Run ``python migrations.py`` to bring the database up to date,
+``python migrations.py --status`` to list applied versions,
+``python migrations.py --check`` to fail if a hot query does a full scan and
+``python migrations.py --verify-study-totals`` to fail if the study statistics
+rollup disagrees with study_sessions (``--rebuild-study-totals`` recomputes it).
+The app also applies pending migrations at startup (set AUTO_MIGRATE=0 to skip).
+"""
+import sys
+from datetime import date
+
+import queries
+import study
+import urgency
+from queries import SQLITE, POSTGRES, dialect_of
+
+
+def _columns(conn, table):
+    if dialect_of(conn) == SQLITE:
+        return {row['name'] for row in queries.fetch_all(conn, f'PRAGMA table_info({table})')}
+    rows = queries.fetch_all(
+        conn,
+        'SELECT column_name FROM information_schema.columns WHERE table_name = ?',
+        (table,)
+    )
+    return {row['column_name'] for row in rows}
+
+
+def _add_column(conn, table, column, definition):
+    if column not in _columns(conn, table):
+        queries.run(conn, f'ALTER TABLE {table} ADD COLUMN {column} {definition}').close()
+
+
+# -------------------- MIGRATIONS --------------------
+# Each migration is (version, name, {dialect: [statements]} or callable).
+# Statements must be safe to run against databases created by the old
+# init_db.py / add_*.py scripts.
+
+BASE_SCHEMA = {
+    SQLITE: [
+        '''CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT,
+            due_date DATE,
+            priority TEXT DEFAULT 'medium',
+            completed BOOLEAN DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS subjects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            color TEXT DEFAULT '#007bff',
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS task_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            note_text TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (task_id) REFERENCES tasks (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS study_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            subject_id INTEGER,
+            duration_minutes INTEGER NOT NULL,
+            notes TEXT,
+            session_type TEXT DEFAULT 'focus',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (subject_id) REFERENCES subjects (id)
+        )''',
+    ],
+    POSTGRES: [
+        '''CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS tasks (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            title TEXT NOT NULL,
+            description TEXT,
+            due_date DATE,
+            priority TEXT DEFAULT 'medium',
+            completed BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS subjects (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            name TEXT NOT NULL,
+            color TEXT DEFAULT '#007bff'
+        )''',
+        '''CREATE TABLE IF NOT EXISTS task_history (
+            id SERIAL PRIMARY KEY,
+            task_id INTEGER NOT NULL REFERENCES tasks (id) ON DELETE CASCADE,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            note_text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS study_sessions (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            subject_id INTEGER REFERENCES subjects (id) ON DELETE SET NULL,
+            duration_minutes INTEGER NOT NULL,
+            notes TEXT,
+            session_type TEXT DEFAULT 'focus',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+    ],
+}
+
+
+def legacy_columns(conn):
+    """Columns the add_subjects/add_notes/add_calendar_support scripts used to add"""
+    _add_column(conn, 'tasks', 'subject_id', 'INTEGER')
+    _add_column(conn, 'tasks', 'notes', 'TEXT')
+    _add_column(conn, 'tasks', 'calendar_color', 'TEXT')
+
+
+PERFORMANCE_INDEXES = [
+    # Dashboard (user's tasks, pending first) and print view
+    'CREATE INDEX IF NOT EXISTS idx_tasks_user_completed_due ON tasks (user_id, completed, due_date)',
+    # Calendar month/day range lookups
+    'CREATE INDEX IF NOT EXISTS idx_tasks_user_due ON tasks (user_id, due_date)',
+    # Subject filter and unassigning tasks when a subject is deleted
+    'CREATE INDEX IF NOT EXISTS idx_tasks_user_subject ON tasks (user_id, subject_id)',
+    'CREATE INDEX IF NOT EXISTS idx_subjects_user_name ON subjects (user_id, name)',
+    # Task details history
+    'CREATE INDEX IF NOT EXISTS idx_task_history_task_created ON task_history (task_id, created_at)',
+    # Study timer / stats
+    'CREATE INDEX IF NOT EXISTS idx_study_sessions_user_created ON study_sessions (user_id, created_at)',
+]
+
+# Full-text search over tasks (title, description, notes) and task_history notes.
+# SQLite uses external-content FTS5 tables kept in sync by triggers; PostgreSQL
+# uses generated tsvector columns with GIN indexes.
+FULL_TEXT_SEARCH = {
+    SQLITE: [
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS task_fts USING fts5(
+            title, description, notes,
+            content='tasks', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )''',
+        '''CREATE TRIGGER IF NOT EXISTS task_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO task_fts (rowid, title, description, notes)
+            VALUES (new.id, new.title, new.description, new.notes);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS task_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO task_fts (task_fts, rowid, title, description, notes)
+            VALUES ('delete', old.id, old.title, old.description, old.notes);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS task_fts_update AFTER UPDATE OF title, description, notes ON tasks BEGIN
+            INSERT INTO task_fts (task_fts, rowid, title, description, notes)
+            VALUES ('delete', old.id, old.title, old.description, old.notes);
+            INSERT INTO task_fts (rowid, title, description, notes)
+            VALUES (new.id, new.title, new.description, new.notes);
+        END''',
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS task_history_fts USING fts5(
+            note_text,
+            content='task_history', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )''',
+        '''CREATE TRIGGER IF NOT EXISTS task_history_fts_insert AFTER INSERT ON task_history BEGIN
+            INSERT INTO task_history_fts (rowid, note_text) VALUES (new.id, new.note_text);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS task_history_fts_delete AFTER DELETE ON task_history BEGIN
+            INSERT INTO task_history_fts (task_history_fts, rowid, note_text)
+            VALUES ('delete', old.id, old.note_text);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS task_history_fts_update AFTER UPDATE OF note_text ON task_history BEGIN
+            INSERT INTO task_history_fts (task_history_fts, rowid, note_text)
+            VALUES ('delete', old.id, old.note_text);
+            INSERT INTO task_history_fts (rowid, note_text) VALUES (new.id, new.note_text);
+        END''',
+        # Index rows that existed before the triggers
+        "INSERT INTO task_fts (task_fts) VALUES ('rebuild')",
+        "INSERT INTO task_history_fts (task_history_fts) VALUES ('rebuild')",
+        'CREATE INDEX IF NOT EXISTS idx_task_history_user_task ON task_history (user_id, task_id)',
+    ],
+    POSTGRES: [
+        '''ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', concat_ws(' ', title, description, notes))) STORED''',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_search ON tasks USING GIN (search_vector)',
+        '''ALTER TABLE task_history ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', note_text)) STORED''',
+        'CREATE INDEX IF NOT EXISTS idx_task_history_search ON task_history USING GIN (search_vector)',
+        'CREATE INDEX IF NOT EXISTS idx_task_history_user_task ON task_history (user_id, task_id)',
+    ],
+}
+
+# The tasks full-text index, rebuilt without the notes column that
+# incremental_notes() empties
+DROP_TASK_FTS = {
+    SQLITE: [
+        'DROP TRIGGER IF EXISTS task_fts_insert',
+        'DROP TRIGGER IF EXISTS task_fts_delete',
+        'DROP TRIGGER IF EXISTS task_fts_update',
+        'DROP TABLE IF EXISTS task_fts',
+    ],
+    POSTGRES: ['ALTER TABLE tasks DROP COLUMN IF EXISTS search_vector'],
+}
+
+CREATE_TASK_FTS = {
+    SQLITE: [
+        '''CREATE VIRTUAL TABLE task_fts USING fts5(
+            title, description,
+            content='tasks', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )''',
+        '''CREATE TRIGGER task_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO task_fts (rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END''',
+        '''CREATE TRIGGER task_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO task_fts (task_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+        END''',
+        '''CREATE TRIGGER task_fts_update AFTER UPDATE OF title, description ON tasks BEGIN
+            INSERT INTO task_fts (task_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO task_fts (rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END''',
+        "INSERT INTO task_fts (task_fts) VALUES ('rebuild')",
+    ],
+    POSTGRES: [
+        '''ALTER TABLE tasks ADD COLUMN search_vector tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', concat_ws(' ', title, description))) STORED''',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_search ON tasks USING GIN (search_vector)',
+    ],
+}
+
+
+def incremental_notes(conn):
+    """Make task_history the only record of notes, with a summary on the task row"""
+    dialect = dialect_of(conn)
+    timestamp = 'DATETIME' if dialect == SQLITE else 'TIMESTAMP'
+    _add_column(conn, 'tasks', 'last_note', 'TEXT')
+    _add_column(conn, 'tasks', 'note_count', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(conn, 'tasks', 'notes_updated_at', timestamp)
+
+    # Notes written before task_history existed only live in the blob
+    queries.execute(conn, '''
+        INSERT INTO task_history (task_id, user_id, note_text, created_at)
+        SELECT id, user_id, notes, created_at FROM tasks
+        WHERE notes IS NOT NULL AND notes <> ''
+        AND NOT EXISTS (SELECT 1 FROM task_history WHERE task_history.task_id = tasks.id)
+    ''')
+
+    # Drop the notes column from the full-text index before emptying it, so
+    # the old update trigger doesn't reindex every task
+    for statement in DROP_TASK_FTS[dialect]:
+        queries.run(conn, statement).close()
+    queries.execute(conn, '''
+        UPDATE tasks SET
+            note_count = (SELECT COUNT(*) FROM task_history WHERE task_history.task_id = tasks.id),
+            last_note = (SELECT note_text FROM task_history WHERE task_history.task_id = tasks.id
+                         ORDER BY id DESC LIMIT 1),
+            notes_updated_at = (SELECT MAX(created_at) FROM task_history WHERE task_history.task_id = tasks.id),
+            notes = NULL
+    ''')
+    for statement in CREATE_TASK_FTS[dialect]:
+        queries.run(conn, statement).close()
+
+    # Task details pages through history by id
+    queries.run(conn, 'CREATE INDEX IF NOT EXISTS idx_task_history_task_id ON task_history (task_id, id)').close()
+
+
+def calendar_feeds(conn):
+    """Per-user change stamps for conditional responses, and ICS feed tokens"""
+    timestamp = 'DATETIME' if dialect_of(conn) == SQLITE else 'TIMESTAMP'
+    _add_column(conn, 'users', 'data_version', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(conn, 'users', 'data_updated_at', timestamp)
+    _add_column(conn, 'users', 'calendar_token', 'TEXT')
+    queries.execute(conn, 'UPDATE users SET data_updated_at = CURRENT_TIMESTAMP WHERE data_updated_at IS NULL')
+    queries.run(conn, 'CREATE UNIQUE INDEX IF NOT EXISTS idx_users_calendar_token ON users (calendar_token)').close()
+
+
+STUDY_DAILY_TOTALS = '''CREATE TABLE IF NOT EXISTS study_daily_totals (
+    user_id INTEGER NOT NULL,
+    study_date DATE NOT NULL,
+    subject_id INTEGER NOT NULL DEFAULT 0,
+    total_minutes INTEGER NOT NULL DEFAULT 0,
+    session_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, study_date, subject_id)
+)'''
+
+
+STUDY_STREAKS = {
+    SQLITE: '''CREATE TABLE IF NOT EXISTS study_streaks (
+        user_id INTEGER PRIMARY KEY,
+        current_streak INTEGER NOT NULL DEFAULT 0,
+        longest_streak INTEGER NOT NULL DEFAULT 0,
+        last_study_date DATE
+    )''',
+    POSTGRES: '''CREATE TABLE IF NOT EXISTS study_streaks (
+        user_id INTEGER PRIMARY KEY REFERENCES users (id),
+        current_streak INTEGER NOT NULL DEFAULT 0,
+        longest_streak INTEGER NOT NULL DEFAULT 0,
+        last_study_date DATE
+    )''',
+}
+
+
+def study_daily_totals(conn):
+    """Per user, day and subject study rollup for the stats pages, backfilled from study_sessions"""
+    queries.run(conn, STUDY_DAILY_TOTALS).close()
+    queries.rebuild_study_rollups(conn)
+
+
+def study_streaks(conn):
+    """Stored current and longest streaks, then both derived tables rebuilt in STUDY_TIMEZONE days"""
+    queries.run(conn, STUDY_STREAKS[dialect_of(conn)]).close()
+    study.reconcile(conn)
+
+
+MIGRATIONS = [
+    (1, 'base schema', BASE_SCHEMA),
+    (2, 'legacy task columns', legacy_columns),
+    (3, 'performance indexes', {SQLITE: PERFORMANCE_INDEXES, POSTGRES: PERFORMANCE_INDEXES}),
+    (4, 'full-text search', FULL_TEXT_SEARCH),
+    (5, 'incremental task notes', incremental_notes),
+    (6, 'calendar feeds', calendar_feeds),
+    (7, 'study daily totals', study_daily_totals),
+    (8, 'study streaks', study_streaks),
+]
+
+
+# -------------------- RUNNER --------------------
+
+VERSION_TABLE = {
+    SQLITE: '''CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''',
+    POSTGRES: '''CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''',
+}
+
+
+def applied_versions(conn):
+    queries.run(conn, VERSION_TABLE[dialect_of(conn)]).close()
+    conn.commit()
+    return {row['version'] for row in queries.fetch_all(conn, 'SELECT version FROM schema_migrations')}
+
+
+def _lock(conn):
+    # Serialise concurrent workers applying migrations at the same time
+    if dialect_of(conn) == SQLITE:
+        if not conn.in_transaction:
+            conn.execute('BEGIN IMMEDIATE')
+    else:
+        queries.run(conn, 'SELECT pg_advisory_xact_lock(4207)').close()
+
+
+def migrate(conn, verbose=False):
+    """Apply every pending migration; returns the versions applied"""
+    dialect = dialect_of(conn)
+    applied = []
+    for version, name, steps in MIGRATIONS:
+        if version in applied_versions(conn):
+            continue
+        _lock(conn)
+        try:
+            # Another worker may have applied it while we waited for the lock
+            if queries.fetch_one(conn, 'SELECT version FROM schema_migrations WHERE version = ?', (version,)):
+                conn.commit()
+                continue
+            if callable(steps):
+                steps(conn)
+            else:
+                for statement in steps[dialect]:
+                    queries.run(conn, statement).close()
+            queries.execute(conn, 'INSERT INTO schema_migrations (version, name) VALUES (?, ?)', (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+        if verbose:
+            print(f"Applied migration {version}: {name}")
+    refresh_statistics(conn)
+    return applied
+
+
+ANALYZE_MIN_ROWS = 1000
+
+
+def refresh_statistics(conn):
+    """Give the SQLite planner table statistics (PostgreSQL's autovacuum does this itself)"""
+    if dialect_of(conn) != SQLITE:
+        return
+    # Without sqlite_stat1 the planner guesses, and e.g. walks every task of a
+    # user instead of starting from the full-text matches. Statistics taken on
+    # near-empty tables are worse than none (they make the FTS5 shadow-table
+    # lookups scan), so only analyze once there is real data.
+    has_stats = queries.fetch_one(conn, "SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'")
+    conn.execute('PRAGMA analysis_limit = 1000')
+    if has_stats:
+        conn.execute('PRAGMA optimize')
+    elif queries.fetch_one(conn, 'SELECT COUNT(*) as n FROM tasks')['n'] >= ANALYZE_MIN_ROWS:
+        conn.execute('ANALYZE')
+    conn.commit()
+
+
+# -------------------- QUERY PLAN CHECK --------------------
+
+def hot_queries(conn):
+    """(label, sql, params) for the queries each page load depends on"""
+    today = date.today()
+    named = lambda name: queries.named(conn, name)
+    return [
+        ('dashboard tasks', named('task_page').format(detail_columns='', filters='', after='',
+                                                      urgency_rank=urgency.rank_sql(named('task_page_due_date')),
+                                                      due_date=named('task_page_due_date')),
+         (today.isoformat(), today.isoformat(), today.isoformat(), 1, 50)),
+        ('dashboard counts', named('task_counts').format(filters=''), (1,)),
+        ('dashboard search', named('task_counts').format(filters=named('filter_search')),
+         [1] + queries.search_filter(conn, 1, 'essay')[1]),
+        ('pending tasks', named('list_pending_tasks'), (1, False)),
+        ('calendar month', named('calendar_month_days'), (1, '2024-01-01', '2024-02-01')),
+        ('calendar day', named('list_tasks_for_day'), (1, today.isoformat())),
+        ('calendar range tasks', named('list_tasks_between'), (1, today.isoformat(), today.isoformat())),
+        ('calendar range study sessions', named('list_study_sessions_between'),
+         (1, today.isoformat(), today.isoformat())),
+        ('calendar feed user', named('find_user_by_calendar_token'), ('token',)),
+        ('chatbot due tasks', named('list_pending_tasks_between'), (1, False, today.isoformat(), today.isoformat())),
+        ('chatbot overdue tasks', named('list_overdue_tasks'), (1, False, today.isoformat())),
+        ('task history', named('list_task_history').format(before=named('task_history_before')), (1, 1, 100, 21)),
+        ('recent study sessions', named('recent_study_sessions'), (1, 10)),
+        ('weekly study totals', named('daily_study_totals'), (1, today.isoformat())),
+        ('study totals', named('study_totals'), (1,)),
+        ('study totals by subject', named('study_totals_by_subject'), (1,)),
+        ('study streak', named('get_study_streak'), (1,)),
+    ]
+
+
+def _full_scans(conn, statement, params):
+    if dialect_of(conn) == SQLITE:
+        plan = queries.fetch_all(conn, 'EXPLAIN QUERY PLAN ' + statement, params)
+        tables = {row['name'] for row in queries.fetch_all(conn, "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        # "SCAN tasks" reads the whole table; "SEARCH ..." and covering-index scans are fine,
+        # and so are scans of CTEs and subqueries, which only hold rows already filtered
+        return [row['detail'] for row in plan
+                if row['detail'].startswith('SCAN ') and ' USING ' not in row['detail']
+                and 'VIRTUAL TABLE INDEX' not in row['detail'] and row['detail'].split()[1] in tables]
+    plan = queries.fetch_all(conn, 'EXPLAIN ' + statement, params)
+    return [row['QUERY PLAN'].strip() for row in plan if 'Seq Scan' in row['QUERY PLAN']]
+
+
+def check_query_plans(conn):
+    """Return {label: [full-scan plan lines]} for hot queries that miss an index"""
+    if dialect_of(conn) == POSTGRES:
+        # Tiny tables always seq-scan; ask the planner what it would do at scale
+        queries.run(conn, 'SET LOCAL enable_seqscan = off').close()
+    problems = {}
+    try:
+        for label, statement, params in hot_queries(conn):
+            scans = _full_scans(conn, statement, params)
+            if scans:
+                problems[label] = scans
+    finally:
+        conn.rollback()
+    return problems
+
+
+if __name__ == '__main__':
+    import argparse
+    from db import connect
+
+    parser = argparse.ArgumentParser(description='Apply database schema migrations')
+    parser.add_argument('--status', action='store_true', help='list applied migrations and exit')
+    parser.add_argument('--check', action='store_true', help='fail if a hot query does a full table scan')
+    parser.add_argument('--rebuild-study-totals', action='store_true',
+                        help='recompute the study_daily_totals rollup (and streaks) from study_sessions')
+    parser.add_argument('--verify-study-totals', action='store_true',
+                        help='fail if the study_daily_totals rollup (or streaks) disagree with study_sessions')
+    args = parser.parse_args()
+
+    conn = connect()
+    if args.status:
+        done = applied_versions(conn)
+        for version, name, _ in MIGRATIONS:
+            print(f"{'x' if version in done else ' '} {version:3d} {name}")
+        sys.exit(0)
+
+    applied = migrate(conn, verbose=True)
+    if not applied:
+        print("Database schema is up to date")
+
+    if args.check:
+        problems = check_query_plans(conn)
+        for label, scans in problems.items():
+            print(f"FULL SCAN in {label}: {'; '.join(scans)}")
+        if problems:
+            sys.exit(1)
+        print("All hot queries use an index")
+
+    # Same as `python study.py reconcile` / `verify`, which also cover the streaks since migration 8
+    if args.rebuild_study_totals:
+        study.reconcile(conn)
+        conn.commit()
+        print("Rebuilt study_daily_totals")
+
+    if args.verify_study_totals:
+        mismatches = study.mismatches(conn)
+        for problem in mismatches[:20]:
+            print(f"MISMATCH {problem}")
+        if mismatches:
+            sys.exit(1)
+        print("study_daily_totals matches study_sessions")
+    conn.close()
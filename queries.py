@@ -0,0 +1,1025 @@
+import re
+import sqlite3
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from urgency import Urgency, rank_sql
+
+# Every SQL statement the app runs lives here. Statements are written once with
+# SQLite-style "?" placeholders; POSTGRES_SQL only overrides the ones whose
+# syntax differs (date functions, RETURNING, case-insensitive LIKE).
+
+SQL = {
+    # --- Users ---
+    'find_user_by_name_or_email': 'SELECT id, username, email FROM users WHERE username = ? OR email = ?',
+    'find_user_by_login': 'SELECT * FROM users WHERE username = ? AND password = ?',
+    'create_user': 'INSERT INTO users (username, email, password, created_at) VALUES (?, ?, ?, ?)',
+    'find_user_by_username': 'SELECT * FROM users WHERE username = ?',
+    # Every committed change to a user's data bumps these (ETag / Last-Modified)
+    'touch_user_data': '''
+        UPDATE users SET data_version = data_version + 1, data_updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''',
+    'user_data_version': '''
+        SELECT id, username, data_version, data_updated_at, calendar_token FROM users WHERE id = ?
+    ''',
+    'find_user_by_calendar_token': '''
+        SELECT id, username, data_version, data_updated_at, calendar_token FROM users WHERE calendar_token = ?
+    ''',
+    'set_calendar_token': 'UPDATE users SET calendar_token = ? WHERE id = ?',
+
+    # --- Subjects ---
+    'list_subjects': 'SELECT * FROM subjects WHERE user_id = ? ORDER BY name',
+    'create_subject': 'INSERT INTO subjects (user_id, name) VALUES (?, ?)',
+    'unassign_subject': 'UPDATE tasks SET subject_id = NULL WHERE subject_id = ? AND user_id = ?',
+    'delete_subject': 'DELETE FROM subjects WHERE id = ? AND user_id = ?',
+
+    # --- Tasks ---
+    'create_task': '''
+        INSERT INTO tasks (user_id, title, description, due_date, priority, subject_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''',
+    'set_task_completed': 'UPDATE tasks SET completed = ? WHERE id = ? AND user_id = ?',
+    'delete_task': 'DELETE FROM tasks WHERE id = ? AND user_id = ?',
+    'update_task_date': 'UPDATE tasks SET due_date = ? WHERE id = ? AND user_id = ?',
+    'set_task_subject': 'UPDATE tasks SET subject_id = ? WHERE id = ? AND user_id = ?',
+    'owned_task_ids': 'SELECT id FROM tasks WHERE user_id = ? AND id IN ({ids})',
+    # {assignments} is "column = ?, ..." over TASK_FIELDS only (see update_task)
+    'update_task': 'UPDATE tasks SET {assignments} WHERE id = ? AND user_id = ?',
+    'get_task': '''
+        SELECT tasks.*, subjects.name as subject_name, subjects.color as subject_color
+        FROM tasks
+        LEFT JOIN subjects ON tasks.subject_id = subjects.id
+        WHERE tasks.id = ? AND tasks.user_id = ?
+    ''',
+    'list_pending_tasks': '''
+        SELECT tasks.*, subjects.name as subject_name
+        FROM tasks
+        LEFT JOIN subjects ON tasks.subject_id = subjects.id
+        WHERE tasks.user_id = ? AND tasks.completed = ?
+        ORDER BY due_date, priority
+    ''',
+    # Calendar grid: one row per due date with counts; task rows load per day
+    'calendar_month_days': '''
+        SELECT due_date, COUNT(*) as total,
+               SUM(CASE WHEN priority = 'high' THEN 1 ELSE 0 END) as high,
+               SUM(CASE WHEN priority = 'medium' THEN 1 ELSE 0 END) as medium,
+               SUM(CASE WHEN priority = 'low' THEN 1 ELSE 0 END) as low,
+               SUM(CASE WHEN completed THEN 1 ELSE 0 END) as completed
+        FROM tasks
+        WHERE user_id = ? AND due_date >= ? AND due_date < ?
+        GROUP BY due_date
+        ORDER BY due_date
+    ''',
+    # Chatbot answers: pending tasks due in [start, end) and overdue ones
+    'list_pending_tasks_between': '''
+        SELECT tasks.*, subjects.name as subject_name
+        FROM tasks
+        LEFT JOIN subjects ON tasks.subject_id = subjects.id
+        WHERE tasks.user_id = ? AND tasks.completed = ?
+        AND tasks.due_date >= ? AND tasks.due_date < ?
+        ORDER BY tasks.due_date, tasks.priority
+    ''',
+    # '' is "no date" on rows saved before blank dates were stored as NULL
+    'list_overdue_tasks': '''
+        SELECT tasks.*, subjects.name as subject_name
+        FROM tasks
+        LEFT JOIN subjects ON tasks.subject_id = subjects.id
+        WHERE tasks.user_id = ? AND tasks.completed = ? AND tasks.due_date < ? AND tasks.due_date <> ''
+        ORDER BY tasks.due_date, tasks.priority
+    ''',
+    # Calendar API and ICS feed: tasks due in [start, end)
+    'list_tasks_between': '''
+        SELECT tasks.id, tasks.title, tasks.description, tasks.due_date, tasks.priority, tasks.completed,
+               subjects.name as subject_name, subjects.color as subject_color
+        FROM tasks
+        LEFT JOIN subjects ON tasks.subject_id = subjects.id
+        WHERE tasks.user_id = ? AND tasks.due_date >= ? AND tasks.due_date < ?
+        ORDER BY tasks.due_date, tasks.id
+    ''',
+    'list_tasks_for_day': '''
+        SELECT tasks.*, subjects.name as subject_name, subjects.color as subject_color
+        FROM tasks
+        LEFT JOIN subjects ON tasks.subject_id = subjects.id
+        WHERE tasks.user_id = ? AND tasks.due_date = ?
+        ORDER BY tasks.priority, tasks.created_at
+    ''',
+
+    # --- Task filters (dashboard and exports) ---
+    'task_list_base': '''
+        SELECT tasks.*, subjects.name as subject_name, subjects.color as subject_color
+        FROM tasks
+        LEFT JOIN subjects ON tasks.subject_id = subjects.id
+        WHERE tasks.user_id = ?
+    ''',
+    'filter_subject': ' AND subjects.name = ?',
+    'filter_search_like': '''
+        AND (tasks.title LIKE ? OR tasks.description LIKE ? OR subjects.name LIKE ?
+             OR EXISTS (SELECT 1 FROM task_history WHERE task_id = tasks.id AND note_text LIKE ?))
+    ''',
+    # Full-text search through the task_fts / task_history_fts indexes (migration 4).
+    # A single IN (... UNION ...) lets the matches drive the lookup by task id.
+    # Params: match query, user id, match query, user id, user id, subject LIKE pattern.
+    'filter_search': '''
+        AND tasks.id IN (
+            SELECT rowid FROM task_fts WHERE task_fts MATCH ?
+            UNION
+            SELECT task_id FROM task_history
+            WHERE user_id = ? AND id IN (SELECT rowid FROM task_history_fts WHERE task_history_fts MATCH ?)
+            UNION
+            SELECT id FROM tasks
+            WHERE user_id = ? AND subject_id IN (SELECT id FROM subjects WHERE user_id = ? AND name LIKE ?)
+        )
+    ''',
+    # Ranked matches (higher score is better). Title hits weigh most, history
+    # notes least. CROSS JOIN keeps the FTS match driving the history lookup.
+    # Snippets are fetched separately for just the returned rows.
+    'search_tasks': '''
+        SELECT tasks.id, tasks.title, tasks.due_date, tasks.priority, tasks.completed,
+               subjects.name as subject_name, subjects.color as subject_color, best.score
+        FROM (
+            SELECT task_id, MAX(score) as score
+            FROM (
+                SELECT rowid as task_id, -bm25(task_fts, 10.0, 4.0) as score
+                FROM task_fts WHERE task_fts MATCH ?
+                UNION ALL
+                SELECT task_history.task_id, -bm25(task_history_fts) * 0.5 as score
+                FROM task_history_fts
+                CROSS JOIN task_history ON task_history.id = task_history_fts.rowid
+                WHERE task_history_fts MATCH ? AND task_history.user_id = ?
+            ) hits
+            GROUP BY task_id
+        ) best
+        JOIN tasks ON tasks.id = best.task_id
+        LEFT JOIN subjects ON tasks.subject_id = subjects.id
+        WHERE tasks.user_id = ?
+        ORDER BY best.score DESC, tasks.id
+        LIMIT ?
+    ''',
+    # Params: start marker, end marker, match query
+    'task_snippets': '''
+        SELECT rowid as task_id, snippet(task_fts, -1, ?, ?, '…', 12) as snippet
+        FROM task_fts WHERE task_fts MATCH ? AND rowid IN ({ids})
+    ''',
+    'history_snippets': '''
+        SELECT task_history.task_id, snippet(task_history_fts, 0, ?, ?, '…', 12) as snippet
+        FROM task_history_fts
+        CROSS JOIN task_history ON task_history.id = task_history_fts.rowid
+        WHERE task_history_fts MATCH ? AND task_history.task_id IN ({ids})
+    ''',
+    # Dashboard page: most urgent first (buckets from urgency.rank_sql), then
+    # priority, then due date, with id as the tie-breaker so
+    # (urgency_rank, priority_rank, due_sort, id) is a unique keyset cursor.
+    'task_page': '''
+        SELECT * FROM (
+            SELECT tasks.id, tasks.title, tasks.due_date, tasks.priority, tasks.completed,
+                   tasks.subject_id, subjects.name as subject_name, subjects.color as subject_color,
+                   {detail_columns}
+                   {urgency_rank} as urgency_rank,
+                   CASE tasks.priority
+                       WHEN 'high' THEN 1
+                       WHEN 'medium' THEN 2
+                       WHEN 'low' THEN 3
+                       ELSE 4
+                   END as priority_rank,
+                   COALESCE({due_date}, '9999-12-31') as due_sort
+            FROM tasks
+            LEFT JOIN subjects ON tasks.subject_id = subjects.id
+            WHERE tasks.user_id = ? {filters}
+        ) page
+        {after}
+        ORDER BY urgency_rank, priority_rank, due_sort, id
+        LIMIT ?
+    ''',
+    # Rows saved before blank dates were stored as NULL may hold '' ("no date")
+    'task_page_due_date': "NULLIF(tasks.due_date, '')",
+    'task_page_details': 'tasks.description, tasks.last_note, tasks.note_count, tasks.notes_updated_at,',
+    'task_page_after': 'WHERE (urgency_rank, priority_rank, due_sort, id) > (?, ?, ?, ?)',
+    'task_counts': '''
+        SELECT COUNT(*) as total_tasks,
+               SUM(CASE WHEN tasks.completed THEN 1 ELSE 0 END) as completed_tasks
+        FROM tasks
+        LEFT JOIN subjects ON tasks.subject_id = subjects.id
+        WHERE tasks.user_id = ? {filters}
+    ''',
+    'order_by_due_date': ' ORDER BY due_date, priority',
+
+    # --- Task history ---
+    'add_task_history': 'INSERT INTO task_history (task_id, user_id, note_text) VALUES (?, ?, ?)',
+    'get_task_note': 'SELECT * FROM task_history WHERE id = ? AND user_id = ?',
+    # Constant-size summary kept on the task row; the notes themselves live in task_history
+    'record_task_note': '''
+        UPDATE tasks
+        SET last_note = ?, note_count = COALESCE(note_count, 0) + 1, notes_updated_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND user_id = ?
+    ''',
+    # Newest first; id is the keyset cursor for older pages
+    'list_task_history': '''
+        SELECT * FROM task_history
+        WHERE task_id = ? AND user_id = ? {before}
+        ORDER BY id DESC
+        LIMIT ?
+    ''',
+    'task_history_before': 'AND id < ?',
+
+    # --- Archives (archive.py): a user's rows in id order ---
+    'archive_subjects': 'SELECT id, name, color FROM subjects WHERE user_id = ? ORDER BY id',
+    'archive_tasks': '''
+        SELECT id, subject_id, title, description, due_date, priority, completed, created_at,
+               last_note, note_count, notes_updated_at
+        FROM tasks WHERE user_id = ? ORDER BY id
+    ''',
+    'archive_task_history': 'SELECT id, task_id, note_text, created_at FROM task_history WHERE user_id = ? ORDER BY id',
+    'archive_study_sessions': '''
+        SELECT id, subject_id, duration_minutes, notes, session_type, created_at
+        FROM study_sessions WHERE user_id = ? ORDER BY id
+    ''',
+    # First id above anything AUTOINCREMENT has handed out (caller holds the write lock)
+    'reserve_ids': '''
+        SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0),
+                   COALESCE((SELECT MAX(id) FROM {table}), 0)) + 1 as first_id
+    ''',
+
+    # --- Study sessions ---
+    'create_study_session': '''
+        INSERT INTO study_sessions (user_id, subject_id, duration_minutes, notes, session_type, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''',
+    'recent_study_sessions': '''
+        SELECT study_sessions.*, subjects.name as subject_name
+        FROM study_sessions
+        LEFT JOIN subjects ON study_sessions.subject_id = subjects.id
+        WHERE study_sessions.user_id = ?
+        ORDER BY study_sessions.created_at DESC
+        LIMIT ?
+    ''',
+    'list_study_sessions_between': '''
+        SELECT study_sessions.id, study_sessions.duration_minutes, study_sessions.notes,
+               study_sessions.session_type, study_sessions.created_at, subjects.name as subject_name
+        FROM study_sessions
+        LEFT JOIN subjects ON study_sessions.subject_id = subjects.id
+        WHERE study_sessions.user_id = ? AND study_sessions.created_at >= ? AND study_sessions.created_at < ?
+        ORDER BY study_sessions.created_at
+    ''',
+    # Stats read study_daily_totals: one row per user, study day and subject (0 for
+    # none), kept up to date by study.record_session
+    'record_study_rollup': '''
+        INSERT INTO study_daily_totals (user_id, study_date, subject_id, total_minutes, session_count)
+        VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT (user_id, study_date, subject_id) DO UPDATE SET
+            total_minutes = study_daily_totals.total_minutes + excluded.total_minutes,
+            session_count = study_daily_totals.session_count + excluded.session_count
+    ''',
+    # Migration 7's backfill, by UTC day; study.reconcile() rebuilds in STUDY_TIMEZONE days.
+    # Params: none, or the user id when {users} is the user filter
+    'rebuild_study_rollups': '''
+        INSERT INTO study_daily_totals (user_id, study_date, subject_id, total_minutes, session_count)
+        SELECT user_id, date(created_at), COALESCE(subject_id, 0), SUM(duration_minutes), COUNT(*)
+        FROM study_sessions {users}
+        GROUP BY user_id, date(created_at), COALESCE(subject_id, 0)
+    ''',
+    # Params: none, or the user id when {users} is the user filter
+    'study_session_rows': 'SELECT user_id, subject_id, duration_minutes, created_at FROM study_sessions {users}',
+    'study_rollup_rows': '''
+        SELECT user_id, study_date, subject_id, total_minutes, session_count
+        FROM study_daily_totals {users}
+        ORDER BY user_id, study_date
+    ''',
+    # Streaks: the run of consecutive study days ending at last_study_date, and the
+    # longest run. Params: user, study day, the day before (twice).
+    'record_study_day': '''
+        INSERT INTO study_streaks (user_id, current_streak, longest_streak, last_study_date)
+        VALUES (?, 1, 1, ?)
+        ON CONFLICT (user_id) DO UPDATE SET
+            current_streak = CASE
+                WHEN study_streaks.last_study_date = excluded.last_study_date THEN study_streaks.current_streak
+                WHEN study_streaks.last_study_date = ? THEN study_streaks.current_streak + 1
+                ELSE 1 END,
+            longest_streak = MAX(study_streaks.longest_streak, CASE
+                WHEN study_streaks.last_study_date = excluded.last_study_date THEN study_streaks.current_streak
+                WHEN study_streaks.last_study_date = ? THEN study_streaks.current_streak + 1
+                ELSE 1 END),
+            last_study_date = excluded.last_study_date
+        WHERE study_streaks.last_study_date <= excluded.last_study_date
+    ''',
+    'get_study_streak': '''
+        SELECT current_streak, longest_streak, last_study_date FROM study_streaks WHERE user_id = ?
+    ''',
+    'study_streak_rows': '''
+        SELECT user_id, current_streak, longest_streak, last_study_date FROM study_streaks {users}
+    ''',
+    'daily_study_totals': '''
+        SELECT
+            SUM(total_minutes) as total_minutes,
+            SUM(session_count) as session_count,
+            study_date
+        FROM study_daily_totals
+        WHERE user_id = ? AND study_date >= ?
+        GROUP BY study_date
+        ORDER BY study_date DESC
+    ''',
+    'study_totals': '''
+        SELECT
+            SUM(total_minutes) as total_minutes,
+            SUM(session_count) as total_sessions,
+            SUM(total_minutes) * 1.0 / SUM(session_count) as avg_duration
+        FROM study_daily_totals
+        WHERE user_id = ?
+    ''',
+    'study_totals_by_subject': '''
+        SELECT
+            subjects.name,
+            SUM(study_daily_totals.total_minutes) as total_minutes,
+            SUM(study_daily_totals.session_count) as session_count
+        FROM study_daily_totals
+        LEFT JOIN subjects ON study_daily_totals.subject_id = subjects.id
+        WHERE study_daily_totals.user_id = ?
+        GROUP BY subjects.name
+        ORDER BY total_minutes DESC
+    ''',
+}
+
+POSTGRES_SQL = {
+    # A DATE column can't hold ''
+    'task_page_due_date': 'tasks.due_date',
+    'list_overdue_tasks': '''
+        SELECT tasks.*, subjects.name as subject_name
+        FROM tasks
+        LEFT JOIN subjects ON tasks.subject_id = subjects.id
+        WHERE tasks.user_id = ? AND tasks.completed = ? AND tasks.due_date < ?
+        ORDER BY tasks.due_date, tasks.priority
+    ''',
+    'rebuild_study_rollups': '''
+        INSERT INTO study_daily_totals (user_id, study_date, subject_id, total_minutes, session_count)
+        SELECT user_id, CAST(created_at AS DATE), COALESCE(subject_id, 0), SUM(duration_minutes), COUNT(*)
+        FROM study_sessions {users}
+        GROUP BY user_id, CAST(created_at AS DATE), COALESCE(subject_id, 0)
+    ''',
+    # One row per id, taken from the table's sequence
+    'reserve_ids': "SELECT nextval(pg_get_serial_sequence('{table}', 'id')) as id FROM generate_series(1, ?)",
+    'filter_search_like': '''
+        AND (tasks.title ILIKE ? OR tasks.description ILIKE ? OR subjects.name ILIKE ?
+             OR EXISTS (SELECT 1 FROM task_history WHERE task_id = tasks.id AND note_text ILIKE ?))
+    ''',
+    # Same params as the SQLite version; search_vector columns are GIN indexed
+    'filter_search': '''
+        AND tasks.id IN (
+            SELECT id FROM tasks WHERE search_vector @@ to_tsquery('simple', ?)
+            UNION
+            SELECT task_id FROM task_history
+            WHERE user_id = ? AND search_vector @@ to_tsquery('simple', ?)
+            UNION
+            SELECT id FROM tasks
+            WHERE user_id = ? AND subject_id IN (SELECT id FROM subjects WHERE user_id = ? AND name ILIKE ?)
+        )
+    ''',
+    'search_tasks': '''
+        SELECT tasks.id, tasks.title, tasks.due_date, tasks.priority, tasks.completed,
+               subjects.name as subject_name, subjects.color as subject_color, best.score
+        FROM (
+            SELECT task_id, MAX(score) as score
+            FROM (
+                SELECT tasks.id as task_id, ts_rank(tasks.search_vector, to_tsquery('simple', ?)) as score
+                FROM tasks
+                WHERE tasks.user_id = ? AND tasks.search_vector @@ to_tsquery('simple', ?)
+                UNION ALL
+                SELECT task_id, ts_rank(search_vector, to_tsquery('simple', ?)) * 0.5 as score
+                FROM task_history
+                WHERE user_id = ? AND search_vector @@ to_tsquery('simple', ?)
+            ) hits
+            GROUP BY task_id
+        ) best
+        JOIN tasks ON tasks.id = best.task_id
+        LEFT JOIN subjects ON tasks.subject_id = subjects.id
+        ORDER BY best.score DESC, tasks.id
+        LIMIT ?
+    ''',
+    # Params: headline options, query
+    'task_snippets': '''
+        SELECT id as task_id,
+               ts_headline('simple', concat_ws(' ', title, description), q, ?) as snippet
+        FROM tasks, to_tsquery('simple', ?) q
+        WHERE search_vector @@ q AND id IN ({ids})
+    ''',
+    'history_snippets': '''
+        SELECT DISTINCT ON (task_id) task_id, ts_headline('simple', note_text, q, ?) as snippet
+        FROM task_history, to_tsquery('simple', ?) q
+        WHERE search_vector @@ q AND task_id IN ({ids})
+        ORDER BY task_id, created_at DESC
+    ''',
+    'record_study_day': '''
+        INSERT INTO study_streaks (user_id, current_streak, longest_streak, last_study_date)
+        VALUES (?, 1, 1, ?)
+        ON CONFLICT (user_id) DO UPDATE SET
+            current_streak = CASE
+                WHEN study_streaks.last_study_date = excluded.last_study_date THEN study_streaks.current_streak
+                WHEN study_streaks.last_study_date = ? THEN study_streaks.current_streak + 1
+                ELSE 1 END,
+            longest_streak = GREATEST(study_streaks.longest_streak, CASE
+                WHEN study_streaks.last_study_date = excluded.last_study_date THEN study_streaks.current_streak
+                WHEN study_streaks.last_study_date = ? THEN study_streaks.current_streak + 1
+                ELSE 1 END),
+            last_study_date = excluded.last_study_date
+        WHERE study_streaks.last_study_date <= excluded.last_study_date
+    ''',
+}
+
+SQLITE = 'sqlite'
+POSTGRES = 'postgres'
+
+
+def dialect_of(conn):
+    """Work out which SQL dialect a DB-API connection speaks"""
+    # Wrappers such as metrics.InstrumentedConnection keep the driver's connection here
+    conn = getattr(conn, 'raw_connection', conn)
+    if isinstance(conn, sqlite3.Connection):
+        return SQLITE
+    return POSTGRES
+
+
+def translate(statement, dialect):
+    """Convert "?" placeholders to the driver's paramstyle"""
+    if dialect == SQLITE:
+        return statement
+    # psycopg2 uses %s and needs literal percent signs doubled
+    return statement.replace('%', '%%').replace('?', '%s')
+
+
+def sql(name, dialect=SQLITE):
+    if dialect == POSTGRES and name in POSTGRES_SQL:
+        return POSTGRES_SQL[name]
+    return SQL[name]
+
+
+def _to_python(value):
+    # Keep PostgreSQL values in the same shape sqlite3 hands back to templates
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _map_row(cur, row, dialect):
+    if row is None:
+        return None
+    columns = [col[0] for col in cur.description]
+    if dialect == SQLITE:
+        return dict(zip(columns, row))
+    return {col: _to_python(value) for col, value in zip(columns, row)}
+
+
+def run(conn, statement, params=()):
+    """Execute raw "?"-style SQL and return the cursor"""
+    dialect = dialect_of(conn)
+    cur = conn.cursor()
+    cur.execute(translate(statement, dialect), tuple(params))
+    return cur
+
+
+def fetch_all(conn, statement, params=()):
+    dialect = dialect_of(conn)
+    cur = run(conn, statement, params)
+    try:
+        return [_map_row(cur, row, dialect) for row in cur.fetchall()]
+    finally:
+        cur.close()
+
+
+def fetch_one(conn, statement, params=()):
+    dialect = dialect_of(conn)
+    cur = run(conn, statement, params)
+    try:
+        return _map_row(cur, cur.fetchone(), dialect)
+    finally:
+        cur.close()
+
+
+def iter_rows(conn, statement, params=(), batch_size=500):
+    """Yield rows as dicts, fetching batch_size at a time.
+
+    PostgreSQL gets a named (server-side) cursor so the result set stays on
+    the server; SQLite steps through the result as rows are fetched anyway.
+    """
+    dialect = dialect_of(conn)
+    if dialect == SQLITE:
+        cur = run(conn, statement, params)
+    else:
+        cur = conn.cursor(name=f'iter_rows_{uuid.uuid4().hex}')
+        cur.itersize = batch_size
+        cur.execute(translate(statement, dialect), tuple(params))
+    try:
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield _map_row(cur, row, dialect)
+    finally:
+        cur.close()
+
+
+def execute(conn, statement, params=()):
+    """Run a write statement and return the number of affected rows"""
+    cur = run(conn, statement, params)
+    try:
+        return cur.rowcount
+    finally:
+        cur.close()
+
+
+def insert(conn, statement, params=()):
+    """Run an INSERT and return the new row id"""
+    dialect = dialect_of(conn)
+    if dialect == POSTGRES:
+        statement = statement.rstrip() + ' RETURNING id'
+    cur = run(conn, statement, params)
+    try:
+        if dialect == POSTGRES:
+            return cur.fetchone()[0]
+        return cur.lastrowid
+    finally:
+        cur.close()
+
+
+def execute_many(conn, statement, rows, page_size=1000):
+    """Run one write statement for every params tuple in rows (executemany / execute_batch)"""
+    dialect = dialect_of(conn)
+    cur = conn.cursor()
+    try:
+        if dialect == SQLITE:
+            cur.executemany(statement, rows)
+        else:
+            from psycopg2.extras import execute_batch
+            execute_batch(cur, translate(statement, dialect), rows, page_size=page_size)
+    finally:
+        cur.close()
+
+
+def insert_many(conn, table, columns, rows, page_size=1000):
+    """Insert a batch of row tuples: executemany on SQLite, multi-row VALUES pages on PostgreSQL"""
+    column_list = ', '.join(columns)
+    if dialect_of(conn) == SQLITE:
+        placeholders = ', '.join('?' * len(columns))
+        conn.executemany(f'INSERT INTO {table} ({column_list}) VALUES ({placeholders})', rows)
+        return
+    from psycopg2.extras import execute_values
+    cur = conn.cursor()
+    try:
+        execute_values(cur, f'INSERT INTO {table} ({column_list}) VALUES %s', rows, page_size=page_size)
+    finally:
+        cur.close()
+
+
+def reserve_ids(conn, table, count):
+    """Ids for count new rows of table, so they can be inserted (and referenced) in a batch"""
+    statement = named(conn, 'reserve_ids').format(table=table)
+    if dialect_of(conn) == SQLITE:
+        first_id = fetch_one(conn, statement, (table,))['first_id']
+        return list(range(first_id, first_id + count))
+    return [row['id'] for row in fetch_all(conn, statement, (count,))]
+
+
+def named(conn, name):
+    return sql(name, dialect_of(conn))
+
+
+# -------------------- USERS --------------------
+
+def find_user_by_name_or_email(conn, username, email):
+    return fetch_one(conn, named(conn, 'find_user_by_name_or_email'), (username, email))
+
+
+def find_user_by_login(conn, username, password_hash):
+    return fetch_one(conn, named(conn, 'find_user_by_login'), (username, password_hash))
+
+
+def create_user(conn, username, email, password_hash, created_at):
+    return insert(conn, named(conn, 'create_user'), (username, email, password_hash, created_at))
+
+
+def find_user_by_username(conn, username):
+    return fetch_one(conn, named(conn, 'find_user_by_username'), (username,))
+
+
+def touch_user_data(conn, user_id):
+    execute(conn, named(conn, 'touch_user_data'), (user_id,))
+
+
+def user_data_version(conn, user_id):
+    return fetch_one(conn, named(conn, 'user_data_version'), (user_id,))
+
+
+def find_user_by_calendar_token(conn, token):
+    return fetch_one(conn, named(conn, 'find_user_by_calendar_token'), (token,))
+
+
+def set_calendar_token(conn, user_id, token):
+    execute(conn, named(conn, 'set_calendar_token'), (token, user_id))
+
+
+# -------------------- SUBJECTS --------------------
+
+def list_subjects(conn, user_id):
+    return fetch_all(conn, named(conn, 'list_subjects'), (user_id,))
+
+
+def create_subject(conn, user_id, name):
+    return insert(conn, named(conn, 'create_subject'), (user_id, name))
+
+
+def delete_subject(conn, user_id, subject_id):
+    # Remove subject from tasks first
+    execute(conn, named(conn, 'unassign_subject'), (subject_id, user_id))
+    return execute(conn, named(conn, 'delete_subject'), (subject_id, user_id))
+
+
+# -------------------- TASKS --------------------
+
+def due_date_value(due_date):
+    """A due date as stored: blank (the dashboard form's "no date") becomes NULL.
+
+    Postgres rejects '' for a DATE column, and in SQLite '' would sort and
+    compare as a date earlier than every real one.
+    """
+    return due_date or None
+
+
+def create_task(conn, user_id, title, description, due_date, priority, subject_id=None):
+    return insert(conn, named(conn, 'create_task'),
+                  (user_id, title, description, due_date_value(due_date), priority, subject_id or None))
+
+
+def set_task_completed(conn, user_id, task_id, completed=True):
+    return execute(conn, named(conn, 'set_task_completed'), (completed, task_id, user_id))
+
+
+def delete_task(conn, user_id, task_id):
+    return execute(conn, named(conn, 'delete_task'), (task_id, user_id))
+
+
+def update_task_date(conn, user_id, task_id, new_date):
+    return execute(conn, named(conn, 'update_task_date'), (due_date_value(new_date), task_id, user_id))
+
+
+# Columns a task update may set
+TASK_FIELDS = ('title', 'description', 'due_date', 'priority', 'subject_id', 'completed')
+
+
+def update_task(conn, user_id, task_id, fields):
+    """Set the given TASK_FIELDS on one task; returns the number of rows changed"""
+    columns = [column for column in TASK_FIELDS if column in fields]
+    if not columns:
+        return 0
+    if 'due_date' in fields:
+        fields = dict(fields, due_date=due_date_value(fields['due_date']))
+    statement = named(conn, 'update_task').format(assignments=', '.join(f'{column} = ?' for column in columns))
+    return execute(conn, statement, [fields[column] for column in columns] + [task_id, user_id])
+
+
+def get_task(conn, user_id, task_id):
+    return fetch_one(conn, named(conn, 'get_task'), (task_id, user_id))
+
+
+def owned_task_ids(conn, user_id, task_ids, chunk_size=500):
+    """The subset of task_ids that belong to the user"""
+    task_ids = sorted({int(task_id) for task_id in task_ids})
+    owned = set()
+    for start in range(0, len(task_ids), chunk_size):
+        ids = ', '.join(str(task_id) for task_id in task_ids[start:start + chunk_size])
+        owned.update(row['id'] for row in fetch_all(conn, named(conn, 'owned_task_ids').format(ids=ids), (user_id,)))
+    return owned
+
+
+def apply_task_batch(conn, user_id, completes=(), reschedules=(), reassigns=(), deletes=()):
+    """Many task changes, one executemany per kind (deletes last); the caller commits.
+
+    ``reschedules`` are (task_id, due_date) pairs, ``reassigns`` (task_id, subject_id).
+    """
+    execute_many(conn, named(conn, 'set_task_completed'),
+                 [(True, task_id, user_id) for task_id in completes])
+    execute_many(conn, named(conn, 'update_task_date'),
+                 [(due_date_value(due_date), task_id, user_id) for task_id, due_date in reschedules])
+    execute_many(conn, named(conn, 'set_task_subject'),
+                 [(subject_id, task_id, user_id) for task_id, subject_id in reassigns])
+    execute_many(conn, named(conn, 'delete_task'),
+                 [(task_id, user_id) for task_id in deletes])
+
+
+# Snippet highlight markers; replaced with <mark> after HTML-escaping the text
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+
+def search_terms(text):
+    """Words from a search box, lower-cased (punctuation is dropped)"""
+    return re.findall(r'\w+', text.lower())
+
+
+def fts_query(conn, text):
+    """Prefix-matching full-text query for the connection's dialect, or None"""
+    terms = search_terms(text)
+    if not terms:
+        return None
+    if dialect_of(conn) == SQLITE:
+        # FTS5: every term must appear, each one as a prefix
+        return ' '.join(f'"{term}"*' for term in terms)
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def search_filter(conn, user_id, search_query, use_fts=True):
+    """WHERE clause (and params) restricting tasks to a search"""
+    query = fts_query(conn, search_query) if use_fts else None
+    if query is None:
+        # Nothing indexable (e.g. only punctuation) - fall back to a substring match
+        return named(conn, 'filter_search_like'), [f'%{search_query}%'] * 4
+    return named(conn, 'filter_search'), [query, user_id, query, user_id, user_id, f'%{search_query}%']
+
+
+def search_tasks(conn, user_id, search_query, limit=10):
+    """Best full-text matches, highest score first, each with a snippet"""
+    query = fts_query(conn, search_query)
+    if query is None:
+        return []
+    dialect = dialect_of(conn)
+    if dialect == SQLITE:
+        params = (query, query, user_id, user_id, limit)
+        snippet_params = (MARK_START, MARK_END, query)
+    else:
+        params = (query, user_id, query, query, user_id, query, limit)
+        options = f'StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=15, MinWords=5'
+        snippet_params = (options, query)
+    results = fetch_all(conn, named(conn, 'search_tasks'), params)
+    if not results:
+        return results
+
+    # Highlight only the rows we return; prefer a hit in the task itself over one in its notes
+    ids = ', '.join(str(int(result['id'])) for result in results)
+    snippets = {}
+    for name in ('history_snippets', 'task_snippets'):
+        for row in fetch_all(conn, named(conn, name).format(ids=ids), snippet_params):
+            snippets[row['task_id']] = row['snippet']
+    for result in results:
+        result['snippet'] = snippets.get(result['id'], '')
+    return results
+
+
+def _task_filters(conn, user_id, subject_filter, search_query):
+    """Extra WHERE clauses (and their params) for the subject/search filters"""
+    clauses = ''
+    params = []
+
+    if subject_filter != 'all':
+        clauses += named(conn, 'filter_subject')
+        params.append(subject_filter)
+
+    if search_query:
+        clause, search_params = search_filter(conn, user_id, search_query)
+        clauses += clause
+        params.extend(search_params)
+
+    return clauses, params
+
+
+def list_tasks(conn, user_id, subject_filter='all', search_query=''):
+    """Tasks matching the dashboard filters, sorted by due date (used by exports)"""
+    filters, filter_params = _task_filters(conn, user_id, subject_filter, search_query)
+    statement = named(conn, 'task_list_base') + filters + named(conn, 'order_by_due_date')
+    return fetch_all(conn, statement, [user_id] + filter_params)
+
+
+def iter_tasks(conn, user_id, subject_filter='all', search_query='', batch_size=500):
+    """Same rows as list_tasks(), fetched in batches (for streaming exports)"""
+    filters, filter_params = _task_filters(conn, user_id, subject_filter, search_query)
+    statement = named(conn, 'task_list_base') + filters + named(conn, 'order_by_due_date')
+    return iter_rows(conn, statement, [user_id] + filter_params, batch_size)
+
+
+def encode_cursor(task):
+    return f"{task['urgency_rank']}.{task['priority_rank']}.{task['due_sort']}.{task['id']}"
+
+
+def decode_cursor(cursor, dates_only=False):
+    """Split a page cursor back into its sort key; raises ValueError if malformed.
+
+    SQLite keeps due dates as text, so due_sort may be any string (even one
+    with dots) there; ``dates_only`` requires a real date, as Postgres does.
+    """
+    urgency_rank, priority_rank, rest = cursor.split('.', 2)
+    due_sort, task_id = rest.rsplit('.', 1)
+    if dates_only:
+        date.fromisoformat(due_sort)
+    return int(urgency_rank), int(priority_rank), due_sort, int(task_id)
+
+
+def list_task_page(conn, user_id, today, subject_filter='all', search_query='',
+                   limit=50, after=None, details=True):
+    """One page of the dashboard task list, most urgent first.
+
+    ``after`` is the cursor returned with the previous page. ``details``
+    adds the description and the latest-note summary, which only the HTML
+    dashboard shows. Returns ``(tasks, next_cursor)``; ``next_cursor`` is
+    None on the last page.
+    """
+    filters, filter_params = _task_filters(conn, user_id, subject_filter, search_query)
+    params = Urgency(today).sql_params() + [user_id] + filter_params
+
+    after_clause = ''
+    if after:
+        after_clause = named(conn, 'task_page_after')
+        params.extend(decode_cursor(after, dates_only=dialect_of(conn) == POSTGRES))
+
+    statement = named(conn, 'task_page').format(
+        detail_columns=named(conn, 'task_page_details') if details else '',
+        urgency_rank=rank_sql(named(conn, 'task_page_due_date')),
+        due_date=named(conn, 'task_page_due_date'),
+        filters=filters,
+        after=after_clause,
+    )
+    # Fetch one extra row to find out whether there is another page
+    params.append(limit + 1)
+    tasks = fetch_all(conn, statement, params)
+
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = encode_cursor(tasks[-1])
+    return tasks, next_cursor
+
+
+def task_counts(conn, user_id, subject_filter='all', search_query=''):
+    """Total and completed counts for the filtered task list in one query"""
+    filters, filter_params = _task_filters(conn, user_id, subject_filter, search_query)
+    row = fetch_one(conn, named(conn, 'task_counts').format(filters=filters), [user_id] + filter_params)
+    total = row['total_tasks'] or 0
+    completed = row['completed_tasks'] or 0
+    return {'total_tasks': total, 'completed_tasks': completed, 'pending_tasks': total - completed}
+
+
+def list_pending_tasks(conn, user_id):
+    return fetch_all(conn, named(conn, 'list_pending_tasks'), (user_id, False))
+
+
+def month_range(year, month):
+    """First day of the month and first day of the next one, as ISO strings"""
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start.isoformat(), end.isoformat()
+
+
+def calendar_month_days(conn, user_id, year, month):
+    """Per-due-date task counts (total, per priority, completed) for one month"""
+    # A plain date range lets the (user_id, due_date) index do the work
+    start, end = month_range(year, month)
+    return fetch_all(conn, named(conn, 'calendar_month_days'), (user_id, start, end))
+
+
+def list_pending_tasks_between(conn, user_id, start, end):
+    return fetch_all(conn, named(conn, 'list_pending_tasks_between'),
+                     (user_id, False, start.isoformat(), end.isoformat()))
+
+
+def list_overdue_tasks(conn, user_id, today):
+    return fetch_all(conn, named(conn, 'list_overdue_tasks'), (user_id, False, today.isoformat()))
+
+
+def list_tasks_between(conn, user_id, start, end):
+    return fetch_all(conn, named(conn, 'list_tasks_between'), (user_id, start.isoformat(), end.isoformat()))
+
+
+def list_tasks_for_day(conn, user_id, day):
+    return fetch_all(conn, named(conn, 'list_tasks_for_day'), (user_id, day))
+
+
+# -------------------- TASK HISTORY --------------------
+
+def add_task_history(conn, user_id, task_id, note_text):
+    return insert(conn, named(conn, 'add_task_history'), (task_id, user_id, note_text))
+
+
+def add_task_note(conn, user_id, task_id, note_text):
+    """Record a progress note and update the task's summary.
+
+    Returns the new note's id, or None if the task isn't the user's.
+    """
+    # The summary update doubles as the ownership check
+    if not execute(conn, named(conn, 'record_task_note'), (note_text, task_id, user_id)):
+        return None
+    return add_task_history(conn, user_id, task_id, note_text)
+
+
+def get_task_note(conn, user_id, note_id):
+    return fetch_one(conn, named(conn, 'get_task_note'), (note_id, user_id))
+
+
+def list_task_history(conn, user_id, task_id, limit=20, before=None):
+    """One page of a task's notes, newest first.
+
+    Returns ``(notes, next_before)``; pass ``next_before`` back as ``before``
+    for the next (older) page. It is None on the last page.
+    """
+    before_clause = ''
+    params = [task_id, user_id]
+    if before is not None:
+        before_clause = named(conn, 'task_history_before')
+        params.append(before)
+    # One extra row tells us whether there is an older page
+    params.append(limit + 1)
+    statement = named(conn, 'list_task_history').format(before=before_clause)
+    notes = fetch_all(conn, statement, params)
+
+    next_before = None
+    if len(notes) > limit:
+        notes = notes[:limit]
+        next_before = notes[-1]['id']
+    return notes, next_before
+
+
+# -------------------- ARCHIVES --------------------
+
+def archive_rows(conn, table, user_id, batch_size=1000):
+    """A user's rows of one archived table (see archive.TABLES), in id order"""
+    return iter_rows(conn, named(conn, f'archive_{table}'), (user_id,), batch_size)
+
+
+# -------------------- STUDY SESSIONS --------------------
+
+def create_study_session(conn, user_id, subject_id, duration_minutes, notes, session_type, created_at):
+    """Insert a session row only; study.record_session also updates the rollup and streak"""
+    return insert(conn, named(conn, 'create_study_session'),
+                  (user_id, subject_id or None, duration_minutes, notes, session_type, created_at))
+
+
+def record_study_rollup(conn, user_id, study_date, subject_id, duration_minutes):
+    execute(conn, named(conn, 'record_study_rollup'),
+            (user_id, study_date.isoformat(), subject_id or 0, duration_minutes))
+
+
+def record_study_day(conn, user_id, study_date):
+    day_before = (study_date - timedelta(days=1)).isoformat()
+    execute(conn, named(conn, 'record_study_day'), (user_id, study_date.isoformat(), day_before, day_before))
+
+
+def get_study_streak(conn, user_id):
+    return fetch_one(conn, named(conn, 'get_study_streak'), (user_id,))
+
+
+def _user_filter(user_id):
+    return ('', ()) if user_id is None else ('WHERE user_id = ?', (user_id,))
+
+
+def rebuild_study_rollups(conn, user_id=None):
+    """Recompute study_daily_totals from study_sessions by UTC day (migration 7's backfill)"""
+    if user_id is None:
+        execute(conn, 'DELETE FROM study_daily_totals')
+        execute(conn, named(conn, 'rebuild_study_rollups').format(users=''))
+        return
+    execute(conn, 'DELETE FROM study_daily_totals WHERE user_id = ?', (user_id,))
+    execute(conn, named(conn, 'rebuild_study_rollups').format(users='WHERE user_id = ?'), (user_id,))
+
+
+def study_session_rows(conn, user_id=None, batch_size=1000):
+    """Every study session (user_id, subject_id, duration_minutes, created_at), in batches"""
+    users, params = _user_filter(user_id)
+    return iter_rows(conn, named(conn, 'study_session_rows').format(users=users), params, batch_size)
+
+
+def study_rollup_rows(conn, user_id=None):
+    users, params = _user_filter(user_id)
+    return fetch_all(conn, named(conn, 'study_rollup_rows').format(users=users), params)
+
+
+def study_streak_rows(conn, user_id=None):
+    users, params = _user_filter(user_id)
+    return fetch_all(conn, named(conn, 'study_streak_rows').format(users=users), params)
+
+
+def replace_rows(conn, table, user_id, columns, rows):
+    """Swap one user's (or with user_id None, everyone's) rows of a derived table for rows"""
+    users, params = _user_filter(user_id)
+    execute(conn, f'DELETE FROM {table} {users}', params)
+    insert_many(conn, table, columns, rows)
+
+
+def recent_study_sessions(conn, user_id, limit=10):
+    return fetch_all(conn, named(conn, 'recent_study_sessions'), (user_id, limit))
+
+
+def list_study_sessions_between(conn, user_id, start, end):
+    return fetch_all(conn, named(conn, 'list_study_sessions_between'),
+                     (user_id, start.isoformat(), end.isoformat()))
+
+
+def daily_study_totals(conn, user_id, since):
+    return fetch_all(conn, named(conn, 'daily_study_totals'), (user_id, since.isoformat()))
+
+
+def study_totals(conn, user_id):
+    return fetch_one(conn, named(conn, 'study_totals'), (user_id,))
+
+
+def study_totals_by_subject(conn, user_id):
+    return fetch_all(conn, named(conn, 'study_totals_by_subject'), (user_id,))
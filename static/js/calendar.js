@@ -0,0 +1,25 @@
+// Live updates (live.js): redraw the month grid and totals when tasks change
+if (typeof liveUpdates !== 'undefined') {
+    let pending = null;
+
+    // A batch or a burst of edits makes one request
+    function refreshCalendar() {
+        clearTimeout(pending);
+        pending = setTimeout(async () => {
+            const response = await fetch(location.href, {cache: 'no-store'});
+            if (!response.ok) return;
+            const page = new DOMParser().parseFromString(await response.text(), 'text/html');
+            for (const id of ['calendar-grid', 'calendar-stats']) {
+                const fresh = page.getElementById(id);
+                if (fresh) document.getElementById(id).replaceWith(fresh);
+            }
+        }, 300);
+    }
+
+    liveUpdates.on({
+        change(change) {
+            if (['create', 'update', 'delete'].includes(change.op)) refreshCalendar();
+        },
+        resync: refreshCalendar
+    });
+}
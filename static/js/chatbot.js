@@ -0,0 +1,137 @@
+function addMessage(message, isUser = false) {
+    const chatContainer = document.getElementById('chat-container');
+    const messageDiv = document.createElement('div');
+
+    if (isUser) {
+        messageDiv.style.background = 'linear-gradient(135deg, #667eea 0%, #764ba2 100%)';
+        messageDiv.style.color = 'white';
+        messageDiv.style.marginLeft = 'auto';
+        messageDiv.style.borderBottomRightRadius = '8px';
+        messageDiv.style.borderBottomLeftRadius = '18px';
+        messageDiv.innerHTML = `<strong>You:</strong> ${message}`;
+    } else {
+        messageDiv.style.background = 'white';
+        messageDiv.style.borderBottomLeftRadius = '8px';
+        messageDiv.style.borderBottomRightRadius = '18px';
+        messageDiv.innerHTML = `<strong>AI Assistant:</strong> ${message}`;
+    }
+
+    messageDiv.style.padding = '1.2rem';
+    messageDiv.style.margin = '0.8rem 0';
+    messageDiv.style.borderRadius = '18px';
+    messageDiv.style.maxWidth = '85%';
+    messageDiv.style.wordWrap = 'break-word';
+    messageDiv.style.boxShadow = '0 2px 8px rgba(0,0,0,0.1)';
+    messageDiv.style.transition = 'all 0.3s ease';
+
+    chatContainer.appendChild(messageDiv);
+    chatContainer.scrollTop = chatContainer.scrollHeight;
+
+    // Add hover effect
+    messageDiv.addEventListener('mouseenter', function() {
+        this.style.transform = 'translateY(-2px)';
+        this.style.boxShadow = '0 4px 15px rgba(0,0,0,0.15)';
+    });
+
+    messageDiv.addEventListener('mouseleave', function() {
+        this.style.transform = 'translateY(0)';
+        this.style.boxShadow = '0 2px 8px rgba(0,0,0,0.1)';
+    });
+}
+
+async function sendMessage() {
+    const input = document.getElementById('user-input');
+    const message = input.value.trim();
+
+    if (!message) return;
+
+    addMessage(message, true);
+    input.value = '';
+
+    // Show typing indicator
+    const typingIndicator = document.createElement('div');
+    typingIndicator.id = 'typing-indicator';
+    typingIndicator.innerHTML = '<em>AI Assistant is typing...</em>';
+    typingIndicator.style.color = '#666';
+    typingIndicator.style.fontStyle = 'italic';
+    typingIndicator.style.padding = '1rem';
+    typingIndicator.style.textAlign = 'center';
+    typingIndicator.style.background = '#f8f9fa';
+    typingIndicator.style.borderRadius = '10px';
+    typingIndicator.style.margin = '0.5rem 0';
+    document.getElementById('chat-container').appendChild(typingIndicator);
+    document.getElementById('chat-container').scrollTop = document.getElementById('chat-container').scrollHeight;
+
+    try {
+        const response = await fetch('/send_message', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ message: message })
+        });
+
+        // Remove typing indicator
+        document.getElementById('typing-indicator')?.remove();
+
+        const data = await response.json();
+        addMessage(data.response);
+    } catch (error) {
+        // Remove typing indicator
+        document.getElementById('typing-indicator')?.remove();
+        addMessage('Sorry, I encountered an error. Please try again.');
+    }
+}
+
+// Event listeners
+document.getElementById('send-btn').addEventListener('click', sendMessage);
+document.getElementById('user-input').addEventListener('keypress', (e) => {
+    if (e.key === 'Enter') sendMessage();
+});
+
+// Quick suggestions
+document.querySelectorAll('.suggestion-btn').forEach(btn => {
+    btn.addEventListener('click', function() {
+        document.getElementById('user-input').value = this.dataset.message;
+        sendMessage();
+    });
+});
+
+// Input focus effects
+const userInput = document.getElementById('user-input');
+userInput.addEventListener('focus', function() {
+    this.style.borderColor = '#667eea';
+    this.style.boxShadow = '0 0 0 3px rgba(102, 126, 234, 0.1)';
+});
+
+userInput.addEventListener('blur', function() {
+    this.style.borderColor = '#e9ecef';
+    this.style.boxShadow = 'none';
+});
+
+// Button hover effects
+document.getElementById('send-btn').addEventListener('mouseenter', function() {
+    this.style.transform = 'translateY(-2px)';
+    this.style.boxShadow = '0 4px 15px rgba(102, 126, 234, 0.3)';
+});
+
+document.getElementById('send-btn').addEventListener('mouseleave', function() {
+    this.style.transform = 'translateY(0)';
+    this.style.boxShadow = 'none';
+});
+
+// Suggestion button hover effects
+document.querySelectorAll('.suggestion-btn').forEach(btn => {
+    btn.addEventListener('mouseenter', function() {
+        this.style.transform = 'translateY(-2px)';
+        this.style.boxShadow = '0 4px 12px rgba(0,0,0,0.15)';
+    });
+
+    btn.addEventListener('mouseleave', function() {
+        this.style.transform = 'translateY(0)';
+        this.style.boxShadow = 'none';
+    });
+});
+
+// Auto-focus input
+userInput.focus();
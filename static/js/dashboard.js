@@ -0,0 +1,68 @@
+// Infinite scroll: fetch the next page from the JSON API and append it.
+// The filters ride on the load-more link's data attributes.
+const loadMore = document.getElementById('load-more');
+if (loadMore && 'IntersectionObserver' in window) {
+    let loading = false;
+    const observer = new IntersectionObserver(async (entries) => {
+        if (!entries[0].isIntersecting || loading) return;
+        loading = true;
+        const params = new URLSearchParams({
+            subject: loadMore.dataset.subject,
+            search: loadMore.dataset.search,
+            after: loadMore.dataset.cursor,
+            details: '1',
+            html: '1'
+        });
+        const response = await fetch('/api/dashboard/tasks?' + params);
+        const data = await response.json();
+        document.getElementById('task-list').insertAdjacentHTML('beforeend', data.html);
+        if (data.next_cursor) {
+            loadMore.dataset.cursor = data.next_cursor;
+            loading = false;
+        } else {
+            observer.disconnect();
+            loadMore.remove();
+        }
+    });
+    observer.observe(loadMore);
+}
+
+// Live updates (live.js): patch rows and counters changed in another tab or device
+if (typeof liveUpdates !== 'undefined' && taskStats) {
+    const filtered = () => taskStats.dataset.subject !== 'all' || taskStats.dataset.search;
+
+    async function refreshCounts() {
+        const params = new URLSearchParams({subject: taskStats.dataset.subject, search: taskStats.dataset.search, limit: '1'});
+        const data = await (await fetch('/api/dashboard/tasks?' + params)).json();
+        showTaskCounts({total_tasks: data.total_tasks, completed_tasks: data.completed_tasks, pending_tasks: data.pending_tasks});
+    }
+
+    liveUpdates.on({
+        async change(change) {
+            if (!['create', 'update', 'delete', 'note'].includes(change.op)) return;
+            if (change.op === 'delete') {
+                const item = document.getElementById('task-' + change.id);
+                if (item) item.remove();
+                return refreshCounts();
+            }
+            let data;
+            try {
+                data = await callTaskApi('GET', `/api/v1/tasks/${change.id}`);
+            } catch (error) {
+                return;  // Deleted since; its own event removes the row
+            }
+            showTaskCounts(data.counts);
+            // Looked up after the request: another event may have changed the list meanwhile
+            const item = document.getElementById('task-' + change.id);
+            const list = document.getElementById('task-list');
+            if (item) {
+                item.outerHTML = data.html;
+            } else if (change.op === 'create' && !filtered()) {
+                if (list) list.insertAdjacentHTML('afterbegin', data.html); else location.reload();
+            }
+        },
+        resync() {
+            location.reload();
+        }
+    });
+}
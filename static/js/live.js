@@ -0,0 +1,57 @@
+// Live updates: /events (Server-Sent Events) says what changed after every
+// write to this user's data, from another tab, device or the chatbot. Pages
+// register {change(change), resync()} handlers with liveUpdates.on(). Every
+// event carries the user's data version, so a page knows which events it has
+// already shown and when it missed some (then it resyncs).
+const liveClientId = Math.random().toString(36).slice(2);
+
+const liveUpdates = {
+    handlers: [],
+    version: null,
+
+    on(handler) {
+        this.handlers.push(handler);
+    },
+
+    resync() {
+        for (const handler of this.handlers) handler.resync();
+    },
+
+    receive(message) {
+        // No version: the server lost track (a stalled stream, a broker reconnect)
+        if (message.v === null) return this.resync();
+        if (message.v <= this.version) return;
+        const missed = message.v > this.version + 1;
+        this.version = message.v;
+        if (missed) return this.resync();
+        // This tab made the change and has already patched itself
+        if (message.src === liveClientId) return;
+        for (const change of message.changes) {
+            if (change.op === 'resync') return this.resync();
+            for (const handler of this.handlers) handler.change(change);
+        }
+    },
+
+    start(version) {
+        this.version = version;
+        const source = new EventSource('/events');
+        source.addEventListener('hello', (event) => {
+            // Something was committed between rendering the page (or the last stream) and now
+            const current = JSON.parse(event.data).v;
+            if (current !== this.version) {
+                this.version = current;
+                this.resync();
+            }
+        });
+        source.addEventListener('change', (event) => this.receive(JSON.parse(event.data)));
+        source.addEventListener('error', () => {
+            // The browser retries dropped streams itself; a refused one (503) stays closed
+            if (source.readyState === EventSource.CLOSED) setTimeout(() => this.start(this.version), 60000);
+        });
+    }
+};
+
+document.addEventListener('DOMContentLoaded', () => {
+    const live = document.getElementById('live-updates');
+    if (live && 'EventSource' in window) liveUpdates.start(Number(live.dataset.version));
+});
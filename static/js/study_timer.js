@@ -0,0 +1,101 @@
+let timer;
+let timeLeft = 25 * 60; // 25 minutes in seconds
+let isRunning = false;
+let currentSessionType = 'focus';
+
+function updateDisplay() {
+    const minutes = Math.floor(timeLeft / 60);
+    const seconds = timeLeft % 60;
+    document.getElementById('timer-display').textContent = 
+        `${minutes.toString().padStart(2, '0')}:${seconds.toString().padStart(2, '0')}`;
+}
+
+function updateStatus(mainText, helpText = '') {
+    document.getElementById('status-main').textContent = mainText;
+    document.getElementById('status-help').textContent = helpText;
+}
+
+function startTimer(duration, sessionType) {
+    if (isRunning) return;
+
+    timeLeft = duration * 60;
+    currentSessionType = sessionType;
+    isRunning = true;
+
+    const statusText = sessionType === 'focus' ? 'Focus time! 🎯' : 'Break time! ☕';
+    const helpText = sessionType === 'focus' ? 'Stay focused! Timer will auto-complete' : 'Relax! Timer will notify when break ends';
+
+    updateStatus(statusText, helpText);
+
+    // Disable subject selection and notes while timer is running
+    document.getElementById('subject-select').disabled = true;
+    document.getElementById('session-notes').disabled = true;
+
+    timer = setInterval(() => {
+        timeLeft--;
+        updateDisplay();
+
+        if (timeLeft <= 0) {
+            clearInterval(timer);
+            isRunning = false;
+
+            // Show completion summary
+            const subjectSelect = document.getElementById('subject-select');
+            const subjectText = subjectSelect.options[subjectSelect.selectedIndex].text;
+
+            document.getElementById('completed-type').textContent = sessionType;
+            document.getElementById('completed-duration').textContent = duration;
+            document.getElementById('completed-subject').textContent = subjectText;
+
+            document.getElementById('session-form').style.display = 'block';
+            document.getElementById('session-duration').value = duration;
+            document.getElementById('session-type').value = sessionType;
+
+            // Re-enable form elements
+            document.getElementById('subject-select').disabled = false;
+            document.getElementById('session-notes').disabled = false;
+
+            updateStatus('🎉 Session Complete!', 'Click "Save Session" to count this in your statistics');
+
+            // Play completion sound (optional)
+            const audio = new Audio('data:audio/wav;base64,UklGRigAAABXQVZFZm10IBAAAAABAAEARKwAAIhYAQACABAAZGF0YQQAAAAAAA');
+            audio.play().catch(e => console.log('Audio play failed:', e));
+        }
+    }, 1000);
+}
+
+function resetTimer() {
+    clearInterval(timer);
+    isRunning = false;
+    timeLeft = 25 * 60;
+    currentSessionType = 'focus';
+    updateDisplay();
+    updateStatus('Ready to focus! 🎯', 'Timer was reset. Session will not be counted.');
+    document.getElementById('session-form').style.display = 'none';
+
+    // Re-enable form elements
+    document.getElementById('subject-select').disabled = false;
+    document.getElementById('session-notes').disabled = false;
+}
+
+// Set up form submission
+document.getElementById('save-session-form').addEventListener('submit', function(e) {
+    // Copy values from visible fields to hidden form fields
+    document.getElementById('form-subject-id').value = document.getElementById('subject-select').value;
+    document.getElementById('form-notes').value = document.getElementById('session-notes').value;
+
+    updateStatus('💾 Saving session...', 'Redirecting to update statistics');
+});
+
+document.getElementById('skip-save').addEventListener('click', function() {
+    document.getElementById('session-form').style.display = 'none';
+    document.getElementById('session-notes').value = ''; // Clear notes for next session
+    updateStatus('Ready to focus! 🎯', 'Session was not saved. Start a new timer when ready.');
+});
+
+document.getElementById('start-btn').addEventListener('click', () => startTimer(25, 'focus'));
+document.getElementById('break-btn').addEventListener('click', () => startTimer(5, 'break'));
+document.getElementById('reset-btn').addEventListener('click', resetTimer);
+
+// Initialize display
+updateDisplay();
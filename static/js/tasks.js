@@ -0,0 +1,110 @@
+// Task forms marked data-api go through the JSON API (/api/v1/tasks) and patch
+// the page in place; without JavaScript they post to the form routes as before.
+const taskStats = document.getElementById('task-stats');
+
+async function callTaskApi(method, path, body) {
+    const params = new URLSearchParams({html: '1'});
+    if (taskStats) {
+        // Counters come back filtered like the list on the page
+        params.set('subject', taskStats.dataset.subject);
+        params.set('search', taskStats.dataset.search);
+    }
+    const headers = {'Content-Type': 'application/json'};
+    // Lets live.js skip the event for a change this tab already shows
+    if (typeof liveClientId !== 'undefined') headers['X-Live-Client'] = liveClientId;
+    const response = await fetch(path + '?' + params, {
+        method: method,
+        headers: headers,
+        body: body ? JSON.stringify(body) : undefined
+    });
+    const data = await response.json();
+    if (!response.ok) throw new Error(data.error || response.statusText);
+    return data;
+}
+
+function showTaskCounts(counts) {
+    for (const [name, value] of Object.entries(counts)) {
+        const counter = document.getElementById(name.replaceAll('_', '-'));
+        if (counter) counter.textContent = value;
+    }
+}
+
+const taskActions = {
+    async complete(form) {
+        const data = await callTaskApi('POST', `/api/v1/tasks/${form.task_id.value}/complete`);
+        const item = document.getElementById('task-' + data.task.id);
+        if (item) item.outerHTML = data.html;
+        return data;
+    },
+    async delete(form) {
+        const data = await callTaskApi('DELETE', `/api/v1/tasks/${form.task_id.value}`);
+        const item = document.getElementById('task-' + data.id);
+        if (item) item.remove();
+        return data;
+    },
+    async create(form) {
+        const data = await callTaskApi('POST', '/api/v1/tasks', Object.fromEntries(new FormData(form)));
+        const list = document.getElementById('task-list');
+        if (!list || taskStats.dataset.subject !== 'all' || taskStats.dataset.search) {
+            // The new task may not belong in a filtered (or still empty) list
+            location.reload();
+            return data;
+        }
+        list.insertAdjacentHTML('afterbegin', data.html);
+        form.reset();
+        return data;
+    },
+    async note(form) {
+        const data = await callTaskApi('POST', `/api/v1/tasks/${form.dataset.taskId}/notes`,
+                                       Object.fromEntries(new FormData(form)));
+        document.getElementById('history-list').insertAdjacentHTML('afterbegin', data.note_html);
+        const empty = document.getElementById('no-history');
+        if (empty) empty.remove();
+        form.reset();
+        return data;
+    }
+};
+
+document.addEventListener('submit', async (event) => {
+    const action = taskActions[event.target.dataset.api];
+    if (!action) return;
+    event.preventDefault();
+    try {
+        const data = await action(event.target);
+        if (data.counts) showTaskCounts(data.counts);
+    } catch (error) {
+        alert(error.message);
+    }
+});
+
+// Bulk actions: every ticked task in one batch request
+const bulkActions = document.getElementById('bulk-actions');
+if (bulkActions) {
+    const selectedTaskIds = () => [...document.querySelectorAll('.task-select:checked')].map((box) => Number(box.value));
+
+    document.addEventListener('change', (event) => {
+        if (!event.target.classList.contains('task-select')) return;
+        const count = selectedTaskIds().length;
+        document.getElementById('bulk-count').textContent = count;
+        bulkActions.hidden = count === 0;
+    });
+
+    bulkActions.addEventListener('click', async (event) => {
+        const op = event.target.dataset.op;
+        if (!op) return;
+        const body = {op: op, ids: selectedTaskIds()};
+        if (op === 'reschedule') body.due_date = document.getElementById('bulk-date').value;
+        if (op === 'reassign') body.subject_id = document.getElementById('bulk-subject').value;
+        if (op === 'delete' && !confirm(`Delete ${body.ids.length} tasks?`)) return;
+        try {
+            const data = await callTaskApi('POST', '/api/v1/tasks/batch', body);
+            const failed = data.results.filter((result) => !result.ok);
+            if (failed.length) alert(`${failed.length} not changed: ${failed[0].error}`);
+        } catch (error) {
+            alert(error.message);
+            return;
+        }
+        // Rows may move or leave the filtered list, so show the list afresh
+        location.reload();
+    });
+}
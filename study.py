@@ -0,0 +1,144 @@
+"""Study sessions and the state derived from them: daily totals and streaks.
+
+Sessions are stored with UTC timestamps; a session counts toward the study
+day it falls on in STUDY_TIMEZONE. Saving a session updates its rollup row
+and the user's streak in the same transaction. The reconciler rebuilds both
+from study_sessions (run it from cron, or after importing data by hand):
+
+    python study.py reconcile [--user ID]
+    python study.py verify
+"""
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import queries
+
+# Where a study day starts and ends, e.g. "America/New_York" (override on Render)
+STUDY_TIMEZONE = ZoneInfo(os.environ.get('STUDY_TIMEZONE', 'UTC'))
+
+ROLLUP_COLUMNS = ['user_id', 'study_date', 'subject_id', 'total_minutes', 'session_count']
+STREAK_COLUMNS = ['user_id', 'current_streak', 'longest_streak', 'last_study_date']
+
+
+def study_day(created_at):
+    """The STUDY_TIMEZONE date of a stored (naive UTC) session timestamp"""
+    moment = datetime.fromisoformat(str(created_at)).replace(tzinfo=timezone.utc)
+    return moment.astimezone(STUDY_TIMEZONE).date()
+
+
+def today():
+    return datetime.now(STUDY_TIMEZONE).date()
+
+
+def record_session(conn, user_id, subject_id, duration_minutes, notes, session_type):
+    """Save a study session with its rollup and streak updates; the caller commits"""
+    now = datetime.now(timezone.utc).replace(microsecond=0, tzinfo=None)
+    session_id = queries.create_study_session(conn, user_id, subject_id, duration_minutes, notes,
+                                              session_type, now.isoformat(sep=' '))
+    day = study_day(now)
+    queries.record_study_rollup(conn, user_id, day, subject_id, int(duration_minutes))
+    queries.record_study_day(conn, user_id, day)
+    return session_id
+
+
+def streak(conn, user_id):
+    """Current and longest streak in days; one primary key lookup"""
+    row = queries.get_study_streak(conn, user_id)
+    if row is None:
+        return {'current_streak': 0, 'longest_streak': 0, 'last_study_date': None}
+    # The stored run ends on the last study day; it's broken once a whole day passes without one
+    last = datetime.fromisoformat(str(row['last_study_date'])).date()
+    current = row['current_streak'] if last >= today() - timedelta(days=1) else 0
+    return {'current_streak': current, 'longest_streak': row['longest_streak'],
+            'last_study_date': last.isoformat()}
+
+
+def streaks_from_days(days):
+    """(current run, longest run, last day) for a sorted list of distinct dates"""
+    current = longest = 0
+    previous = None
+    for day in days:
+        current = current + 1 if previous is not None and day - previous == timedelta(days=1) else 1
+        longest = max(longest, current)
+        previous = day
+    return current, longest, previous
+
+
+# -------------------- RECONCILER --------------------
+
+def _daily_totals(conn, user_id=None):
+    """{(user_id, study day, subject_id or 0): [minutes, sessions]} computed from study_sessions"""
+    totals = defaultdict(lambda: [0, 0])
+    for row in queries.study_session_rows(conn, user_id):
+        total = totals[(row['user_id'], study_day(row['created_at']), row['subject_id'] or 0)]
+        total[0] += row['duration_minutes']
+        total[1] += 1
+    return totals
+
+
+def _streak_rows(totals):
+    days = defaultdict(set)
+    for user_id, day, _ in totals:
+        days[user_id].add(day)
+    rows = []
+    for user_id in sorted(days):
+        current, longest, last = streaks_from_days(sorted(days[user_id]))
+        rows.append((user_id, current, longest, last.isoformat()))
+    return rows
+
+
+def reconcile(conn, user_id=None):
+    """Rebuild study_daily_totals and study_streaks from study_sessions; the caller commits"""
+    totals = _daily_totals(conn, user_id)
+    rollup = [(user, day.isoformat(), subject, minutes, count)
+              for (user, day, subject), (minutes, count) in sorted(totals.items())]
+    queries.replace_rows(conn, 'study_daily_totals', user_id, ROLLUP_COLUMNS, rollup)
+    queries.replace_rows(conn, 'study_streaks', user_id, STREAK_COLUMNS, _streak_rows(totals))
+    return len(rollup)
+
+
+def mismatches(conn, user_id=None):
+    """Descriptions of every rollup or streak row that disagrees with study_sessions"""
+    totals = _daily_totals(conn, user_id)
+    expected = {(user, day.isoformat(), subject): tuple(total) for (user, day, subject), total in totals.items()}
+    actual = {(row['user_id'], str(row['study_date']), row['subject_id']): (row['total_minutes'], row['session_count'])
+              for row in queries.study_rollup_rows(conn, user_id) if row['session_count']}
+    problems = [f"daily total for user {key[0]} on {key[1]}, subject {key[2]}: "
+                f"expected {expected.get(key)}, stored {actual.get(key)}"
+                for key in sorted(expected.keys() | actual.keys()) if expected.get(key) != actual.get(key)]
+
+    expected = {row[0]: row[1:] for row in _streak_rows(totals)}
+    actual = {row['user_id']: (row['current_streak'], row['longest_streak'], str(row['last_study_date']))
+              for row in queries.study_streak_rows(conn, user_id)}
+    problems += [f"streak for user {user}: expected {expected.get(user)}, stored {actual.get(user)}"
+                 for user in sorted(expected.keys() | actual.keys()) if expected.get(user) != actual.get(user)]
+    return problems
+
+
+if __name__ == '__main__':
+    import argparse
+    from db import connect
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser(description='Rebuild or check the study rollup and streaks')
+    parser.add_argument('command', choices=['reconcile', 'verify'])
+    parser.add_argument('--user', type=int, help='only this user id')
+    args = parser.parse_args()
+
+    conn = connect()
+    migrate(conn)
+    if args.command == 'reconcile':
+        rows = reconcile(conn, args.user)
+        conn.commit()
+        print(f"Rebuilt {rows} daily totals and the streaks they imply")
+    else:
+        problems = mismatches(conn, args.user)
+        for problem in problems[:20]:
+            print(f"MISMATCH {problem}")
+        if problems:
+            sys.exit(1)
+        print("Study totals and streaks match study_sessions")
+    conn.close()
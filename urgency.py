@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+# Urgency buckets for task due dates, shared by the dashboard's SQL sort and
+# the templates' CSS classes. Due dates are ISO strings, so against a fixed
+# "today" a bucket is a couple of string comparisons - no date parsing.
+
+# (rank, CSS class), most urgent first; a missing or later date gets the last one
+BUCKETS = [
+    (1, 'urgent-overdue'),
+    (2, 'urgent-today'),
+    (3, 'urgent-tomorrow'),
+    (4, ''),
+]
+CLASS_BY_RANK = dict(BUCKETS)
+
+
+def rank_sql(column):
+    """CASE expression ranking column like Urgency.rank; params are Urgency.sql_params()"""
+    return f'''CASE
+                       WHEN {column} < ? THEN 1
+                       WHEN {column} = ? THEN 2
+                       WHEN {column} = ? THEN 3
+                       ELSE 4
+                   END'''
+
+
+class Urgency:
+    """Buckets due dates against one "today" (create one per request)"""
+
+    def __init__(self, today):
+        self.today = today.isoformat()
+        self.tomorrow = (today + timedelta(days=1)).isoformat()
+
+    def sql_params(self):
+        return [self.today, self.today, self.tomorrow]
+
+    def rank(self, due_date):
+        if not due_date:
+            return 4
+        due_date = str(due_date)[:10]
+        if due_date < self.today:
+            return 1
+        if due_date == self.today:
+            return 2
+        if due_date == self.tomorrow:
+            return 3
+        return 4
+
+    def css_class(self, due_date):
+        return CLASS_BY_RANK[self.rank(due_date)]
+
+    def classify(self, tasks):
+        """Set urgency_class on every task in the batch; returns the tasks.
+
+        Rows from queries.list_task_page already carry the SQL urgency_rank.
+        """
+        for task in tasks:
+            rank = task.get('urgency_rank') or self.rank(task['due_date'])
+            task['urgency_class'] = CLASS_BY_RANK[rank]
+        return tasks